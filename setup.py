@@ -7,6 +7,7 @@ setup(
     author = 'Klaus Strauch',
     license = 'MIT',
     packages = ['untimed', 'untimed.propagator', 'untimed.theory'],
+    install_requires = ['numpy'],
     test_suite = 'untimed.tests',
     zip_safe = False,
     entry_points = {
@@ -4,16 +4,27 @@ from untimed.propagator.propagatorhandler import TheoryHandler, PROPAGATORS
 
 from untimed.propagator.propagatorhandler import add_theory
 
-from untimed.propagator.theoryconstraint_data import GlobalConfig, StatNames
+from untimed.propagator.theoryconstraint_data import GlobalConfig, StatNames, TimeHeatmap
+
+from untimed.propagator.selection import load_rules
+
+from untimed.propagator.profile import GroundProfile
 
 import untimed.util as util
 
+from untimed.portfolio import split_portfolio_args, run_portfolio
+
+from untimed.propagator.trace import Trace
+
+from untimed.solver import Solver
+
 import textwrap as _textwrap
 
 import logging
+import os
 import sys
 
-watch_types = PROPAGATORS.keys()
+watch_types = TheoryHandler.supported_types
 
 class Application:
 
@@ -25,6 +36,11 @@ class Application:
 		self.watch_type = "timed"
 		self.lock_ng = -1
 		self.use_ids = clingo.Flag(False)
+		self.heuristic = clingo.Flag(False)
+		self.partition = clingo.Flag(False)
+		self.dispatch = clingo.Flag(False)
+		self.suggest_grounding = clingo.Flag(False)
+		self.binary_engine = clingo.Flag(False)
 
 	def __on_stats(self, step, accu):
 		util.print_stats(step, accu)
@@ -62,6 +78,104 @@ class Application:
 		GlobalConfig.lock_from = time
 		return True
 
+	def __parse_ground_budget_clauses(self, n):
+		n = int(n)
+
+		if n < 0:
+			return False
+
+		GlobalConfig.ground_budget_clauses = n
+		return True
+
+	def __parse_ground_budget_mem(self, megabytes):
+		megabytes = float(megabytes)
+
+		if megabytes < 0:
+			return False
+
+		GlobalConfig.ground_budget_memory = int(megabytes * 1024 * 1024)
+		return True
+
+	def __parse_export_nogoods(self, path):
+		GlobalConfig.export_nogoods = path
+		return True
+
+	def __parse_import_nogoods(self, path):
+		if not os.path.isfile(path):
+			return False
+
+		GlobalConfig.import_nogoods = path
+		return True
+
+	def __parse_record_trace(self, path):
+		GlobalConfig.record_trace = path
+		return True
+
+	def __parse_latency_histogram(self, path):
+		GlobalConfig.latency_histogram = path
+		return True
+
+	def __parse_timeline(self, path):
+		GlobalConfig.timeline = path
+		util.Timeline.enable(util.Timeline.budget)
+		return True
+
+	def __parse_timeline_budget(self, n):
+		n = int(n)
+		if n < 2:
+			return False
+
+		util.Timeline.budget = n
+		return True
+
+	def __parse_heatmap(self, path):
+		GlobalConfig.heatmap = path
+		TimeHeatmap.enabled = True
+		return True
+
+	def __parse_ground_profile(self, path):
+		GlobalConfig.ground_profile = path
+		GroundProfile.load(path)
+		TimeHeatmap.enabled = True
+		return True
+
+	def __parse_ground_profile_rate(self, rate):
+		rate = float(rate)
+		if rate < 0 or rate > 1:
+			return False
+
+		GroundProfile.rate = rate
+		return True
+
+	def __parse_init_workers(self, n):
+		n = int(n)
+		if n < 0:
+			return False
+
+		GlobalConfig.init_workers = n
+		return True
+
+	def __parse_portfolio(self, types):
+		# the portfolio is started in main before clingo parses the options
+		# so here it is only validated
+		return all(t in watch_types for t in types.split(","))
+
+	def __parse_time_shards(self, n):
+		n = int(n)
+		if n < 1:
+			return False
+
+		GlobalConfig.time_shards = n
+		return True
+
+	def __parse_eager_shards(self, shards):
+		GlobalConfig.eager_shards = set(int(index) for index in shards.split(","))
+		return True
+
+	def __parse_auto_rules(self, path):
+		load_rules(path)
+		return True
+
 	def register_options(self, options):
 		"""
 		See clingo.clingo_main().
@@ -81,16 +195,105 @@ class Application:
 		options.add(group, "ground-from", _textwrap.dedent("""Add the nogoods max - <n> time point to the max timepoint [0]"""),
 		            self.__parse_ground_from)
 
+		options.add(group, "ground-budget-clauses", _textwrap.dedent("""Eagerly add at most <n> nogoods as clauses, the ones with the
+		        best static score first. The rest is propagated lazily"""),
+		            self.__parse_ground_budget_clauses)
+
+		options.add(group, "ground-budget-mem", _textwrap.dedent("""Eagerly add nogoods as clauses until their estimated size
+		        reaches <n> megabytes"""),
+		            self.__parse_ground_budget_mem)
+
+		options.add(group, "ground-profile", _textwrap.dedent("""Eagerly add the nogoods of the constraint ids and relative times that
+		        were often unit or conflicting in the latest runs recorded in <file>. The file is created or updated after the run.
+		        Nogoods that were added eagerly for 5 runs in a row are propagated again for one run to refresh their counts"""),
+		            self.__parse_ground_profile)
+
+		options.add(group, "ground-profile-rate", _textwrap.dedent("""Share of the propagate hits that have to be units or conflicts
+		        for the nogoods to be added eagerly [0.01]"""),
+		            self.__parse_ground_profile_rate)
+
+		options.add(group, "init-workers", _textwrap.dedent("""Form the nogoods of the constraints in <n> processes during init.
+		        Only used for instances with many constraints [0]"""),
+		            self.__parse_init_workers)
+
+		options.add(group, "export-nogoods", _textwrap.dedent("""Write the clauses of the ground watch type to <file>,
+		        keyed by symbolic atoms"""),
+		            self.__parse_export_nogoods)
+
+		options.add(group, "import-nogoods", _textwrap.dedent("""Add the clauses in <file> written by export-nogoods
+		        instead of handling the constraints"""),
+		            self.__parse_import_nogoods)
+
+		options.add(group, "record-trace", _textwrap.dedent("""Record every propagate, undo and check call into <file>.
+		        It can be replayed with python -m untimed.replay"""),
+		            self.__parse_record_trace)
+
+		options.add(group, "latency-histogram", _textwrap.dedent("""Write the latency histogram of every propagator callback
+		        to <file> as json"""),
+		            self.__parse_latency_histogram)
+
+		options.add(group, "timeline", _textwrap.dedent("""Write the spans of the timers and propagator callbacks to <file>
+		        in the Chrome trace event format"""),
+		            self.__parse_timeline)
+
+		options.add(group, "timeline-budget", _textwrap.dedent("""Sample the callbacks in the timeline so at most <n> are kept [100000]"""),
+		            self.__parse_timeline_budget)
+
+		options.add(group, "heatmap", _textwrap.dedent("""Count propagate hits, units and conflicts per assigned time and
+		        constraint id, print them as a table and write them to <file> as json"""),
+		            self.__parse_heatmap)
+
+		options.add(group, "auto-rules", _textwrap.dedent("""Json file with the rule table used by the auto watch type"""),
+		            self.__parse_auto_rules)
+
+		options.add(group, "portfolio", _textwrap.dedent("""Comma separated watch types. Solve with one process per watch type
+		        and report the first one that finishes"""),
+		            self.__parse_portfolio)
+
+		options.add(group, "time-shards", _textwrap.dedent("""Split the time window of every constraint into <n> shards,
+		        each handled by its own propagator [1]"""),
+		            self.__parse_time_shards)
+
+		options.add(group, "eager-shards", _textwrap.dedent("""Comma separated indices of time shards (starting at 0)
+		        whose nogoods are all added on initialization"""),
+		            self.__parse_eager_shards)
+
 		options.add_flag(group, "use-ids", _textwrap.dedent("""Create a propagator per constraint id"""),
 					self.use_ids)
 
+		options.add_flag(group, "partition", _textwrap.dedent("""Create a propagator per group of constraints connected by shared atoms.
+		        Takes precedence over use-ids"""),
+					self.partition)
+
+		options.add_flag(group, "dispatch", _textwrap.dedent("""Register a single propagator that dispatches to the propagators
+		        created by use-ids, partition or time-shards"""),
+					self.dispatch)
+
+		options.add_flag(group, "suggest-grounding", _textwrap.dedent("""Suggest ground-up-to and ground-from values that cover
+		        the assigned times with the most propagation work"""),
+					self.suggest_grounding)
+
+		options.add_flag(group, "tc-heuristic", _textwrap.dedent("""Decide on the literals with the highest conflict activity
+		        in the temporal constraints first, earlier time points break ties"""),
+					self.heuristic)
+
+		options.add_flag(group, "binary-engine", _textwrap.dedent("""Propagate the size 2 constraints by making the partner literals
+		        of a true literal false. Used by the timed, count, naive and 2watch watch types"""),
+					self.binary_engine)
+
 
 	def main(self, prg, files):
+		if self.suggest_grounding.flag:
+			TimeHeatmap.enabled = True
+
+		GlobalConfig.binary_engine = self.binary_engine.flag
+
 		with util.Timer(StatNames.UNTILSOLVE_TIMER_MSG.value):
 			for name in files:
 				prg.load(name)
 
-			self.__handler = TheoryHandler(self.watch_type, self.lock_ng, self.use_ids)
+			self.__handler = TheoryHandler(self.watch_type, self.lock_ng, self.use_ids, self.heuristic, self.partition,
+			                               self.dispatch)
 
 			add_theory(prg)
 
@@ -102,6 +305,38 @@ class Application:
 
 		prg.solve(on_statistics=self.__on_stats)
 
+		if GlobalConfig.record_trace is not None:
+			Trace.write(GlobalConfig.record_trace)
+
+		if GlobalConfig.latency_histogram is not None:
+			util.Histogram.write(GlobalConfig.latency_histogram)
+
+		if GlobalConfig.timeline is not None:
+			util.Timeline.write(GlobalConfig.timeline)
+
+		if GlobalConfig.ground_profile is not None:
+			GroundProfile.update()
+			GroundProfile.write(GlobalConfig.ground_profile)
+
+		if GlobalConfig.heatmap is not None or self.suggest_grounding.flag:
+			self.__print_heatmap()
+
+	def __print_heatmap(self):
+		for line in TimeHeatmap.table():
+			print(line)
+
+		if GlobalConfig.heatmap is not None:
+			TimeHeatmap.write(GlobalConfig.heatmap)
+
+		if self.suggest_grounding.flag:
+			up_to, ground_from = TimeHeatmap.suggest()
+			suggestion = []
+			if up_to is not None:
+				suggestion.append(f"--ground-up-to={up_to}")
+			if ground_from is not None:
+				suggestion.append(f"--ground-from={ground_from}")
+			print("Suggested grounding: " + (" ".join(suggestion) if suggestion else "none"))
+
 def setup_logger():
 	root_logger = logging.getLogger()
 	root_logger.setLevel(logging.INFO)
@@ -117,6 +352,15 @@ def setup_logger():
 
 def main():
 	setup_logger()
+
+	portfolio, args = split_portfolio_args(sys.argv[1:])
+	if portfolio is not None:
+		for watch_type in portfolio:
+			if watch_type not in watch_types:
+				print(f"Unknown watch type {watch_type} in portfolio")
+				sys.exit(1)
+		sys.exit(run_portfolio(portfolio, args))
+
 	sys.exit(int(clingo.clingo_main(Application(), sys.argv[1:])))
 
 
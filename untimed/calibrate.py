@@ -0,0 +1,34 @@
+import argparse
+import csv
+import json
+import sys
+
+from untimed.propagator.selection import calibrate_rules
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Build the rule table of the auto watch type from benchmark results. "
+												 "Every csv row needs the instance features that are logged for every watch type, "
+												 "the watch type that was used and the time it took.")
+	parser.add_argument("results", nargs="+", help="csv files with the columns watch_type, time and the instance features")
+	parser.add_argument("-o", "--output", help="write the rule table here instead of stdout")
+
+	args = parser.parse_args()
+
+	rows = []
+	for path in args.results:
+		with open(path, newline="") as result_file:
+			rows.extend(csv.DictReader(result_file))
+
+	table = calibrate_rules(rows)
+
+	if args.output is None:
+		json.dump(table, sys.stdout, indent=2)
+		print()
+	else:
+		with open(args.output, "w") as out:
+			json.dump(table, out, indent=2)
+
+
+if __name__ == "__main__":
+	main()
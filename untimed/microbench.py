@@ -0,0 +1,106 @@
+import argparse
+import random
+import time
+
+from typing import List
+
+import numpy as np
+
+from untimed.mock import MockProgram, MockSolver
+from untimed.propagator.propagatorhandler import TheoryHandler, PROPAGATORS
+from untimed.propagator.theoryconstraint_data import TimeAtomToSolverLit, Signatures
+
+# watch types that do all their work in init so there is nothing to replay
+INIT_ONLY = ["ground"]
+
+PROGRAM = """
+#const maxtime = {horizon}.
+time(0..maxtime).
+dom(1..{domain}).
+{{a(V,T)}} :- dom(V), time(T).
+{{b(V,T)}} :- dom(V), time(T).
+&constraint(1,maxtime){{+.a(V); +~b(V)}} :- dom(V).
+&constraint(1,maxtime){{+.a(V); -.b(V); +~a(V)}} :- dom(V).
+&constraint(1,maxtime){{-.a(V); +.b(V); -~b(V); +~a(V)}} :- dom(V).
+&signature{{++a(V); --a(V); ++b(V); --b(V)}} :- dom(V).
+"""
+
+
+def synthetic_program(horizon: int, domain: int) -> str:
+	"""
+	Program with constraints of size 2, 3 and 4 over two fluents
+	"""
+	return PROGRAM.format(horizon=horizon, domain=domain)
+
+
+def decision_sequence(program: MockProgram, amount: int, seed: int) -> List[int]:
+	"""
+	Random decisions over the non fact atoms of the program, the same seed gives the same sequence
+	"""
+	rng = random.Random(seed)
+	lits = [atom.literal for atom in program.symbolic_atoms if not atom.is_fact]
+	return [rng.choice(lits) * rng.choice([1, -1]) for _ in range(amount)]
+
+
+def bench(watch_type: str, programs: List[str], decisions: int, seed: int) -> MockSolver:
+	"""
+	Register the watch type on a mock program and replay a decision sequence into it
+	"""
+	TimeAtomToSolverLit.reset()
+	Signatures.reset()
+
+	program = MockProgram(programs)
+	TheoryHandler(watch_type).register(program)
+
+	solver = MockSolver(program)
+	for lit in decision_sequence(program, decisions, seed):
+		solver.decide(lit)
+	solver.check()
+
+	return solver
+
+
+def latency_row(name: str, latencies: List[int]) -> str:
+	if latencies == []:
+		return f"{name:10}  {0:>8}"
+
+	micro = np.array(latencies) / 1000
+	return f"{name:10}  {len(micro):>8}  {micro.mean():>10.1f}  {np.percentile(micro, 50):>10.1f}  " \
+		   f"{np.percentile(micro, 99):>10.1f}  {micro.max():>10.1f}"
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Replay random decisions into the propagators of every watch type "
+												 "without a solver and report the latency of every callback.")
+	parser.add_argument("files", nargs="*", help="programs to use instead of the synthetic one")
+	parser.add_argument("--watch-types", default=",".join(t for t in PROPAGATORS if t not in INIT_ONLY),
+						help="comma separated watch types")
+	parser.add_argument("--horizon", type=int, default=100, help="time horizon of the synthetic program")
+	parser.add_argument("--domain", type=int, default=10, help="amount of fluent instances of the synthetic program")
+	parser.add_argument("--decisions", type=int, default=2000, help="amount of random decisions")
+	parser.add_argument("--seed", type=int, default=0)
+
+	args = parser.parse_args()
+
+	if args.files:
+		programs = []
+		for path in args.files:
+			with open(path) as program_file:
+				programs.append(program_file.read())
+	else:
+		programs = [synthetic_program(args.horizon, args.domain)]
+
+	for watch_type in args.watch_types.split(","):
+		start = time.perf_counter()
+		solver = bench(watch_type, programs, args.decisions, args.seed)
+		total = time.perf_counter() - start
+
+		print(f"{watch_type}: {total:.3f}s conflicts {solver.conflicts}")
+		print(f"{'callback':10}  {'calls':>8}  {'mean us':>10}  {'p50 us':>10}  {'p99 us':>10}  {'max us':>10}")
+		for name in ["init", "propagate", "undo", "check"]:
+			print(latency_row(name, solver.latencies[name]))
+		print()
+
+
+if __name__ == "__main__":
+	main()
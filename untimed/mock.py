@@ -0,0 +1,411 @@
+import time
+
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple, Any
+
+import clingo
+
+
+class MockSymbolicAtom:
+
+	__slots__ = ["symbol", "literal", "is_fact"]
+
+	def __init__(self, symbol: clingo.Symbol, literal: int, is_fact: bool = False) -> None:
+		self.symbol = symbol
+		self.literal = literal
+		self.is_fact = is_fact
+
+
+class MockSymbolicAtoms:
+	"""
+	Symbolic atoms with lookup by symbol and by signature
+	"""
+
+	def __init__(self, atoms: List[MockSymbolicAtom]) -> None:
+		self.atoms = atoms
+		self.by_symbol: Dict[clingo.Symbol, MockSymbolicAtom] = {atom.symbol: atom for atom in atoms}
+		self.signatures: Dict[Tuple[str, int, bool], List[MockSymbolicAtom]] = {}
+		for atom in atoms:
+			sig = (atom.symbol.name, len(atom.symbol.arguments), atom.symbol.positive)
+			self.signatures.setdefault(sig, []).append(atom)
+
+	def by_signature(self, name: str, arity: int, positive: bool = True) -> List[MockSymbolicAtom]:
+		return self.signatures.get((name, arity, positive), [])
+
+	def __getitem__(self, symbol: clingo.Symbol) -> Optional[MockSymbolicAtom]:
+		return self.by_symbol.get(symbol)
+
+	def __iter__(self):
+		return iter(self.atoms)
+
+	def __len__(self) -> int:
+		return len(self.atoms)
+
+
+class MockAssignment:
+	"""
+	Assignment of the solver variables. Variable 1 is always true like in clasp.
+
+	Members:
+	values                  -- Truth value of every variable, None if unassigned
+
+	trail                   -- Assigned literals in order
+
+	levels                  -- Start of every decision level in the trail
+	"""
+
+	def __init__(self, size: int) -> None:
+		self.values: List[Optional[bool]] = [None] * (size + 1)
+		self.values[1] = True
+		self.trail: List[int] = [1]
+		self.levels: List[int] = []
+
+	def __len__(self) -> int:
+		return len(self.values) - 1
+
+	@property
+	def decision_level(self) -> int:
+		return len(self.levels)
+
+	def value(self, lit: int) -> Optional[bool]:
+		value = self.values[abs(lit)]
+		if value is None or lit > 0:
+			return value
+		return not value
+
+	def is_true(self, lit: int) -> bool:
+		return self.value(lit) is True
+
+	def is_false(self, lit: int) -> bool:
+		return self.value(lit) is False
+
+	def assign(self, lit: int) -> bool:
+		"""
+		Make the literal true
+		:return: False if the literal was already false
+		"""
+		value = self.value(lit)
+		if value is not None:
+			return value
+
+		self.values[abs(lit)] = lit > 0
+		self.trail.append(lit)
+		return True
+
+	def decide(self, lit: int) -> None:
+		self.levels.append(len(self.trail))
+		self.assign(lit)
+
+	def backtrack(self) -> List[int]:
+		"""
+		Undo the last decision level
+		:return: the literals that were unassigned
+		"""
+		start = self.levels.pop()
+		undone = self.trail[start:]
+		del self.trail[start:]
+		for lit in undone:
+			self.values[abs(lit)] = None
+
+		return undone
+
+	def sync(self, trail: List[int], level: int) -> Tuple[int, List[int]]:
+		"""
+		Change the assignment to the given trail, e.g. one that was recorded from clasp.
+		The positions of the decision levels are not known, only their amount.
+		:return: length of the part of the trail that was kept and the literals that were unassigned
+		"""
+		keep = 0
+		for old, new in zip(self.trail, trail):
+			if old != new:
+				break
+			keep += 1
+
+		undone = self.trail[keep:]
+		del self.trail[keep:]
+		for lit in undone:
+			self.values[abs(lit)] = None
+
+		largest = max([abs(lit) for lit in trail[keep:]] + [0])
+		if largest >= len(self.values):
+			# recorded trails also contain auxiliary variables of the solver
+			self.values.extend([None] * (largest + 1 - len(self.values)))
+
+		for lit in trail[keep:]:
+			self.assign(lit)
+
+		self.levels = [len(self.trail)] * level
+
+		return keep, undone
+
+
+class MockPropagateInit:
+	"""
+	Stand-in for clingo.PropagateInit. Solver literals are the mock literals of the symbolic atoms.
+	Clauses and nogoods are checked against the assignment when they are added like in MockPropagateControl,
+	the literals they imply are only assigned when propagate is called.
+
+	Members:
+	assignment              -- MockAssignment shared with the controls
+
+	watches                 -- Watched solver literals
+
+	clauses                 -- Clauses added during initialization, nogoods are stored as their clause
+
+	implied                 -- Literals implied by unit clauses that are not assigned yet
+
+	conflict                -- True once a violated clause was added
+	"""
+
+	def __init__(self, theory_atoms, symbolic_atoms: MockSymbolicAtoms, assignment: MockAssignment,
+				 number_of_threads: int = 1) -> None:
+		self.theory_atoms = theory_atoms
+		self.symbolic_atoms = symbolic_atoms
+		self.assignment = assignment
+		self.number_of_threads = number_of_threads
+		self.check_mode = clingo.PropagatorCheckMode.Total
+
+		self.watches = set()
+		self.clauses: List[List[int]] = []
+		self.implied: List[int] = []
+		self.conflict = False
+
+	def solver_literal(self, lit: int) -> int:
+		return lit
+
+	def add_watch(self, lit: int, thread_id: Optional[int] = None) -> None:
+		self.watches.add(lit)
+
+	def add_clause(self, clause: List[int]) -> bool:
+		self.clauses.append(list(clause))
+
+		open_lits = []
+		for lit in clause:
+			value = self.assignment.value(lit)
+			if value is True:
+				return True
+			if value is None:
+				open_lits.append(lit)
+
+		if open_lits == []:
+			self.conflict = True
+			return False
+
+		if len(open_lits) == 1:
+			self.implied.append(open_lits[0])
+
+		return True
+
+	def add_nogood(self, nogood: List[int], tag: bool = False, lock: bool = False) -> bool:
+		return self.add_clause([-lit for lit in nogood])
+
+	def propagate(self) -> bool:
+		while self.implied:
+			if not self.assignment.assign(self.implied.pop()):
+				self.conflict = True
+		return not self.conflict
+
+
+class MockPropagateControl:
+	"""
+	Stand-in for clingo.PropagateControl.
+	Nogoods are checked when they are added. A unit nogood queues the negation of its open literal
+	which is assigned by propagate, a violated nogood marks a conflict.
+
+	Members:
+	implied                 -- Literals implied by unit nogoods that are not assigned yet
+
+	conflict                -- True once a violated nogood was added
+
+	nogoods                 -- Amount of nogoods added
+	"""
+
+	def __init__(self, assignment: MockAssignment, watches, thread_id: int = 0) -> None:
+		self.assignment = assignment
+		self.watches = watches
+		self.thread_id = thread_id
+
+		self.implied: List[int] = []
+		self.conflict = False
+		self.nogoods = 0
+
+	def add_nogood(self, clause, tag: bool = False, lock: bool = False) -> bool:
+		self.nogoods += 1
+
+		open_lits = []
+		for lit in clause:
+			value = self.assignment.value(lit)
+			if value is False:
+				return True
+			if value is None:
+				open_lits.append(lit)
+
+		if open_lits == []:
+			self.conflict = True
+			return False
+
+		if len(open_lits) == 1:
+			self.implied.append(-open_lits[0])
+
+		return True
+
+	def propagate(self) -> bool:
+		while self.implied:
+			if not self.assignment.assign(self.implied.pop()):
+				self.conflict = True
+		return not self.conflict
+
+	def add_watch(self, lit: int) -> None:
+		self.watches.add(lit)
+
+	def remove_watch(self, lit: int) -> None:
+		self.watches.discard(lit)
+
+	def has_watch(self, lit: int) -> bool:
+		return lit in self.watches
+
+
+class MockProgram:
+	"""
+	Stand-in for the clingo.Control object given to TheoryHandler.register.
+	Theory atoms can not be built by hand so the program is still grounded by clingo,
+	everything after grounding (solver literals, watches, assignment, nogoods) is simulated.
+
+	Members:
+	control                 -- clingo Control that holds the theory atoms
+
+	symbolic_atoms          -- MockSymbolicAtoms of the program, facts get solver literal 1
+
+	size                    -- Amount of solver variables
+
+	propagators             -- Registered propagators
+	"""
+
+	def __init__(self, programs: List[str], literals: Optional[Dict[str, int]] = None) -> None:
+		"""
+		:param programs: program strings
+		:param literals: optional mapping from atom string to solver literal, e.g. the one of a recorded trace.
+						Atoms that are not in it get new literals
+		"""
+		from untimed.propagator.propagatorhandler import add_theory
+
+		self.control = clingo.Control(message_limit=0)
+		for program in programs:
+			self.control.add("base", [], program)
+		add_theory(self.control)
+		self.control.ground([("base", [])])
+
+		if literals is None:
+			literals = {}
+
+		atoms = []
+		next_lit = max([2] + [abs(lit) + 1 for lit in literals.values()])
+		for s_atom in self.control.symbolic_atoms:
+			if s_atom.is_fact:
+				atoms.append(MockSymbolicAtom(s_atom.symbol, 1, True))
+			elif str(s_atom.symbol) in literals:
+				atoms.append(MockSymbolicAtom(s_atom.symbol, literals[str(s_atom.symbol)]))
+			else:
+				atoms.append(MockSymbolicAtom(s_atom.symbol, next_lit))
+				next_lit += 1
+
+		self.symbolic_atoms = MockSymbolicAtoms(atoms)
+		self.size = next_lit - 1
+
+		self.propagators: List[Any] = []
+
+	@property
+	def theory_atoms(self):
+		return self.control.theory_atoms
+
+	def register_propagator(self, propagator) -> None:
+		self.propagators.append(propagator)
+
+
+class MockSolver:
+	"""
+	Drives the registered propagators of a MockProgram like the solver would and times every callback.
+	Decisions are made by the caller, after every decision the propagators are called with the changes
+	of their watches until nothing new is implied. On a conflict the decision is undone.
+	Clauses added during initialization are only propagated if the propagator calls propagate on the init object.
+
+	Members:
+	inits                   -- MockPropagateInit of every propagator
+
+	controls                -- MockPropagateControl of every propagator, they share one assignment
+
+	latencies               -- Mapping from a callback name to the nanoseconds every call took
+
+	conflicts               -- Amount of conflicts
+	"""
+
+	def __init__(self, program: MockProgram) -> None:
+		self.propagators = program.propagators
+		self.assignment = MockAssignment(program.size)
+
+		self.latencies: Dict[str, List[int]] = defaultdict(list)
+		self.conflicts = 0
+
+		self.inits = []
+		for propagator in self.propagators:
+			init = MockPropagateInit(program.theory_atoms, program.symbolic_atoms, self.assignment)
+			self.call("init", propagator.init, init)
+			self.inits.append(init)
+
+		self.controls = [MockPropagateControl(self.assignment, init.watches) for init in self.inits]
+
+	def call(self, name: str, func, *args) -> None:
+		start = time.perf_counter_ns()
+		func(*args)
+		self.latencies[name].append(time.perf_counter_ns() - start)
+
+	def decide(self, lit: int) -> bool:
+		"""
+		Make the literal true and propagate
+		:return: False if it lead to a conflict, the decision is undone in that case
+		"""
+		if self.assignment.value(lit) is not None:
+			return True
+
+		self.assignment.decide(lit)
+		pending = [lit]
+		while pending:
+			start = len(self.assignment.trail)
+			for propagator, control in zip(self.propagators, self.controls):
+				if not hasattr(propagator, "propagate"):
+					continue
+
+				changes = [change for change in pending if change in control.watches]
+				if changes:
+					self.call("propagate", propagator.propagate, control, changes)
+				if control.conflict:
+					self.backtrack()
+					return False
+
+			pending = self.assignment.trail[start:]
+
+		return True
+
+	def backtrack(self) -> None:
+		self.conflicts += 1
+		undone = self.assignment.backtrack()
+		for propagator, control in zip(self.propagators, self.controls):
+			control.conflict = False
+			control.implied = []
+			if hasattr(propagator, "undo"):
+				changes = [lit for lit in undone if lit in control.watches]
+				if changes:
+					self.call("undo", propagator.undo, control.thread_id, self.assignment, changes)
+
+	def check(self) -> bool:
+		"""
+		Call check of all propagators
+		:return: False if a check found a conflict
+		"""
+		for propagator, control in zip(self.propagators, self.controls):
+			if hasattr(propagator, "check"):
+				self.call("check", propagator.check, control)
+			if control.conflict:
+				return False
+
+		return True
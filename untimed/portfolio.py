@@ -0,0 +1,100 @@
+import logging
+import subprocess
+import sys
+import tempfile
+import time
+
+from typing import List
+
+# exit codes of clingo that mean the search finished with a result(SAT, UNSAT, SAT + search space exhausted)
+RESULT_CODES = (10, 20, 30)
+
+# seconds between two checks if a process of the portfolio stopped. Only the own processes are polled,
+# waiting for any child would also reap the children of the caller
+POLL_INTERVAL = 0.05
+
+
+def split_portfolio_args(args: List[str]):
+	"""
+	Remove the portfolio option and any watch type from the command line arguments.
+	Both the --option=value and the --option value forms are accepted
+	:param args: command line arguments without the program name
+	:return: list of watch types(None if there is no portfolio option) and the remaining arguments
+	"""
+	watch_types = None
+	rest = []
+	args = iter(args)
+	for arg in args:
+		if arg.startswith("--portfolio="):
+			watch_types = [w for w in arg.split("=", 1)[1].split(",") if w]
+		elif arg == "--portfolio":
+			watch_types = [w for w in next(args, "").split(",") if w]
+		elif arg.startswith("--watch-type="):
+			continue
+		elif arg == "--watch-type":
+			next(args, None)
+		else:
+			rest.append(arg)
+
+	return watch_types, rest
+
+
+def run_portfolio(watch_types: List[str], args: List[str]) -> int:
+	"""
+	Solve the same input with one process per watch type. The output of the first process that
+	finishes with a result is printed and all other processes are killed.
+	For optimization problems the first process to finish has proven the optimum, so it is also the best.
+
+	:param watch_types: watch types to run
+	:param args: command line arguments for every process, without the watch type
+	:return: exit code of the winning process, of the last process to stop if none has a result
+	"""
+	logger = logging.getLogger(__name__)
+
+	procs = {}
+	outputs = {}
+	for watch_type in watch_types:
+		outputs[watch_type] = tempfile.TemporaryFile(mode="w+")
+		cmd = [sys.executable, "-m", "untimed", f"--watch-type={watch_type}"] + args
+		proc = subprocess.Popen(cmd, stdout=outputs[watch_type], stderr=subprocess.STDOUT)
+		procs[proc.pid] = (watch_type, proc)
+
+	winner = None
+	last = None
+	code = 1
+	try:
+		while procs and winner is None:
+			stopped = [pid for pid, (_, proc) in procs.items() if proc.poll() is not None]
+			if stopped == []:
+				time.sleep(POLL_INTERVAL)
+				continue
+
+			for pid in stopped:
+				watch_type, proc = procs.pop(pid)
+				code = proc.returncode
+				last = watch_type
+				if code in RESULT_CODES:
+					winner = watch_type
+					break
+
+				logger.info(f"Portfolio configuration {watch_type} stopped without a result (exit code {code})")
+	finally:
+		for watch_type, proc in procs.values():
+			proc.kill()
+			proc.wait()
+
+	if winner is not None:
+		outputs[winner].seek(0)
+		sys.stdout.write(outputs[winner].read())
+		print(f"Portfolio winner     :   {winner}")
+	else:
+		# show why the last process stopped
+		if last is not None:
+			outputs[last].seek(0)
+			sys.stdout.write(outputs[last].read())
+		print("Portfolio winner     :   no result")
+
+	for output in outputs.values():
+		output.close()
+
+	return code
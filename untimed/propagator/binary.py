@@ -0,0 +1,100 @@
+from collections import defaultdict
+
+from typing import Dict, List, Optional, Set, Tuple
+
+import untimed.util as util
+
+from untimed.propagator.theoryconstraint_data import StatNames
+from untimed.propagator.theoryconstraint_data import record_conflict, record_unit
+from untimed.propagator.theoryconstraint_data import TimeHeatmap
+
+
+class BinaryImplications:
+	"""
+	Propagates the size 2 theory constraints of a propagator.
+	A nogood {lit, partner} only becomes unit or conflicting when lit is true, and then partner has to be false.
+	So instead of looking up the assigned times of a change and forming their nogoods, every solver literal
+	keeps the partners of all nogoods it is in. A change only walks over that list, the nogoods of all
+	partners that are not false yet are added and propagated together.
+
+	Members:
+	implications            -- Mapping from a solver literal to a list of (partner, theory constraint, assigned time)
+								triples. The constraint and assigned time are used for locking and the statistics
+	"""
+
+	__slots__ = ["implications"]
+
+	def __init__(self) -> None:
+		self.implications: Dict[int, List[Tuple[int, "TheoryConstraint", int]]] = defaultdict(list)
+
+	def add(self, tc, init) -> Set[int]:
+		"""
+		Add the nogoods of all assigned times of a size 2 theory constraint. Nogoods that are locked on build or
+		that became shorter because an atom is always true are added as clauses by build_watches_at
+
+		:return: the literals that have to be watched
+		"""
+		watches = set()
+		for lits, assigned_time in tc.build_watches_at(init):
+			watches.update(self.add_nogood(tc, assigned_time, lits))
+
+		return watches
+
+	def add_nogood(self, tc, assigned_time: int, lits: List[int]) -> List[int]:
+		"""
+		Add the nogood of one assigned time of a theory constraint, it has to have 2 literals
+
+		:return: the literals that have to be watched
+		"""
+		lit, partner = lits
+		if lit == -partner:
+			# can never be violated
+			return []
+
+		self.implications[lit].append((partner, tc, assigned_time))
+		self.implications[partner].append((lit, tc, assigned_time))
+		tc.binary_ats = util.set_bit(tc.binary_ats, assigned_time)
+
+		util.Count.add(StatNames.BINARY_COUNT_MSG.value)
+
+		return lits
+
+	def propagate(self, control, changes) -> Optional[int]:
+		"""
+		:param control: clingo PropagateControl object
+		:param changes: literals that became true
+		:return: None if propagation has to stop, 1 otherwise
+		"""
+		assignment = control.assignment
+		added = []
+		for lit in changes:
+			for partner, tc, assigned_time in self.implications.get(lit, ()):
+				if not util.is_bit_true(tc.binary_ats, assigned_time):
+					continue
+
+				TimeHeatmap.add(TimeHeatmap.HIT, assigned_time, tc.id)
+
+				if assignment.is_false(partner):
+					continue
+
+				ng = [lit, partner]
+				lock = tc.check_if_lock(assigned_time)
+				if lock:
+					tc.binary_ats = util.clear_bit(tc.binary_ats, assigned_time)
+				if not control.add_nogood(ng, lock=lock):
+					record_conflict(ng, assigned_time, tc.id)
+					return None
+
+				added.append((tc, assigned_time))
+
+		if added == []:
+			return 1
+
+		if not control.propagate():
+			util.Count.add(StatNames.CONF_COUNT_MSG.value)
+			return None
+
+		for tc, assigned_time in added:
+			record_unit(assigned_time, tc.id)
+
+		return 1
@@ -0,0 +1,112 @@
+import logging
+
+from typing import List
+
+import numpy as np
+
+import untimed.util as util
+
+from untimed.propagator.theoryconstraint_data import GlobalConfig
+from untimed.propagator.theoryconstraint_data import StatNames
+
+from untimed.propagator.theoryconstraint_base import nogood_matrix
+
+from untimed.propagator import selection
+
+
+class GroundBudget:
+	"""
+	Budget for eagerly grounded nogoods. The budget is shared by all propagators and is used up
+	in the order in which they are initialized. The limits are set in GlobalConfig, -1 means no limit.
+
+	The memory is an estimate of what the solver needs for the clauses: a fixed amount per clause plus
+	a fixed amount per literal.
+
+	Members:
+	clauses                 -- Amount of clauses added so far
+
+	memory                  -- Estimated bytes of the clauses added so far
+	"""
+
+	clause_bytes = 32
+	literal_bytes = 4
+
+	clauses = 0
+	memory = 0
+
+	@staticmethod
+	def active() -> bool:
+		return GlobalConfig.ground_budget_clauses >= 0 or GlobalConfig.ground_budget_memory >= 0
+
+	@staticmethod
+	def reset() -> None:
+		GroundBudget.clauses = 0
+		GroundBudget.memory = 0
+
+
+def nogood_scores(tcs) -> List:
+	"""
+	Score every nogood of the given theory constraints, lower scores are grounded first.
+	Short nogoods are cheap to add and propagate well in the solver. Nogoods whose literals appear in
+	many constraints get a lower score since those literals wake up many constraints in the propagator.
+	Missing atoms that are always true make a nogood shorter and nogoods with atoms that are always false
+	do not exist at all, so both are covered by the size of the matrix rows.
+	Assigned times that are already grounded by ground-up-to or ground-from are left out.
+
+	:return: list containing an (assigned times, sizes, scores) triple of arrays for every constraint
+	"""
+	fan_out = selection.count_fan_out([tc.t_atom_info for tc in tcs])
+
+	scores = []
+	for tc in tcs:
+		assigned_times, nogoods = nogood_matrix(tc.t_atom_info, tc.min_time, tc.max_time)
+
+		sizes = (nogoods != 1).sum(axis=1)
+		avg_fan_out = sum(fan_out[abs(info.untimed_lit)] for info in tc.t_atom_info) / tc.size
+
+		lazy = (assigned_times > GlobalConfig.lock_up_to) & (assigned_times < tc.last_time - GlobalConfig.lock_from)
+		scores.append((assigned_times[lazy], sizes[lazy], sizes[lazy] / (1 + avg_fan_out)))
+
+	return scores
+
+
+def assign_eager_ats(tcs) -> None:
+	"""
+	Mark the best scoring nogoods of the given theory constraints as eager until the budget runs out.
+	They are added as clauses when the watches are built, the rest is handled lazily by the propagator.
+	"""
+	tcs = [tc for tc in tcs if tc.size > 1]
+	if not GroundBudget.active() or tcs == []:
+		return
+
+	scores = nogood_scores(tcs)
+
+	owners = np.concatenate([np.full(len(ats), pos, dtype=np.int64) for pos, (ats, _, _) in enumerate(scores)])
+	assigned_times = np.concatenate([ats for ats, _, _ in scores])
+	sizes = np.concatenate([size for _, size, _ in scores])
+	order = np.argsort(np.concatenate([score for _, _, score in scores]), kind="stable")
+
+	clause_cost = np.ones(len(order), dtype=np.int64)
+	memory_cost = GroundBudget.clause_bytes + GroundBudget.literal_bytes * sizes[order]
+
+	# take the longest prefix of the ranking that fits in both budgets
+	taken = len(order)
+	if GlobalConfig.ground_budget_clauses >= 0:
+		left = GlobalConfig.ground_budget_clauses - GroundBudget.clauses
+		taken = min(taken, int(np.searchsorted(np.cumsum(clause_cost), left, side="right")))
+	if GlobalConfig.ground_budget_memory >= 0:
+		left = GlobalConfig.ground_budget_memory - GroundBudget.memory
+		taken = min(taken, int(np.searchsorted(np.cumsum(memory_cost), left, side="right")))
+
+	chosen = order[:taken]
+	for pos, assigned_time in zip(owners[chosen].tolist(), assigned_times[chosen].tolist()):
+		tcs[pos].eager_ats = util.set_bit(tcs[pos].eager_ats, assigned_time)
+
+	GroundBudget.clauses += taken
+	GroundBudget.memory += int(memory_cost[:taken].sum())
+
+	util.Count.add(StatNames.BUDGET_CLAUSES_MSG.value, taken)
+	util.Count.add(StatNames.BUDGET_MEMORY_MSG.value, int(memory_cost[:taken].sum()))
+
+	logging.getLogger(__name__).info(f"ground budget: {taken} of {len(order)} nogoods eager, "
+									 f"{GroundBudget.clauses} clauses and {GroundBudget.memory} bytes used in total")
@@ -0,0 +1,203 @@
+from collections import defaultdict
+from typing import Dict, List, Any
+
+import untimed.util as util
+
+from untimed.propagator.theoryconstraint_data import StatNames
+
+
+class WatchIndex:
+	"""
+	Merged watch index of all logical propagators of a dispatcher for one solver thread.
+	A solver literal is watched in clingo as long as at least one logical propagator watches it.
+
+	Members:
+	owners                  -- Mapping from a solver literal to the logical propagators watching it
+	"""
+
+	__slots__ = ["owners"]
+
+	def __init__(self) -> None:
+		self.owners: Dict[int, List[Any]] = defaultdict(list)
+
+	def add(self, lit: int, prop) -> bool:
+		"""
+		:return: True if the literal was not watched by any logical propagator before
+		"""
+		owners = self.owners[lit]
+		if prop in owners:
+			return False
+
+		owners.append(prop)
+		return len(owners) == 1
+
+	def remove(self, lit: int, prop) -> bool:
+		"""
+		:return: True if no logical propagator watches the literal anymore
+		"""
+		owners = self.owners[lit]
+		if prop not in owners:
+			return False
+
+		owners.remove(prop)
+		return owners == []
+
+
+class InitProxy:
+	"""
+	Stands in for the PropagateInit object while a logical propagator is initialized.
+	Watches are recorded in the watch indexes of the threads and only added to clingo once per thread.
+	"""
+
+	__slots__ = ["init", "indexes", "prop"]
+
+	def __init__(self, init, indexes: List[WatchIndex], prop) -> None:
+		self.init = init
+		self.indexes = indexes
+		self.prop = prop
+
+	def add_watch(self, lit: int, thread_id=None) -> None:
+		threads = range(len(self.indexes)) if thread_id is None else [thread_id]
+		new = [thread for thread in threads if self.indexes[thread].add(lit, self.prop)]
+		if thread_id is None and len(new) == len(self.indexes):
+			self.init.add_watch(lit)
+			return
+
+		for thread in new:
+			self.init.add_watch(lit, thread)
+
+	def __getattr__(self, name: str):
+		return getattr(self.init, name)
+
+
+class ControlProxy:
+	"""
+	Stands in for the PropagateControl object while a logical propagator propagates or checks.
+	Watches are changed in the watch index and only forwarded to clingo when the first
+	logical propagator starts or the last one stops watching a literal.
+
+	Members:
+	failed                  -- True once adding a nogood or propagating returned False
+	"""
+
+	__slots__ = ["control", "index", "prop", "failed"]
+
+	def __init__(self, control, index: WatchIndex) -> None:
+		self.control = control
+		self.index = index
+		self.prop = None
+		self.failed = False
+
+	@property
+	def assignment(self):
+		return self.control.assignment
+
+	@property
+	def thread_id(self) -> int:
+		return self.control.thread_id
+
+	def add_nogood(self, clause, tag=False, lock=False) -> bool:
+		if not self.control.add_nogood(clause, tag=tag, lock=lock):
+			self.failed = True
+			return False
+		return True
+
+	def propagate(self) -> bool:
+		if not self.control.propagate():
+			self.failed = True
+			return False
+		return True
+
+	def add_watch(self, lit: int) -> None:
+		if self.index.add(lit, self.prop):
+			self.control.add_watch(lit)
+
+	def remove_watch(self, lit: int) -> None:
+		if self.index.remove(lit, self.prop):
+			self.control.remove_watch(lit)
+
+	def has_watch(self, lit: int) -> bool:
+		return self.prop in self.index.owners.get(lit, ())
+
+	def __getattr__(self, name: str):
+		return getattr(self.control, name)
+
+
+class DispatchPropagator:
+	"""
+	Single propagator registered with clingo that routes every callback to many logical propagators,
+	e.g. one per constraint id. This saves a clasp to python crossing per logical propagator and callback.
+	Changes are routed through a merged watch index and every logical propagator keeps its own
+	timers and counts under its name.
+
+	Members:
+	propagators             -- The logical propagators
+
+	indexes                 -- WatchIndex of every solver thread, shared by all logical propagators.
+								Every thread changes the watches of its own solver only
+	"""
+
+	def __init__(self, propagators: List[Any]) -> None:
+		self.propagators = propagators
+		self.indexes: List[WatchIndex] = []
+
+	def init(self, init) -> None:
+		self.indexes = [WatchIndex() for _ in range(init.number_of_threads)]
+
+		# not timed here, the init of every logical propagator already adds to the init timer
+		for prop in self.propagators:
+			prop.init(InitProxy(init, self.indexes, prop))
+
+		util.Count.add(StatNames.DISPATCHED_MSG.value, len(self.propagators))
+
+	def route(self, thread_id: int, changes) -> Dict[Any, List[int]]:
+		"""
+		Split the changes of a thread by the logical propagators watching them, in order of the propagators
+		"""
+		routed: Dict[Any, List[int]] = {}
+		owners = self.indexes[thread_id].owners
+		for lit in changes:
+			for prop in owners.get(lit, ()):
+				if prop in routed:
+					routed[prop].append(lit)
+				else:
+					routed[prop] = [lit]
+
+		return routed
+
+	def propagate(self, control, changes) -> None:
+		proxy = ControlProxy(control, self.indexes[control.thread_id])
+		for prop, lits in self.route(control.thread_id, changes).items():
+			util.Count.add(f"Propagate calls {prop.name}")
+			proxy.prop = prop
+			prop.propagate(proxy, lits)
+			if proxy.failed:
+				return
+
+	def check(self, control) -> None:
+		proxy = ControlProxy(control, self.indexes[control.thread_id])
+		for prop in self.propagators:
+			proxy.prop = prop
+			prop.check(proxy)
+			if proxy.failed:
+				return
+
+
+class DispatchUndoPropagator(DispatchPropagator):
+	"""
+	Dispatcher for logical propagators that also implement undo
+	"""
+
+	def undo(self, thread_id, assignment, changes) -> None:
+		for prop, lits in self.route(thread_id, changes).items():
+			prop.undo(thread_id, assignment, lits)
+
+
+def dispatcher(propagators: List[Any]):
+	"""
+	Build the dispatcher for the given logical propagators.
+	undo is only registered with clingo if the logical propagators need it
+	"""
+	if hasattr(propagators[0], "undo"):
+		return DispatchUndoPropagator(propagators)
+	return DispatchPropagator(propagators)
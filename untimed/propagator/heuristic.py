@@ -0,0 +1,81 @@
+from typing import List
+
+import untimed.util as util
+
+from untimed.propagator.theoryconstraint_data import ConflictActivity
+from untimed.propagator.theoryconstraint_data import TimeAtomToSolverLit
+from untimed.propagator.theoryconstraint_data import Signatures
+from untimed.propagator.theoryconstraint_data import StatNames
+
+
+class TemporalHeuristic:
+	"""
+	Decision heuristic that uses the conflict activity of the temporal constraints.
+	It only implements decide and is registered next to the propagators.
+
+	On every decide_every-th decision the internal literals with the highest conflict activity are decided first,
+	ties are broken in favor of earlier time points so that the search moves along the time frontier.
+	The chosen literal is made false since that satisfies the nogoods it appears in.
+
+	Members:
+	order                   -- Candidate solver literals sorted by preference
+
+	conflicts_seen          -- Amount of conflicts when the order was last rebuilt
+
+	decisions               -- Amount of decisions seen so far
+	"""
+
+	# only every n-th decision is taken by this heuristic, the rest is left to the solver.
+	# Taking every decision overrides the solver's own activity and slows down the search a lot,
+	# with every 8th decision and a rebuild every 32 conflicts hanoimedium still needed about 15% more conflicts
+	decide_every = 16
+
+	# rebuild the order after this many new conflicts, a stable order lets the solver follow up on the decisions
+	rebuild_every = 256
+
+	# amount of candidates kept in the order
+	candidates = 256
+
+	def __init__(self) -> None:
+		self.order: List[int] = []
+		self.conflicts_seen = 0
+		self.decisions = 0
+
+	def init(self, init) -> None:
+		ConflictActivity.reset()
+
+	def rebuild_order(self) -> None:
+		"""
+		Sort the internal literals by activity and then time point and keep the solver literals of the best ones
+		"""
+		ranked = sorted(ConflictActivity.activity.items(),
+						key=lambda item: (-item[1], Signatures.convert_to_time(item[0])))
+
+		self.order = []
+		seen = set()
+		for internal_lit, _ in ranked:
+			lit = TimeAtomToSolverLit.grab_signed_lit(internal_lit)
+			if lit is None or lit == 1 or lit == -1 or lit in seen:
+				continue
+
+			seen.add(lit)
+			self.order.append(lit)
+			if len(self.order) == self.candidates:
+				break
+
+		self.conflicts_seen = ConflictActivity.conflicts
+
+	def decide(self, thread_id, assignment, fallback) -> int:
+		self.decisions += 1
+		if self.decisions % self.decide_every != 0:
+			return fallback
+
+		if ConflictActivity.conflicts - self.conflicts_seen >= self.rebuild_every:
+			self.rebuild_order()
+
+		for lit in self.order:
+			if assignment.value(lit) is None:
+				util.Count.add(StatNames.HEURISTIC_DECISIONS_MSG.value)
+				return -lit
+
+		return fallback
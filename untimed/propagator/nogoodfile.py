@@ -0,0 +1,160 @@
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+
+import logging
+
+import clingo
+
+import untimed.util as util
+
+from untimed.propagator.theoryconstraint_data import StatNames
+
+
+class NogoodExport:
+	"""
+	Clauses of the ground watch type that are written to GlobalConfig.export_nogoods.
+	Literals are stored by symbolic atom so the file does not depend on the solver literals of one run.
+
+	File format (numpy npz):
+	atoms                   -- string of every atom symbol used in the clauses
+	literals                -- literals of all clauses one after the other, atom i is i+1 and its negation -(i+1)
+	offsets                 -- start of every clause in literals, the last entry is the length of literals
+
+	Members:
+	clauses                 -- clauses collected so far, in solver literals
+
+	lit_to_atom             -- Mapping from a solver literal to the index of an atom with that literal
+
+	atoms                   -- atom symbols in order of their index
+
+	signatures              -- Signatures (name, arity) of the atoms that can appear in the clauses
+
+	grounders               -- Amount of grounders that did not add their clauses yet, the file is written by the last
+	"""
+
+	clauses: List[List[int]] = []
+	lit_to_atom: Dict[int, int] = {}
+	atoms: List[str] = []
+	signatures: Set[Tuple[str, int]] = set()
+	grounders: int = 0
+
+	@staticmethod
+	def reset(grounders: int = 1) -> None:
+		NogoodExport.clauses = []
+		NogoodExport.lit_to_atom = {}
+		NogoodExport.atoms = []
+		NogoodExport.signatures = set()
+		NogoodExport.grounders = grounders
+
+	@staticmethod
+	def add(init, clauses: List[List[int]]) -> None:
+		"""
+		Collect clauses and look up an atom for every solver literal in them
+		:param init: clingo PropagateInit object
+		:param clauses: clauses in solver literals
+		"""
+		NogoodExport.clauses.extend(clauses)
+
+		needed = set(abs(lit) for clause in clauses for lit in clause).difference(NogoodExport.lit_to_atom)
+		if not needed:
+			return
+
+		# only the atoms of the signatures are looked at, going through all symbolic atoms is slow
+		for sig in NogoodExport.signatures:
+			for s_atom in init.symbolic_atoms.by_signature(*sig):
+				lit = init.solver_literal(s_atom.literal)
+				if lit in needed:
+					needed.remove(lit)
+					NogoodExport.lit_to_atom[lit] = len(NogoodExport.atoms)
+					NogoodExport.atoms.append(str(s_atom.symbol))
+					if not needed:
+						return
+
+	@staticmethod
+	def finish(path: str) -> None:
+		"""
+		Called by every grounder after its clauses were added, the last one writes the file
+		"""
+		NogoodExport.grounders -= 1
+		if NogoodExport.grounders <= 0:
+			NogoodExport.write(path)
+
+	@staticmethod
+	def write(path: str) -> None:
+		"""
+		Write the collected clauses. Clauses with a literal that has no atom, e.g. an auxiliary literal
+		of the solver, can not be stored by symbol and are left out with a warning
+		"""
+		lit_to_atom = NogoodExport.lit_to_atom
+		clauses = [clause for clause in NogoodExport.clauses if all(abs(lit) in lit_to_atom for lit in clause)]
+
+		skipped = len(NogoodExport.clauses) - len(clauses)
+		if skipped > 0:
+			util.Count.add(StatNames.EXPORT_SKIPPED_MSG.value, skipped)
+			logging.getLogger(__name__).warning(f"{skipped} clauses have literals without an atom and are not exported, "
+												f"solving with the imported file can give more answers")
+
+		lengths = np.array([len(clause) for clause in clauses], dtype=np.int64)
+		offsets = np.concatenate([np.zeros(1, dtype=np.int64), np.cumsum(lengths)])
+
+		literals = np.array([(lit_to_atom[abs(lit)] + 1) * util.sign(lit)
+							for clause in clauses for lit in clause], dtype=np.int32)
+
+		with open(path, "wb") as nogood_file:
+			np.savez_compressed(nogood_file, atoms=np.array(NogoodExport.atoms, dtype=str),
+								literals=literals, offsets=offsets)
+
+		util.Count.add(StatNames.EXPORTED_MSG.value, len(clauses))
+
+
+def load_clauses(path: str, init) -> List[List[int]]:
+	"""
+	Read an exported nogood file and translate it to the solver literals of the current program.
+	Atoms that do not exist are false, so clauses with their negation are dropped and
+	the atom is removed from the other clauses.
+
+	:param path: file written by NogoodExport.write
+	:param init: clingo PropagateInit object
+	:return: clauses in solver literals
+	"""
+	with np.load(path) as data:
+		atoms = data["atoms"].tolist()
+		literals = data["literals"]
+		offsets = data["offsets"].tolist()
+
+	atom_lits = np.empty(len(atoms), dtype=np.int64)
+	for pos, atom in enumerate(atoms):
+		s_atom = init.symbolic_atoms[clingo.parse_term(atom)]
+		atom_lits[pos] = init.solver_literal(s_atom.literal) if s_atom is not None else -1
+
+	values = (atom_lits[np.abs(literals) - 1] * np.sign(literals)).tolist()
+
+	clauses = []
+	for start, end in zip(offsets, offsets[1:]):
+		clause = values[start:end]
+		if 1 in clause:
+			# clause is true
+			continue
+		clauses.append([lit for lit in clause if lit != -1])
+
+	return clauses
+
+
+class NogoodImporter:
+	"""
+	Propagator that only adds the clauses of an exported nogood file on initialization.
+	It replaces the constraint propagators so the theory constraints are not parsed at all.
+	"""
+
+	def __init__(self, path: str) -> None:
+		self.path = path
+
+	@util.Timer(StatNames.INIT_TIMER_MSG.value)
+	def init(self, init) -> None:
+		clauses = load_clauses(self.path, init)
+		for clause in clauses:
+			if not init.add_clause(clause):
+				break
+
+		util.Count.add(StatNames.IMPORTED_MSG.value, len(clauses))
@@ -0,0 +1,117 @@
+from collections import defaultdict
+from typing import Callable, Dict, List, Any
+
+from untimed.propagator.theoryconstraint_data import NOID
+
+
+def constraint_id(t_atom) -> str:
+	"""
+	The id of a constraint theory atom as written in the program, or NOID if it has none
+	"""
+	if len(t_atom.term.arguments) == 3:
+		return t_atom.term.arguments[-1].name
+
+	return NOID
+
+
+def untimed_atom_keys(t_atom) -> List[str]:
+	"""
+	Keys of the untimed atoms of a constraint theory atom. They ignore the sign and the time modifier
+	so that the same atom gets the same key in every constraint
+	"""
+	return [str(element.terms[0].arguments[0]) for element in t_atom.elements]
+
+
+class ConstraintPartition:
+	"""
+	Assigns every constraint theory atom to a group and hands out the atoms of a group to the propagators.
+	The theory atoms are scanned once, on the first request, and distributed to all groups.
+
+	Members:
+	key                     -- Function that maps a theory atom to its group
+
+	groups                  -- Mapping from a group to its theory atoms, None before the first request
+	"""
+
+	__slots__ = ["key", "groups"]
+
+	def __init__(self, key: Callable[[Any], Any]) -> None:
+		self.key = key
+		self.groups: Dict[Any, List] = None
+
+	def atoms(self, init, group) -> List:
+		"""
+		:param init: clingo PropagateInit object
+		:param group: the group of the propagator
+		:return: the constraint theory atoms of the group
+		"""
+		if self.groups is None:
+			self.groups = defaultdict(list)
+			for t_atom in init.theory_atoms:
+				if t_atom.term.name == "constraint":
+					self.groups[self.key(t_atom)].append(t_atom)
+
+		return self.groups.get(group, [])
+
+
+class LiteralComponents:
+	"""
+	Groups constraints into connected components. Two constraints are connected if they share an untimed atom.
+	Uses union find over the untimed atom keys.
+
+	Members:
+	parent                  -- Union find parent of every untimed atom key
+
+	component               -- Component id of every untimed atom key, filled by finish
+	"""
+
+	__slots__ = ["parent", "component"]
+
+	def __init__(self) -> None:
+		self.parent: Dict[str, str] = {}
+		self.component: Dict[str, str] = {}
+
+	def find(self, key: str) -> str:
+		root = key
+		while self.parent[root] != root:
+			root = self.parent[root]
+
+		# path compression
+		while self.parent[key] != root:
+			self.parent[key], key = root, self.parent[key]
+
+		return root
+
+	def add(self, t_atom) -> None:
+		"""
+		Add a constraint theory atom and connect all of its untimed atoms
+		"""
+		keys = untimed_atom_keys(t_atom)
+		for key in keys:
+			self.parent.setdefault(key, key)
+
+		first = self.find(keys[0])
+		for key in keys[1:]:
+			root = self.find(key)
+			if root != first:
+				self.parent[root] = first
+
+	def finish(self) -> List[str]:
+		"""
+		Give every component a short id
+		:return: list of component ids
+		"""
+		ids = {}
+		for key in self.parent:
+			root = self.find(key)
+			if root not in ids:
+				ids[root] = f"c{len(ids)}"
+			self.component[key] = ids[root]
+
+		return list(ids.values())
+
+	def key(self, t_atom) -> str:
+		"""
+		Component id of a constraint theory atom, can be used as key of a ConstraintPartition
+		"""
+		return self.component[untimed_atom_keys(t_atom)[0]]
@@ -0,0 +1,104 @@
+import logging
+import math
+import multiprocessing
+
+from typing import List, Optional, Tuple
+
+import untimed.util as util
+
+from untimed.propagator.theoryconstraint_data import TimeAtomToSolverLit
+from untimed.propagator.theoryconstraint_data import Signatures
+from untimed.propagator.theoryconstraint_data import GlobalConfig
+from untimed.propagator.theoryconstraint_data import StatNames
+from untimed.propagator.theoryconstraint_data import atom_info
+
+from untimed.propagator.theoryconstraint_base import nogood_lists
+
+# (untimed literal, time modifier, sign) of every atom, min time and max time of a constraint
+description = Tuple[Tuple[Tuple[int, int, int], ...], int, int]
+
+
+class NogoodPool:
+	"""
+	Forms the nogoods of all assigned times of many theory constraints in a pool of processes during init.
+	The workers get the array version of the TimeAtomToSolverLit mapping once and then chunks of constraint
+	descriptions that only contain integers. They send back the sorted nogoods without the literals that are
+	always true, so the main process only has to add the watches and clauses.
+
+	Members:
+	min_constraints         -- Below this amount of constraints the nogoods are formed in the main process
+								when the watches are built, starting the workers takes longer than that
+
+	chunks_per_worker       -- Amount of chunks every worker gets, more chunks balance the load better
+	"""
+
+	min_constraints = 1000
+	chunks_per_worker = 4
+
+	@staticmethod
+	def active(amount: int) -> bool:
+		return GlobalConfig.init_workers > 1 and amount >= NogoodPool.min_constraints
+
+
+def describe(t_atom_info, min_time: int, max_time: int) -> description:
+	return tuple((info.untimed_lit, info.time_mod, info.sign) for info in t_atom_info), min_time, max_time
+
+
+def install_mapping(pos_lits, neg_lits, fullsig_size: int) -> None:
+	"""
+	Initializer of the workers
+	"""
+	TimeAtomToSolverLit.pos_lits = pos_lits
+	TimeAtomToSolverLit.neg_lits = neg_lits
+	Signatures.fullsig_size = fullsig_size
+
+
+def form_chunk(descriptions: List[description]) -> List[Tuple[List[int], List[List[int]]]]:
+	return [nogood_lists([atom_info(sign=sign, time_mod=time_mod, untimed_lit=untimed_lit)
+						  for untimed_lit, time_mod, sign in infos], min_time, max_time)
+			for infos, min_time, max_time in descriptions]
+
+
+def form_nogoods(descriptions: List[description]) -> Optional[List[Tuple[List[int], List[List[int]]]]]:
+	"""
+	Form the nogoods of the given constraints in the pool
+
+	:return: for every constraint the assigned times that have a nogood and the nogoods,
+			None if the pool is not used for this amount of constraints
+	"""
+	if not NogoodPool.active(len(descriptions)):
+		return None
+
+	if TimeAtomToSolverLit.pos_lits is None:
+		TimeAtomToSolverLit.build_arrays()
+
+	workers = min(GlobalConfig.init_workers, len(descriptions))
+	size = math.ceil(len(descriptions) / (workers * NogoodPool.chunks_per_worker))
+	chunks = [descriptions[i:i + size] for i in range(0, len(descriptions), size)]
+
+	with util.Timer(StatNames.POOL_TIMER_MSG.value):
+		context = multiprocessing.get_context("spawn")
+		with context.Pool(workers, initializer=install_mapping,
+						  initargs=(TimeAtomToSolverLit.pos_lits, TimeAtomToSolverLit.neg_lits,
+									Signatures.fullsig_size)) as pool:
+			formed = [nogoods for chunk in pool.imap(form_chunk, chunks) for nogoods in chunk]
+
+	util.Count.add(StatNames.POOL_COUNT_MSG.value, len(descriptions))
+	logging.getLogger(__name__).info(f"formed the nogoods of {len(descriptions)} constraints with {workers} workers")
+
+	return formed
+
+
+def prepare_nogoods(tcs) -> None:
+	"""
+	Form the nogoods of the given theory constraints in the pool and hand them to the constraints,
+	build_watches_at uses them instead of forming them again
+	"""
+	tcs = [tc for tc in tcs if tc.size > 1]
+
+	formed = form_nogoods([describe(tc.t_atom_info, tc.min_time, tc.max_time) for tc in tcs])
+	if formed is None:
+		return
+
+	for tc, (assigned_times, nogoods) in zip(tcs, formed):
+		tc.prepared = dict(zip(assigned_times, nogoods))
@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+
+from typing import Dict, List
+
+import untimed.util as util
+
+from untimed.propagator.theoryconstraint_data import GlobalConfig
+from untimed.propagator.theoryconstraint_data import StatNames
+from untimed.propagator.theoryconstraint_data import TimeHeatmap
+
+
+class GroundProfile:
+	"""
+	Profile of earlier runs that decides which nogoods are grounded eagerly.
+	For every constraint id the assigned times up to the largest last time of the constraints with that id
+	are split into buckets of the same relative size, so a profile recorded with one horizon carries over
+	to instances of the same encoding with another horizon.
+	Every bucket holds the amount of hits, units and conflicts of the runs, see TimeHeatmap.
+	The counts of earlier runs are multiplied by decay whenever a run adds its counts, so the latest runs decide.
+	The nogoods of buckets where at least rate of the hits became a unit or a conflict are added as clauses
+	on build. Those buckets are not propagated and get no new counts, so after resample_every runs in a row
+	a bucket is propagated again for one run to check if it is still worth grounding.
+
+	File format (json):
+	runs                    -- Amount of runs in the profile
+
+	buckets                 -- Amount of buckets per constraint id
+
+	ids                     -- Mapping from a constraint id to the hits, units and conflicts lists of the buckets
+								and the eager list with the amount of runs in a row every bucket was grounded eagerly.
+								last_time is the largest last time of the id in the latest run
+
+	Members:
+	last_times              -- Largest last time of every constraint id in this run
+
+	hot                     -- The buckets of every constraint id that are grounded eagerly in this run
+	"""
+
+	buckets = 20
+	rate = 0.01
+	decay = 0.5
+	resample_every = 5
+
+	runs = 0
+	ids: Dict[str, Dict[str, List[float]]] = {}
+
+	last_times: Dict[str, int] = {}
+	hot: Dict[str, List[bool]] = {}
+
+	@staticmethod
+	def reset() -> None:
+		GroundProfile.runs = 0
+		GroundProfile.ids = {}
+		GroundProfile.last_times = {}
+		GroundProfile.hot = {}
+
+	@staticmethod
+	def load(path: str) -> None:
+		GroundProfile.reset()
+		if not os.path.isfile(path):
+			# the first run only records
+			return
+
+		with open(path) as profile_file:
+			profile = json.load(profile_file)
+
+		GroundProfile.runs = profile["runs"]
+		GroundProfile.buckets = profile["buckets"]
+		GroundProfile.ids = profile["ids"]
+		for counts in GroundProfile.ids.values():
+			# profiles written before buckets were sampled again
+			counts.setdefault("eager", [0] * GroundProfile.buckets)
+
+	@staticmethod
+	def bucket(assigned_time: int, last_time: int) -> int:
+		return min(GroundProfile.buckets - 1, max(0, assigned_time) * GroundProfile.buckets // (last_time + 1))
+
+	@staticmethod
+	def hot_buckets(id: str) -> List[bool]:
+		"""
+		:return: for every bucket of the constraint id if its nogoods are grounded eagerly
+		"""
+		if id not in GroundProfile.ids:
+			return [False] * GroundProfile.buckets
+
+		counts = GroundProfile.ids[id]
+		return [hits > 0 and (units + conflicts) / hits >= GroundProfile.rate and eager < GroundProfile.resample_every
+				for hits, units, conflicts, eager
+				in zip(counts["hits"], counts["units"], counts["conflicts"], counts["eager"])]
+
+	@staticmethod
+	def update() -> None:
+		"""
+		Add the counts of the TimeHeatmap of this run to the profile.
+		The counts of the buckets that were propagated in this run decay first, the buckets that were
+		grounded eagerly keep their counts and one more run in a row is noted for them
+		"""
+		for id in GroundProfile.last_times:
+			counts = GroundProfile.ids.setdefault(id, {kind: [0] * GroundProfile.buckets
+													   for kind in TimeHeatmap.KINDS + ["eager"]})
+			counts["last_time"] = GroundProfile.last_times[id]
+			hot = GroundProfile.hot.get(id, [False] * GroundProfile.buckets)
+			for bucket, eager in enumerate(hot):
+				if eager:
+					counts["eager"][bucket] += 1
+					continue
+
+				counts["eager"][bucket] = 0
+				for kind in TimeHeatmap.KINDS:
+					counts[kind][bucket] *= GroundProfile.decay
+
+		for id, by_time in TimeHeatmap.counts.items():
+			if id not in GroundProfile.last_times:
+				# counts of propagators that do not know the constraint ids
+				continue
+
+			counts = GroundProfile.ids[id]
+			for assigned_time, amounts in by_time.items():
+				bucket = GroundProfile.bucket(assigned_time, GroundProfile.last_times[id])
+				for kind, amount in zip(TimeHeatmap.KINDS, amounts):
+					counts[kind][bucket] += amount
+
+		GroundProfile.runs += 1
+
+	@staticmethod
+	def write(path: str) -> None:
+		with open(path, "w") as profile_file:
+			json.dump({"runs": GroundProfile.runs, "buckets": GroundProfile.buckets, "ids": GroundProfile.ids},
+					  profile_file)
+
+		logging.getLogger(__name__).info(f"wrote ground profile of {GroundProfile.runs} runs to {path}")
+
+
+def assign_profile_ats(tcs) -> None:
+	"""
+	Mark the nogoods of the hot buckets of the profile as eager and remember the last times of the constraint ids
+	so the counts of this run can be added to the profile. The assigned times are put into buckets with the
+	largest last time of their id, the same as in update
+	"""
+	if GlobalConfig.ground_profile is None:
+		return
+
+	tcs = [tc for tc in tcs if tc.size > 1]
+
+	for tc in tcs:
+		GroundProfile.last_times[tc.id] = max(GroundProfile.last_times.get(tc.id, 0), tc.last_time)
+
+	hot = {}
+	eager = 0
+	for tc in tcs:
+		if tc.id not in hot:
+			hot[tc.id] = GroundProfile.hot_buckets(tc.id)
+			GroundProfile.hot[tc.id] = hot[tc.id]
+
+		last_time = GroundProfile.last_times[tc.id]
+		for assigned_time in range(tc.min_time, tc.max_time + 1):
+			if hot[tc.id][GroundProfile.bucket(assigned_time, last_time)]:
+				tc.eager_ats = util.set_bit(tc.eager_ats, assigned_time)
+				eager += 1
+
+	util.Count.add(StatNames.PROFILE_EAGER_MSG.value, eager)
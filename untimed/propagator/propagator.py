@@ -1,12 +1,17 @@
+import logging
+
 from typing import Dict, List, Any, Set
 from collections import defaultdict
 
+import numpy as np
+
 import untimed.util as util
 from untimed.propagator.theoryconstraint_data import ConstraintCheck
 from untimed.propagator.theoryconstraint_data import TimeAtomToSolverLit
 from untimed.propagator.theoryconstraint_data import StatNames
 from untimed.propagator.theoryconstraint_data import GlobalConfig
 from untimed.propagator.theoryconstraint_data import NOID
+from untimed.propagator.theoryconstraint_data import record_conflict
 
 
 from untimed.propagator.theoryconstraint_base import TheoryConstraint
@@ -15,6 +20,9 @@ from untimed.propagator.theoryconstraint_base import init_TA2L_mapping_integers
 from untimed.propagator.theoryconstraint_base import Signatures
 from untimed.propagator.theoryconstraint_base import get_replacement_watch
 from untimed.propagator.theoryconstraint_base import parse_atoms, form_nogood
+from untimed.propagator.theoryconstraint_base import nogood_matrix, matrix_row_to_nogood, nogood_lists
+from untimed.propagator.theoryconstraint_base import assignment_values, conflicting_nogoods
+from untimed.propagator.theoryconstraint_base import NogoodTable
 
 from untimed.propagator.theoryconstraint_prop import MetaTAtomProp
 from untimed.propagator.theoryconstraint_prop import TAtomConseqs
@@ -30,6 +38,14 @@ from untimed.propagator.theoryconstraint_prop import TheoryConstraintMetaProp
 from untimed.propagator.theoryconstraint_prop import TheoryConstraintCountProp
 from untimed.propagator.theoryconstraint_prop import TheoryConstraint1watch
 
+from untimed.propagator import selection
+from untimed.propagator.budget import assign_eager_ats
+from untimed.propagator.profile import assign_profile_ats
+from untimed.propagator.pool import prepare_nogoods, form_nogoods, describe
+from untimed.propagator.nogoodfile import NogoodExport
+from untimed.propagator.binary import BinaryImplications
+from untimed.propagator.simplify import Simplifier
+
 class Propagator:
 	"""
 	Propagator for theory constraints
@@ -40,20 +56,62 @@ class Propagator:
 	theory_constraints          -- List of all theory constraints
 
 	lock_ng                     -- Tells the theory constraints when to lock nogoods
+
+	check_table                 -- Nogoods of all theory constraints used by check, built on the first check
+
+	shard                       -- None or a (index, count) pair. If given, only the assigned times
+									of that time shard of every constraint are handled
+
+	partition                   -- None or a ConstraintPartition that hands out the theory atoms of the group self.id
+
+	prepares_nogoods            -- If the nogoods of all assigned times are formed in the NogoodPool before the watches
+									are built. Propagators that only ground some assigned times on build do not need them
+
+	binary                      -- BinaryImplications that propagate the size 2 constraints or None if they are
+									handled like the other constraints
+
+	supports_binary             -- If the propagate function of this propagator passes the changes to binary
 	"""
 
-	__slots__ = ["watch_to_tc", "theory_constraints", "lock_ng", "watches", "id"]
+	__slots__ = ["watch_to_tc", "theory_constraints", "lock_ng", "watches", "id", "check_table", "shard", "partition",
+				 "binary"]
+
+	prepares_nogoods = True
 
-	def __init__(self, id, lock_ng=-1):
+	supports_binary = False
+
+	def __init__(self, id, lock_ng=-1, shard=None, partition=None):
 
 		self.id = id
 
+		self.shard = shard
+
+		self.partition = partition
+
 		self.watch_to_tc: Dict[Any, Set["TheoryConstraint"]] = defaultdict(set)
 
 		self.theory_constraints: List["TheoryConstraint"] = []
 
 		self.lock_ng = lock_ng
 
+		self.check_table = None
+
+		self.binary = BinaryImplications() if GlobalConfig.binary_engine and self.supports_binary else None
+
+	@property
+	def name(self) -> str:
+		if self.shard is None:
+			return str(self.id)
+		return f"{self.id}-shard{self.shard[0]}"
+
+	def apply_shard(self, tc):
+		"""
+		Restrict the theory constraint to the time shard of this propagator
+		"""
+		if self.shard is not None:
+			index, count = self.shard
+			tc.restrict_to_shard(index, count, eager=index in GlobalConfig.eager_shards)
+
 	def add_tc(self, tc):
 		self.theory_constraints.append(tc)
 
@@ -69,26 +127,44 @@ class Propagator:
 		for lit in watches:
 			self.watch_to_tc[lit].add(tc)
 
+	@util.Scope("init")
 	@util.Timer(StatNames.INIT_TIMER_MSG.value)
 	def init(self, init):
 		#print("Starting Initialization of propagator...")
 		self.watches = set()
 		init_TA2L_mapping_integers(init)
 
-		for t_atom in init.theory_atoms:
-			if t_atom.term.name == "constraint":
-				if self.id is not None:
-					if len(t_atom.term.arguments) == 2 and self.id != NOID:
-						continue
-					elif t_atom.term.arguments[-1].name != self.id:
-						continue
-				tc = self.make_tc(t_atom)
-				if tc.size == 1:
-					tc.init(init)
-				else:
-					self.build_watches(tc, init)
+		tcs = []
+		for t_atom in self.constraint_atoms(init):
+			tc = self.make_tc(t_atom)
+			self.apply_shard(tc)
+			tcs.append(tc)
+
+		assign_eager_ats(tcs)
+		assign_profile_ats(tcs)
+
+		simplifier = None
+		if self.prepares_nogoods:
+			prepare_nogoods(tcs)
+			simplifier = Simplifier(self.binary)
+
+		for tc in tcs:
+			if simplifier is not None:
+				self.watches.update(simplifier.simplify(tc))
+
+			if tc.size == 1:
+				tc.init(init)
+			elif tc.size == 2 and self.binary is not None:
+				self.watches.update(self.binary.add(tc, init))
 
-					self.add_tc(tc)
+				self.add_tc(tc)
+			else:
+				self.build_watches(tc, init)
+
+				self.add_tc(tc)
+
+		if simplifier is not None:
+			simplifier.report()
 
 		for lit in self.watches:
 			init.add_watch(lit)
@@ -96,24 +172,58 @@ class Propagator:
 		self.watches = None
 		del self.watches
 
-		util.Count.add(f"Untimed watches {self.id}", len(self.watch_to_tc.keys()))
+		self.count_watches(len(self.watch_to_tc.keys()))
 
 	def build_watches(self, tc, init):
 		for lits in tc.build_watches(init):
 			self.watches.update(lits)
 			self.add_atom_observer(tc, lits)
 
+	def count_watches(self, watches: int) -> None:
+		"""
+		Count the watches in the statistics tree of this propagator and under its name in the flat statistics
+		"""
+		util.Count.add(StatNames.WATCHES_COUNT_MSG.value, watches)
+		util.Count.counts[f"{StatNames.WATCHES_COUNT_MSG.value} {self.name}"] += watches
+
+	def constraint_atoms(self, init):
+		"""
+		Yield the constraint theory atoms that are handled by this propagator
+		:param init: clingo PropagateInit object
+		"""
+		if self.partition is not None:
+			yield from self.partition.atoms(init, self.id)
+			return
+
+		for t_atom in init.theory_atoms:
+			if t_atom.term.name == "constraint":
+				if self.id is not None:
+					if len(t_atom.term.arguments) == 2 and self.id != NOID:
+						continue
+					elif t_atom.term.arguments[-1].name != self.id:
+						continue
+				yield t_atom
+
+	@util.Scope("propagate")
 	@util.Count(StatNames.PROP_CALLS_MSG.value)
 	def propagate(self, control, changes):
 		...
 
 	# if we want to check we need the theory constraints list. look in the init to see if we delete it or not
+	@util.Scope("check")
 	@util.Count(StatNames.CHECK_CALLS_MSG.value)
 	@util.Timer(StatNames.CHECK_TIMER_MSG.value)
 	def check(self, control):
-		for tc in self.theory_constraints:
-			if tc.check(control) is None:
+		if self.check_table is None:
+			self.check_table = NogoodTable(self.theory_constraints)
+
+		# the assignment is read once and all nogoods are checked against it
+		values = assignment_values(control.assignment, self.check_table.variables)
+		for tc, assigned_time, ng in self.check_table.conflicts(values):
+			lock = tc.check_if_lock(assigned_time)
+			if not control.add_nogood(ng, lock=lock) or not control.propagate():
 				# check failed because there was a conflict
+				record_conflict(ng, assigned_time, tc.id)
 				return
 
 	def make_tc(self, t_atom):
@@ -126,6 +236,8 @@ class TimedAtomPropagator(Propagator):
 	"""
 	__slots__ = []
 
+	supports_binary = True
+
 	def add_atom_observer(self, tc):
 		"""
 		Add the tc to the list of tcs to be notified when their respective atoms are propagated
@@ -143,9 +255,13 @@ class TimedAtomPropagator(Propagator):
 			self.watches.update(lits)
 		self.add_atom_observer(tc)
 
+	@util.Scope("propagate")
 	@util.Count(StatNames.PROP_CALLS_MSG.value)
 	def propagate(self, control, changes):
-		with util.Timer("Propagation-{}".format(str(self.id))):
+		with util.Timer("Propagation-{}".format(self.name)):
+			if self.binary is not None and self.binary.propagate(control, changes) is None:
+				return
+
 			for lit in changes:
 				for internal_lit in TimeAtomToSolverLit.grab_id(lit):
 					for tc in self.watch_to_tc[Signatures.convert_to_untimed_lit(internal_lit)]:
@@ -171,6 +287,8 @@ class TimedAtomPropagatorCheck(Propagator):
 	"""
 	__slots__ = []
 
+	prepares_nogoods = False
+
 	def add_atom_observer(self, tc, watches):
 		"""
 		Add the tc to the list of tcs to be notified when their respective atoms are propagated
@@ -205,6 +323,11 @@ class TimedAtomAllWatchesPropagator(TimedAtomPropagator):
 	"""
 	__slots__ = []
 
+	prepares_nogoods = False
+
+	supports_binary = False
+
+	@util.Scope("init")
 	@util.Timer(StatNames.INIT_TIMER_MSG.value)
 	def init(self, init):
 		super().init(init)
@@ -227,6 +350,7 @@ class TimedAtomAllWatchesPropagator(TimedAtomPropagator):
 
 class CountPropagator(TimedAtomPropagator):
 
+	@util.Scope("undo")
 	@util.Count(StatNames.UNDO_CALLS_MSG.value)
 	@util.Timer(StatNames.UNDO_TIMER_MSG.value)
 	def undo(self, thread_id, assignment, changes):
@@ -267,9 +391,10 @@ class MetaPropagator(Propagator):
 			self.watches.update(lits)
 		self.add_atom_observer(tc, tc.build_prop_function())
 
+	@util.Scope("propagate")
 	@util.Count(StatNames.PROP_CALLS_MSG.value)
 	def propagate(self, control, changes):
-		with util.Timer("Propagation-{}".format(str(self.id))):
+		with util.Timer("Propagation-{}".format(self.name)):
 			for lit in changes:
 				for internal_lit in TimeAtomToSolverLit.grab_id(lit):
 					for prop_func in self.watch_to_tc[Signatures.convert_to_untimed_lit(internal_lit)]:
@@ -290,6 +415,8 @@ class MetaPropagator(Propagator):
 
 class MetaTAtomPropagator(TimedAtomPropagator):
 
+	supports_binary = False
+
 	def add_atom_observer(self, tc):
 		"""
 		Add the tc to the list of tcs to be notified when their respective atoms are propagated
@@ -302,6 +429,7 @@ class MetaTAtomPropagator(TimedAtomPropagator):
 
 			self.watch_to_tc[info.untimed_lit].build_prop_function(tc.t_atom_info, info.time_mod, tc.min_time, tc.max_time)
 
+	@util.Scope("init")
 	@util.Timer(StatNames.INIT_TIMER_MSG.value)
 	def init(self, init):
 		super().init(init)
@@ -309,9 +437,10 @@ class MetaTAtomPropagator(TimedAtomPropagator):
 		for t_atom, meta_tc in self.watch_to_tc.items():
 			meta_tc.finish_prop_func()
 
+	@util.Scope("propagate")
 	@util.Count(StatNames.PROP_CALLS_MSG.value)
 	def propagate(self, control, changes):
-		with util.Timer("Propagation-{}".format(str(self.id))):
+		with util.Timer("Propagation-{}".format(self.name)):
 			for lit in changes:
 				for internal_lit in TimeAtomToSolverLit.grab_id(lit):
 					# have to check if untimed lit is in the mapping because it is possible that the
@@ -337,6 +466,22 @@ class MetaTAtomPropagator(TimedAtomPropagator):
 
 
 class ConseqsPropagator(TimedAtomPropagator):
+	"""
+	Propagator that maps every untimed literal to its consequences(TAtomConseqs)
+
+	Members:
+	check_nogoods               -- (assigned times, nogoods) pairs of all consequences grouped by size, used in check
+
+	check_variables             -- Variables that appear in check_nogoods
+	"""
+
+	supports_binary = False
+
+	def __init__(self, id, lock_ng=-1, shard=None, partition=None):
+		super().__init__(id, lock_ng=lock_ng, shard=shard, partition=partition)
+
+		self.check_nogoods = None
+		self.check_variables = None
 
 	def add_atom_observer(self, tc):
 		"""
@@ -350,9 +495,10 @@ class ConseqsPropagator(TimedAtomPropagator):
 
 			self.watch_to_tc[info.untimed_lit].build_conseqs(tc.t_atom_info, tc.min_time, tc.max_time)
 
+	@util.Scope("propagate")
 	@util.Count(StatNames.PROP_CALLS_MSG.value)
 	def propagate(self, control, changes):
-		with util.Timer("Propagation-{}".format(str(self.id))):
+		with util.Timer("Propagation-{}".format(self.name)):
 			for lit in changes:
 				for internal_lit in TimeAtomToSolverLit.grab_id(lit):
 					# Check meta_ta to see the reason we check if untimed lit is in the mapping
@@ -372,15 +518,38 @@ class ConseqsPropagator(TimedAtomPropagator):
 			util.Count.add(StatNames.SIZE2_COUNT_MSG.value)
 			return TheoryConstraint(t_atom, self.lock_ng)
 		else:
-			raise Exception("Conseqs propagator can not handle constraints of size > 2")
+			util.Count.add(StatNames.SIZEN_COUNT_MSG.value)
+			return TheoryConstraint(t_atom, self.lock_ng)
 
+	@util.Scope("check")
 	@util.Count(StatNames.CHECK_CALLS_MSG.value)
 	@util.Timer(StatNames.CHECK_TIMER_MSG.value)
 	def check(self, control):
-		for temporal_atom, ta in self.watch_to_tc.items():
-			if ta.check(control) is None:
-				# check failed because there was a conflict
-				return
+		if self.check_nogoods is None:
+			self.build_check_nogoods()
+
+		values = assignment_values(control.assignment, self.check_variables)
+		for assigned_times, nogoods in self.check_nogoods:
+			for assigned_time, ng in zip(*conflicting_nogoods(assigned_times, nogoods, values)):
+				if not control.add_nogood(ng, lock=self.lock_ng >= 0) or not control.propagate():
+					# check failed because there was a conflict
+					record_conflict(ng, assigned_time)
+					return
+
+	def build_check_nogoods(self):
+		"""
+		Merge the nogood arrays of all consequences into one array per nogood size.
+		Every nogood appears once for each of its atoms so duplicates are removed,
+		the assigned time is kept in the last column while they are merged
+		"""
+		by_size = defaultdict(list)
+		for ta in self.watch_to_tc.values():
+			for assigned_times, nogoods in ta.build_nogood_arrays():
+				by_size[nogoods.shape[1]].append(np.column_stack((np.sort(nogoods, axis=1), assigned_times)))
+
+		merged = [np.unique(np.concatenate(arrays), axis=0) for arrays in by_size.values()]
+		self.check_nogoods = [(rows[:, -1], rows[:, :-1]) for rows in merged]
+		self.check_variables = np.unique(np.abs(np.concatenate([nogoods.ravel() for _, nogoods in self.check_nogoods] + [np.zeros(0, dtype=np.int64)])))
 
 class RegularAtomPropagatorNaive(Propagator):
 	"""
@@ -389,9 +558,15 @@ class RegularAtomPropagatorNaive(Propagator):
 
 	__slots__ = []
 
+	supports_binary = True
+
+	@util.Scope("propagate")
 	@util.Count(StatNames.PROP_CALLS_MSG.value)
 	def propagate(self, control, changes):
-		with util.Timer("Propagation-{}".format(str(self.id))):
+		with util.Timer("Propagation-{}".format(self.name)):
+			if self.binary is not None and self.binary.propagate(control, changes) is None:
+				return
+
 			for lit in changes:
 				for tc in self.watch_to_tc[lit]:
 					if tc.propagate(control, lit) is None:
@@ -420,8 +595,10 @@ class RegularAtomPropagator2watch(Propagator):
 	"""
 	__slots__ = []
 
-	def __init__(self, id, lock_ng=-1):
-		super().__init__(id, lock_ng=lock_ng)
+	supports_binary = True
+
+	def __init__(self, id, lock_ng=-1, shard=None, partition=None):
+		super().__init__(id, lock_ng=lock_ng, shard=shard, partition=partition)
 
 		self.watch_to_tc = defaultdict(list)
 
@@ -437,10 +614,14 @@ class RegularAtomPropagator2watch(Propagator):
 		for lit in watches:
 			self.watch_to_tc[lit].append(tc)
 
+	@util.Scope("propagate")
 	@util.Count(StatNames.PROP_CALLS_MSG.value)
 	# @profile
 	def propagate(self, control, changes):
-		with util.Timer("Propagation-{}".format(str(self.id))):
+		with util.Timer("Propagation-{}".format(self.name)):
+			if self.binary is not None and self.binary.propagate(control, changes) is None:
+				return
+
 			for lit in changes:
 				for tc in set(self.watch_to_tc[lit]):
 					result = tc.propagate(control, lit)
@@ -482,10 +663,11 @@ class Propagator1watch(Propagator):
 	"""
 	__slots__ = []
 
+	@util.Scope("propagate")
 	@util.Count(StatNames.PROP_CALLS_MSG.value)
 	# @profile
 	def propagate(self, control, changes):
-		with util.Timer("Propagation-{}".format(str(self.id))):
+		with util.Timer("Propagation-{}".format(self.name)):
 			for lit in changes:
 				for tc in set(self.watch_to_tc[lit]):
 					result = tc.propagate(control, lit)
@@ -544,9 +726,10 @@ class RegularAtomPropagator2watchMap(Propagator):
 			self.add_atom_observer(tc, lits, at)
 			self.watches.update(all_lits)
 
+	@util.Scope("propagate")
 	@util.Count(StatNames.PROP_CALLS_MSG.value)
 	def propagate(self, control, changes):
-		with util.Timer("Propagation-{}".format(str(self.id))):
+		with util.Timer("Propagation-{}".format(self.name)):
 			for lit in changes:
 				for tc, at in set(self.watch_to_tc[lit]):
 					res = tc.propagate(control, (lit, at))
@@ -582,31 +765,186 @@ class RegularAtomPropagator2watchMap(Propagator):
 			return TheoryConstraint2watchPropMap(t_atom, self.lock_ng)
 
 
-class GrounderPropagator:
+class HybridPropagator(Propagator):
+	"""
+	Propagator that chooses the watch strategy for every constraint on its own.
+	Constraints with timed watches are notified through their untimed literals while
+	constraints with 2 watches are notified through the solver literals they currently watch.
 
-	def __init__(self, id, lock_ng=-1):
-		GlobalConfig.lock_up_to = 100000000
+	Members:
+	watch_to_tc                 -- Mapping from a solver literal to the 2watch theory constraints watching it
+
+	timed_watch_to_tc           -- Mapping from an untimed literal to the timed theory constraints
+
+	static_watches              -- Solver literals watched by timed constraints, these are never removed
+
+	strategies                  -- Amount of constraints assigned to every strategy
+	"""
+
+	__slots__ = ["timed_watch_to_tc", "static_watches", "strategies"]
+
+	def __init__(self, id, lock_ng=-1, shard=None, partition=None):
+		super().__init__(id, lock_ng=lock_ng, shard=shard, partition=partition)
+
+		self.watch_to_tc = defaultdict(list)
+		self.timed_watch_to_tc: Dict[int, Set["TheoryConstraint"]] = defaultdict(set)
+		self.static_watches: Set[int] = set()
+
+		self.strategies: Dict[str, int] = defaultdict(int)
 
+	@util.Scope("init")
 	@util.Timer(StatNames.INIT_TIMER_MSG.value)
 	def init(self, init):
+		self.watches = set()
 		init_TA2L_mapping_integers(init)
 
-		for t_atom in init.theory_atoms:
-			if t_atom.term.name == "constraint":
-				self.build_constraints(init, t_atom)
+		t_atoms = list(self.constraint_atoms(init))
+		parsed = [parse_atoms(t_atom) for t_atom in t_atoms]
+		fan_out = selection.count_fan_out([t_atom_info for t_atom_info, _, _ in parsed])
 
-		TimeAtomToSolverLit.reset()
+		tcs = []
+		for t_atom, (t_atom_info, min_time, max_time) in zip(t_atoms, parsed):
+			features = selection.constraint_features(t_atom_info, min_time, max_time, fan_out)
+			strategy = selection.choose_strategy(features)
+
+			tc = self.make_tc(t_atom, strategy)
+			self.apply_shard(tc)
+			tcs.append((tc, strategy))
 
-	def build_constraints(self, init, t_atom) -> List[int]:
-		t_atom_info, min_time, max_time = parse_atoms(t_atom)
+		assign_eager_ats([tc for tc, _ in tcs])
+		assign_profile_ats([tc for tc, _ in tcs])
+		prepare_nogoods([tc for tc, _ in tcs])
+		simplifier = Simplifier()
 
-		for assigned_time in range(min_time, max_time + 1):
-			lits = form_nogood(t_atom_info, assigned_time)
-			if lits is None:
+		for tc, strategy in tcs:
+			if tc.size == 1:
+				tc.init(init)
 				continue
 
-			init.add_clause([-l for l in lits if l != 1])
+			simplifier.simplify(tc)
+
+			self.strategies[strategy] += 1
+			util.Count.add(f"Hybrid {strategy} constraints")
+
+			if strategy == selection.TIMED:
+				for lits in tc.build_watches(init):
+					self.static_watches.update(lits)
+				for info in tc.t_atom_info:
+					self.timed_watch_to_tc[info.untimed_lit].add(tc)
+			else:
+				for lits in tc.build_watches(init):
+					self.watches.update(lits)
+					for lit in lits:
+						self.watch_to_tc[lit].append(tc)
+
+			self.add_tc(tc)
+
+		simplifier.report()
+
+		for lit in self.watches | self.static_watches:
+			init.add_watch(lit)
+
+		self.watches = None
+		del self.watches
+
+		mix = ", ".join(f"{name}: {amt}" for name, amt in sorted(self.strategies.items()))
+		logging.getLogger(self.__module__ + "." + self.__class__.__name__).info(f"Hybrid watch strategies {mix}")
+
+		self.count_watches(len(self.watch_to_tc.keys()) + len(self.timed_watch_to_tc.keys()))
+
+	@util.Scope("propagate")
+	@util.Count(StatNames.PROP_CALLS_MSG.value)
+	def propagate(self, control, changes):
+		with util.Timer("Propagation-{}".format(self.name)):
+			for lit in changes:
+				for internal_lit in TimeAtomToSolverLit.grab_id(lit):
+					for tc in self.timed_watch_to_tc[Signatures.convert_to_untimed_lit(internal_lit)]:
+						if tc.propagate(control, internal_lit) is None:
+							return
+
+				if lit not in self.watch_to_tc:
+					continue
+
+				for tc in set(self.watch_to_tc[lit]):
+					result = tc.propagate(control, lit)
+					if result is None:
+						return
+
+					for delete, add in result:
+						self.watch_to_tc[delete].remove(tc)
+						self.watch_to_tc[add].append(tc)
+
+						if len(self.watch_to_tc[add]) == 1 and add not in self.static_watches:
+							# the new watch was not watched by any constraint before
+							control.add_watch(add)
+
+						if self.watch_to_tc[delete] == [] and delete not in self.static_watches:
+							control.remove_watch(delete)
+
+	def make_tc(self, t_atom, strategy=selection.TIMED):
+		size = len(t_atom.elements)
+		if size == 1:
+			return TheoryConstraintSize1(t_atom)
+		elif size == 2:
+			util.Count.add(StatNames.SIZE2_COUNT_MSG.value)
+			if strategy == selection.TWOWATCH:
+				return TheoryConstraintSize2Prop(t_atom, self.lock_ng)
+			return TheoryConstraintSize2TimedProp(t_atom, self.lock_ng)
+		else:
+			util.Count.add(StatNames.SIZEN_COUNT_MSG.value)
+			if strategy == selection.TWOWATCH:
+				return TheoryConstraint2watchProp(t_atom, self.lock_ng)
+			return TheoryConstraintTimedProp(t_atom, self.lock_ng)
+
+
+class GrounderPropagator:
+
+	def __init__(self, id, lock_ng=-1, shard=None, partition=None):
+		self.id = id
+		self.partition = partition
+
+	@property
+	def name(self) -> str:
+		return str(self.id)
+
+	@util.Scope("init")
+	@util.Timer(StatNames.INIT_TIMER_MSG.value)
+	def init(self, init):
+		if GlobalConfig.export_nogoods is not None:
+			# the signatures are cleared once the mapping is built
+			NogoodExport.signatures.update(sig for _, sig in Signatures.sigs)
+
+		init_TA2L_mapping_integers(init)
+
+		if self.partition is not None:
+			t_atoms = self.partition.atoms(init, self.id)
+		else:
+			t_atoms = [t_atom for t_atom in init.theory_atoms if t_atom.term.name == "constraint"]
+
+		parsed = [parse_atoms(t_atom) for t_atom in t_atoms]
+
+		formed = form_nogoods([describe(*constraint) for constraint in parsed])
+		if formed is None:
+			formed = (nogood_lists(*constraint) for constraint in parsed)
+
+		clauses = []
+		for _, nogoods in formed:
+			clauses.extend(self.build_constraints(init, nogoods))
+
+		if GlobalConfig.export_nogoods is not None:
+			NogoodExport.add(init, clauses)
+			NogoodExport.finish(GlobalConfig.export_nogoods)
+
+		TimeAtomToSolverLit.reset()
+
+	def build_constraints(self, init, nogoods) -> List[List[int]]:
+		clauses = [[-l for l in ng] for ng in nogoods]
+		for clause in clauses:
+			init.add_clause(clause)
+
+		return clauses
 
+	@util.Scope("check")
 	@util.Count(StatNames.CHECK_CALLS_MSG.value)
 	@util.Timer(StatNames.CHECK_TIMER_MSG.value)
 	def check(self, control):
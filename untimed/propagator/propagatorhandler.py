@@ -6,9 +6,17 @@ import clingo
 from untimed import util
 
 from untimed.propagator.theoryconstraint_data import StatNames
-from untimed.propagator.theoryconstraint_data import NOID
+from untimed.propagator.theoryconstraint_data import GlobalConfig
+from untimed.propagator.theoryconstraint_data import ConflictActivity
 
 from untimed.propagator.theoryconstraint_base import parse_signature
+from untimed.propagator.theoryconstraint_base import parse_constraint_times
+
+from untimed.propagator import selection
+
+from untimed.propagator.partition import ConstraintPartition
+from untimed.propagator.partition import LiteralComponents
+from untimed.propagator.partition import constraint_id
 
 from untimed.propagator.propagator import TimedAtomPropagator
 from untimed.propagator.propagator import TimedAtomAllWatchesPropagator
@@ -22,6 +30,20 @@ from untimed.propagator.propagator import TimedAtomPropagatorCheck
 from untimed.propagator.propagator import ConseqsPropagator
 from untimed.propagator.propagator import Propagator1watch
 from untimed.propagator.propagator import GrounderPropagator
+from untimed.propagator.propagator import HybridPropagator
+
+from untimed.propagator.heuristic import TemporalHeuristic
+
+from untimed.propagator.dispatcher import dispatcher
+
+from untimed.propagator.budget import GroundBudget
+
+from untimed.propagator.nogoodfile import NogoodExport
+from untimed.propagator.nogoodfile import NogoodImporter
+
+from untimed.propagator.trace import Trace
+from untimed.propagator.trace import recorder
+from untimed.propagator.trace import TraceUndoWatcher
 
 theory_file = os.path.abspath(os.path.join(os.path.dirname(__file__), "../theory/untimed_theory.lp"))
 
@@ -36,7 +58,8 @@ PROPAGATORS = {"timed": TimedAtomPropagator,
 			"check": TimedAtomPropagatorCheck,
 			"conseq": ConseqsPropagator,
 			"1watch": Propagator1watch,
-			"ground": GrounderPropagator}
+			"ground": GrounderPropagator,
+			"hybrid": HybridPropagator}
 
 def add_theory(prg) -> None:
 	prg.load(theory_file)
@@ -44,22 +67,37 @@ def add_theory(prg) -> None:
 
 class TheoryHandler:
 
-	supported_types = PROPAGATORS.keys()
+	supported_types = list(PROPAGATORS.keys()) + ["auto"]
 
 
-	def __init__(self, prop_type: str = "timed", lock_ng=-1, use_ids=clingo.Flag(False)) -> None:
+	def __init__(self, prop_type: str = "timed", lock_ng=-1, use_ids=clingo.Flag(False), heuristic=clingo.Flag(False),
+				partition=clingo.Flag(False), dispatch=clingo.Flag(False)) -> None:
 
 		self.logger = logging.getLogger(self.__module__ + "." + self.__class__.__name__)
 
 		if prop_type not in TheoryHandler.supported_types:
 			raise ValueError("Propagator Handler does not support {} watch type".format(prop_type))
 
-		self.propagator = lambda id: PROPAGATORS[prop_type](id, lock_ng)
+		self.prop_type = prop_type
+		self.lock_ng = lock_ng
+
+		self.propagator = lambda id, shard=None: PROPAGATORS[self.prop_type](id, self.lock_ng, shard, self.partition)
 
 		self.prop_ids = set()
 
 		self.use_ids = use_ids.flag
 
+		self.heuristic = heuristic.flag
+
+		# partition constraints into connected components, this replaces the ids given in the program
+		self.use_components = partition.flag
+
+		# ConstraintPartition shared by all propagators, set in register
+		self.partition = None
+
+		# register a single propagator that dispatches to the propagators of all ids, components and shards
+		self.dispatch = dispatch.flag
+
 	@util.Timer(StatNames.REGISTER_TIMER_MSG.value)
 	def register(self, prg) -> None:
 		"""
@@ -67,29 +105,106 @@ class TheoryHandler:
 		because it relies on looking at the grounded theory atoms
 		to create a propagator for each one
 		"""
-		t_atom_count = 0
+		sizes = []
+		windows = []
+		signatures = 0
+		horizon = 0
+		components = LiteralComponents()
 		for t_atom in prg.theory_atoms:
 			if t_atom.term.name == "signature":
 				for sign, sig in parse_signature(t_atom):
 					util.Count.add(StatNames.SIG_COUNT_MSG.value)
+					signatures += 1
 			else:
 				util.Count.add(StatNames.TC_COUNT_MSG.value)
 
-				if self.use_ids and t_atom.term.name == "constraint":
-					if len(t_atom.term.arguments) == 3:
-						id = t_atom.term.arguments[-1].name
-					else:
-						id = NOID
-						
+				min_time, max_time = parse_constraint_times(t_atom.term.arguments[:2])
+				sizes.append(len(t_atom.elements))
+				windows.append(max_time - min_time + 1)
+				horizon = max(horizon, max_time)
+
+				if self.use_components and t_atom.term.name == "constraint":
+					components.add(t_atom)
+
+				elif self.use_ids and t_atom.term.name == "constraint":
+					id = constraint_id(t_atom)
 					self.prop_ids.add(id)
 					util.Count.add(f"TC with id {id}", 1)
 
-		if not self.use_ids:
+		if self.use_components:
+			self.prop_ids.update(components.finish())
+			self.partition = ConstraintPartition(components.key)
+			util.Count.add(StatNames.COMPONENTS_MSG.value, len(self.prop_ids))
+			self.logger.info(f"partitioned constraints into {len(self.prop_ids)} components")
+		elif self.use_ids:
+			self.partition = ConstraintPartition(constraint_id)
+		else:
 			self.prop_ids.add(None)
 
-		for id in self.prop_ids:
-			prg.register_propagator(self.propagator(id))
+		self.choose_watch_type(selection.instance_features(sizes, windows, signatures, horizon))
+
+		GroundBudget.reset()
+		# conflicts are only bumped for the heuristic of this program
+		ConflictActivity.enabled = self.heuristic
+
+		if GlobalConfig.import_nogoods is not None:
+			# the imported clauses replace the constraints completely
+			self.logger.info(f"importing nogoods from {GlobalConfig.import_nogoods}")
+			prg.register_propagator(NogoodImporter(GlobalConfig.import_nogoods))
+			self.register_heuristic(prg)
+			return
+
+		if GlobalConfig.export_nogoods is not None and self.prop_type != "ground":
+			self.logger.warning("nogoods are only exported with the ground watch type")
+
+		if self.prop_type == "ground":
+			# the grounder adds every nogood as a clause in init and clears the literal mapping afterwards,
+			# so a single one handles all ids, components and shards
+			propagators = [GrounderPropagator(None, self.lock_ng)]
+		else:
+			propagators = []
+			for id in self.prop_ids:
+				if GlobalConfig.time_shards == 1:
+					propagators.append(self.propagator(id))
+					continue
+
+				for index in range(GlobalConfig.time_shards):
+					propagators.append(self.propagator(id, (index, GlobalConfig.time_shards)))
+
+		if GlobalConfig.export_nogoods is not None:
+			NogoodExport.reset(sum(isinstance(propagator, GrounderPropagator) for propagator in propagators))
+
+		if self.dispatch and len(propagators) > 1:
+			propagators = [dispatcher(propagators)]
+
+		if GlobalConfig.record_trace is not None:
+			Trace.reset()
+			# the watcher goes first so it has seen every level before another propagator stops at a conflict
+			propagators = [TraceUndoWatcher()] + [recorder(propagator, index)
+												  for index, propagator in enumerate(propagators)]
+
+		for propagator in propagators:
+			prg.register_propagator(propagator)
+
+		self.register_heuristic(prg)
+
+	def register_heuristic(self, prg) -> None:
+		if self.heuristic:
+			prg.register_propagator(TemporalHeuristic())
+
+
+	def choose_watch_type(self, features) -> None:
+		"""
+		Pick the watch type for the auto mode and log it with the instance features.
+		The features are logged for every watch type so that benchmark runs can be used by calibrate_rules
+		:param features: instance features, see selection.instance_features
+		"""
+		if self.prop_type == "auto":
+			self.prop_type = selection.choose_watch_type(features)
+			util.Count.add(f"Auto watch type {self.prop_type}")
 
+		feature_str = " ".join(f"{name}={features[name]:g}" for name in selection.INSTANCE_FEATURES)
+		self.logger.info(f"watch type: {self.prop_type} features: {feature_str}")
 
 	def __str__(self) -> str:
 		return self.__class__.__name__
@@ -0,0 +1,227 @@
+import json
+
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from untimed.propagator.theoryconstraint_data import TimeAtomToSolverLit
+from untimed.propagator.theoryconstraint_data import AtomInfo
+
+from untimed.propagator.theoryconstraint_base import reverse_assigned_time
+from untimed.propagator.theoryconstraint_base import untimed_lit_to_internal_lit
+
+# strategies that the hybrid propagator can assign to a single constraint
+TIMED = "timed"
+TWOWATCH = "2watch"
+
+class HybridConfig:
+	"""
+	Thresholds used to choose a watch strategy per constraint.
+	A size N constraint goes to 2watch if any of the thresholds is reached, otherwise it uses timed watches.
+	"""
+
+	# length of the [min_time, max_time] window
+	long_window = 20
+
+	# average amount of constraints that share the untimed literals of a constraint
+	high_fan_out = 8
+
+	# fraction of atoms that do not exist in the sampled assigned times
+	high_missing = 0.5
+
+	# amount of assigned times sampled to estimate the fraction of missing atoms
+	sample_size = 8
+
+
+def count_fan_out(t_atom_infos: List[List[AtomInfo]]) -> Dict[int, int]:
+	"""
+	Count in how many constraints every untimed literal appears
+	:param t_atom_infos: list containing the atom info list of every constraint
+	:return: dictionary mapping the absolute untimed literal to the amount of constraints it appears in
+	"""
+	fan_out: Dict[int, int] = defaultdict(int)
+	for t_atom_info in t_atom_infos:
+		for ulit in set(abs(info.untimed_lit) for info in t_atom_info):
+			fan_out[ulit] += 1
+
+	return fan_out
+
+
+def missing_fraction(t_atom_info: List[AtomInfo], min_time: int, max_time: int) -> float:
+	"""
+	Estimate the fraction of atoms of the constraint that do not exist
+	by looking at a few evenly spaced assigned times
+	:return: fraction between 0 and 1
+	"""
+	window = max_time - min_time + 1
+	step = max(1, window // HybridConfig.sample_size)
+
+	total = 0
+	missing = 0
+	for assigned_time in range(min_time, max_time + 1, step):
+		for info in t_atom_info:
+			total += 1
+			time = reverse_assigned_time(info, assigned_time)
+			if TimeAtomToSolverLit.grab_lit(untimed_lit_to_internal_lit(info, time)) == -1:
+				missing += 1
+
+	if total == 0:
+		return 0.0
+
+	return missing / total
+
+
+def constraint_features(t_atom_info: List[AtomInfo], min_time: int, max_time: int, fan_out: Dict[int, int]) -> Dict[str, float]:
+	"""
+	Compute the features used to select the watch strategy of a constraint
+	:param t_atom_info: atom info list of the constraint
+	:param fan_out: result of count_fan_out over all constraints of the propagator
+	:return: dictionary with the size, window, fan_out and missing features
+	"""
+	size = len(t_atom_info)
+	return {"size": size,
+			"window": max_time - min_time + 1,
+			"fan_out": sum(fan_out[abs(info.untimed_lit)] for info in t_atom_info) / max(size, 1),
+			"missing": missing_fraction(t_atom_info, min_time, max_time)}
+
+
+def choose_strategy(features: Dict[str, float]) -> str:
+	"""
+	Map the features of a constraint to the watch strategy that is expected to be faster
+	"""
+	if features["size"] <= 2:
+		return TIMED
+
+	if features["window"] >= HybridConfig.long_window \
+			or features["fan_out"] >= HybridConfig.high_fan_out \
+			or features["missing"] >= HybridConfig.high_missing:
+		return TWOWATCH
+
+	return TIMED
+
+
+class AutoConfig:
+	"""
+	Rule table used by the auto watch type. Rules are checked in order and the first one
+	whose bounds contain the instance features decides the watch type.
+	Every rule has a watch type and optional "min"/"max" dictionaries with inclusive bounds per feature.
+	The table can be replaced with load_rules, e.g. with the output of calibrate_rules.
+	"""
+
+	default = "timed"
+
+	rules: List[Dict] = [
+		# small instances are cheapest to ground completely
+		{"watch_type": "ground", "max": {"nogoods": 20000}},
+		# only binary constraints
+		{"watch_type": "conseq", "max": {"size_n_share": 0.0}},
+		# long horizons with mostly large constraints
+		{"watch_type": "2watch", "min": {"horizon": 50, "size_n_share": 0.5}},
+	]
+
+
+# feature names in the order they are logged and expected in benchmark output
+INSTANCE_FEATURES = ["constraints", "size_2", "size_n", "size_n_share", "signatures", "horizon", "nogoods"]
+
+
+def instance_features(sizes: List[int], windows: List[int], signatures: int, horizon: int) -> Dict[str, float]:
+	"""
+	Cheap features of a grounded instance
+	:param sizes: size of every constraint
+	:param windows: length of the time window of every constraint
+	:param signatures: amount of signature atoms
+	:param horizon: largest max time of all constraints
+	"""
+	size_2 = sum(1 for size in sizes if size == 2)
+	size_n = sum(1 for size in sizes if size > 2)
+	return {"constraints": len(sizes),
+			"size_2": size_2,
+			"size_n": size_n,
+			"size_n_share": size_n / max(size_2 + size_n, 1),
+			"signatures": signatures,
+			"horizon": horizon,
+			"nogoods": sum(windows)}
+
+
+def rule_matches(rule: Dict, features: Dict[str, float]) -> bool:
+	for name, bound in rule.get("min", {}).items():
+		if features[name] < bound:
+			return False
+	for name, bound in rule.get("max", {}).items():
+		if features[name] > bound:
+			return False
+
+	return True
+
+
+def choose_watch_type(features: Dict[str, float]) -> str:
+	"""
+	Map the instance features to a watch type using the rules in AutoConfig
+	"""
+	for rule in AutoConfig.rules:
+		if rule_matches(rule, features):
+			return rule["watch_type"]
+
+	return AutoConfig.default
+
+
+def load_rules(path: str) -> None:
+	"""
+	Replace the rule table of AutoConfig with the one in the given json file
+	The file holds either a list of rules or a dictionary with "rules" and "default"
+	"""
+	with open(path) as rule_file:
+		table = json.load(rule_file)
+
+	if isinstance(table, dict):
+		AutoConfig.default = table.get("default", AutoConfig.default)
+		table = table["rules"]
+
+	AutoConfig.rules = table
+
+
+# bucket edges used by calibrate_rules
+CALIBRATION_BUCKETS = {"horizon": [0, 20, 50, 100, 200],
+					   "size_n_share": [0.0, 0.25, 0.5, 0.75]}
+
+
+def calibrate_rules(rows: List[Dict]) -> Dict:
+	"""
+	Build a rule table from benchmark results.
+	Instances are put in buckets by horizon and share of size N constraints and every bucket
+	gets the watch type with the lowest total time in it.
+	The default is the watch type that wins the most buckets.
+
+	:param rows: one dictionary per run with the instance features, "watch_type" and "time"
+	:return: rule table that can be saved as json and read with load_rules
+	"""
+	times: Dict[Tuple, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+	for row in rows:
+		key = tuple(_bucket(float(row[name]), edges) for name, edges in CALIBRATION_BUCKETS.items())
+		times[key][row["watch_type"]] += float(row["time"])
+
+	wins: Dict[str, int] = defaultdict(int)
+	rules = []
+	for key in sorted(times):
+		best = min(times[key], key=times[key].get)
+		rule = {"watch_type": best, "min": {}, "max": {}}
+		for (name, edges), index in zip(CALIBRATION_BUCKETS.items(), key):
+			rule["min"][name] = edges[index]
+			if index + 1 < len(edges):
+				# bounds are inclusive, so stop right before the next edge
+				rule["max"][name] = edges[index + 1] - 1e-9
+		rules.append(rule)
+
+		wins[best] += 1
+
+	# the watch type that is best in most buckets is used for instances outside of all buckets
+	default = max(wins, key=wins.get) if wins else AutoConfig.default
+
+	return {"default": default, "rules": rules}
+
+
+def _bucket(value: float, edges: List[float]) -> int:
+	index = 0
+	for pos, edge in enumerate(edges):
+		if value >= edge:
+			index = pos
+	return index
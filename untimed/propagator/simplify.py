@@ -0,0 +1,91 @@
+import logging
+
+from typing import Set
+
+import untimed.util as util
+
+from untimed.propagator.theoryconstraint_data import StatNames
+
+from untimed.propagator.theoryconstraint_base import nogood_lists
+
+
+class Simplifier:
+	"""
+	Shrinks the nogoods of theory constraints with the atoms that are always true or false.
+	Every constraint is simplified right before its watches are built. Assigned times with an atom that
+	is always false have no nogood, build_watches_at removes them from the valid assigned times.
+	Nogoods of longer constraints that are left with 2 literals are moved to the binary engine if one is given,
+	the rest is handed to build_watches_at which adds the nogoods with less than 2 literals as clauses.
+	The constraint keeps the nogoods that are propagated lazily, so propagate and check use them
+	instead of forming the nogoods again.
+	Nogoods that are added as clauses on build are left as they are.
+
+	Members:
+	binary                  -- BinaryImplications of the propagator or None
+
+	before, after           -- Nogood literals of all simplified constraints before and after the simplification
+
+	dead                    -- Amount of assigned times without a nogood
+
+	moved                   -- Amount of nogoods moved to the binary engine
+	"""
+
+	__slots__ = ["binary", "before", "after", "dead", "moved"]
+
+	def __init__(self, binary=None) -> None:
+		self.binary = binary
+		self.before = 0
+		self.after = 0
+		self.dead = 0
+		self.moved = 0
+
+	def simplify(self, tc) -> Set[int]:
+		"""
+		Simplify the nogoods of one theory constraint and hand them to build_watches_at.
+		Constraints of size 1 are skipped
+
+		:return: the literals the binary engine has to watch
+		"""
+		watches = set()
+		if tc.size == 1:
+			return watches
+
+		if tc.prepared is not None:
+			nogoods = tc.prepared
+		else:
+			nogoods = dict(zip(*nogood_lists(tc.t_atom_info, tc.min_time, tc.max_time)))
+
+		self.before += tc.size * (tc.max_time - tc.min_time + 1)
+		self.dead += tc.max_time - tc.min_time + 1 - len(nogoods)
+
+		kept = {}
+		for assigned_time, ng in nogoods.items():
+			self.after += len(ng)
+
+			if self.binary is not None and tc.size > 2 and len(ng) == 2 and not tc.is_eager(assigned_time):
+				watches.update(self.binary.add_nogood(tc, assigned_time, ng))
+				tc.valid_ats = util.clear_bit(tc.valid_ats, assigned_time)
+				self.moved += 1
+				continue
+
+			kept[assigned_time] = ng
+
+		tc.prepared = kept
+
+		return watches
+
+	def report(self) -> None:
+		"""
+		Add the totals to the statistics, they are summed over all propagators there.
+		The totals of this propagator are only logged at debug level since there is one per shard or component
+		"""
+		util.Count.add(StatNames.SIMPLIFY_BEFORE_MSG.value, self.before)
+		util.Count.add(StatNames.SIMPLIFY_AFTER_MSG.value, self.after)
+		util.Count.add(StatNames.SIMPLIFY_DEAD_MSG.value, self.dead)
+		util.Count.add(StatNames.SIMPLIFY_BINARY_MSG.value, self.moved)
+
+		if self.before > 0:
+			logging.getLogger(__name__).debug(f"simplification: {self.after} of {self.before} nogood literals left "
+											 f"({100 * (self.before - self.after) / self.before:.1f}% removed), "
+											 f"{self.dead} dead assigned times, "
+											 f"{self.moved} nogoods moved to the binary engine")
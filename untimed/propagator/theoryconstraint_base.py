@@ -1,6 +1,7 @@
 import logging
 
-from typing import List, Tuple, Set, Optional
+from typing import Iterator, List, Tuple, Set, Optional
+from collections import defaultdict
 
 import untimed.util as util
 
@@ -10,9 +11,14 @@ from untimed.propagator.theoryconstraint_data import Signatures
 from untimed.propagator.theoryconstraint_data import ConstraintCheck
 from untimed.propagator.theoryconstraint_data import GlobalConfig
 from untimed.propagator.theoryconstraint_data import StatNames
+from untimed.propagator.theoryconstraint_data import record_conflict, record_unit
+from untimed.propagator.theoryconstraint_data import TimeHeatmap
+from untimed.propagator.theoryconstraint_data import NOID
 
 import clingo
 
+import numpy as np
+
 
 @util.Timer("parse_atom")
 # @profile
@@ -103,6 +109,19 @@ def parse_constraint_times(times) -> Tuple[int, int]:
 	return min_time, max_time
 
 
+def shard_window(min_time: int, max_time: int, index: int, count: int) -> Tuple[int, int]:
+	"""
+	Split the assigned times [min_time, max_time] into count consecutive parts of (almost) equal length
+	and return the part with the given index. The window is empty if max is lower than min
+
+	:param index: index of the shard starting at 0
+	:param count: amount of shards
+	:return: min and max time of the shard
+	"""
+	length = max_time - min_time + 1
+	return min_time + (length * index) // count, min_time + (length * (index + 1)) // count - 1
+
+
 def parse_time(s_atom) -> int:
 	"""
 	Parses the time point of the given atom
@@ -173,6 +192,54 @@ def form_nogood(t_atom_info, assigned_time: int) -> Optional[List[int]]:
 
 	return sorted(ng)
 
+def nogood_matrix(t_atom_info, min_time: int, max_time: int) -> Tuple[np.ndarray, np.ndarray]:
+	"""
+	Forms the nogoods of all assigned times of a theory constraint at once
+
+	:param t_atom_info: List of atominfo namedtuples of a particular constraint
+	:param min_time: first assigned time
+	:param max_time: last assigned time
+	:return: the assigned times that have a nogood and a 2 dimensional array of solver literals
+			 with one nogood per row. Literals that are always true are kept as 1
+	"""
+	assigned_times = np.arange(min_time, max_time + 1, dtype=np.int64)
+
+	untimed_lits = np.array([info.untimed_lit for info in t_atom_info], dtype=np.int64)
+	time_mods = np.array([info.time_mod for info in t_atom_info], dtype=np.int64)
+	signs = np.array([info.sign for info in t_atom_info], dtype=np.int64)
+
+	# same as untimed_lit_to_internal_lit(info, reverse_assigned_time(info, assigned_time)) for every pair
+	times = assigned_times[:, None] - time_mods[None, :]
+	internal_lits = untimed_lits[None, :] + times * Signatures.fullsig_size * signs[None, :]
+
+	lits = TimeAtomToSolverLit.grab_lits(internal_lits)
+
+	# a literal that is always false means there is no nogood for that assigned time
+	keep = (lits != -1).all(axis=1)
+
+	return assigned_times[keep], lits[keep]
+
+
+def matrix_row_to_nogood(row: List[int]) -> List[int]:
+	"""
+	Turn a row returned by nogood_matrix into the same nogood form_nogood returns
+	"""
+	ng = set(row)
+	ng.discard(1)
+	return sorted(ng)
+
+
+def nogood_lists(t_atom_info, min_time: int, max_time: int) -> Tuple[List[int], List[List[int]]]:
+	"""
+	Same as nogood_matrix but every nogood is turned into the form form_nogood returns
+
+	:return: the assigned times that have a nogood and the nogoods as lists
+	"""
+	assigned_times, nogoods = nogood_matrix(t_atom_info, min_time, max_time)
+
+	return assigned_times.tolist(), [matrix_row_to_nogood(row) for row in nogoods.tolist()]
+
+
 def form_nogood_always(t_atom_info, assigned_time: int) -> Optional[List[int]]:
 	"""
 	Forms a nogood based on the assigned time and atoms of a theory constraint
@@ -246,6 +313,108 @@ def check_assignment_complete(nogood, control) -> int:
 	return ConstraintCheck.CONFLICT
 
 
+_TRUTH_VALUE = {True: 1, False: -1, None: 0}
+
+
+def assignment_values(assignment, variables: Optional[np.ndarray] = None) -> np.ndarray:
+	"""
+	Take a snapshot of the truth values of the solver variables.
+	If variables are given only those are read, otherwise the whole trail is read.
+	The cheaper of the two is used.
+
+	:param assignment: clingo Assignment object
+	:param variables: optional array of the variables that are needed
+	:return: int8 array indexed by variable. 1 means true, -1 false and 0 unassigned
+	"""
+	trail = assignment.trail
+	values = np.zeros(len(assignment) + 1, dtype=np.int8)
+
+	if variables is not None and len(variables) < len(trail):
+		value = assignment.value
+		values[variables] = [_TRUTH_VALUE[value(var)] for var in variables.tolist()]
+		return values
+
+	lits = np.fromiter(trail, dtype=np.int64, count=len(trail))
+	values[np.abs(lits)] = np.sign(lits)
+
+	return values
+
+
+def conflict_mask(nogoods: np.ndarray, values: np.ndarray) -> np.ndarray:
+	"""
+	Vectorized version of check_assignment_complete for many nogoods
+
+	:param nogoods: 2 dimensional array of solver literals, one nogood per row
+	:param values: snapshot returned by assignment_values
+	:return: boolean array that is True for the rows whose literals are all true
+	"""
+	lit_values = values[np.abs(nogoods)] * np.sign(nogoods)
+	return (lit_values == 1).all(axis=1)
+
+
+def conflicting_nogoods(assigned_times: np.ndarray, nogoods: np.ndarray, values: np.ndarray) -> Tuple[List[int], List[List[int]]]:
+	"""
+	Find the nogoods whose literals are all true in the given snapshot
+
+	:param assigned_times: assigned time of every nogood
+	:param nogoods: 2 dimensional array of solver literals, one nogood per row
+	:param values: snapshot returned by assignment_values
+	:return: the assigned times and rows of nogoods that are conflicting
+	"""
+	mask = conflict_mask(nogoods, values)
+	return assigned_times[mask].tolist(), nogoods[mask].tolist()
+
+
+class NogoodTable:
+	"""
+	Nogoods of a list of theory constraints for all their assigned times, grouped by nogood size.
+	Used to check a total assignment with a few vectorized operations.
+
+	Members:
+	groups                  -- List of (variables, signs, owners, assigned_times) tuples, one per nogood size.
+								variables and signs are 2 dimensional arrays with one nogood per row,
+								owners and assigned_times give the constraint index and assigned time of every row
+
+	variables               -- All variables that appear in the nogoods
+	"""
+
+	__slots__ = ["theory_constraints", "groups", "variables"]
+
+	def __init__(self, theory_constraints) -> None:
+		self.theory_constraints = theory_constraints
+
+		by_size = defaultdict(list)
+		for owner, tc in enumerate(theory_constraints):
+			assigned_times, nogoods = nogood_matrix(tc.t_atom_info, tc.min_time, tc.max_time)
+			if len(assigned_times) == 0:
+				continue
+			by_size[tc.size].append((nogoods, np.full(len(assigned_times), owner), assigned_times))
+
+		self.groups = []
+		for parts in by_size.values():
+			nogoods = np.concatenate([nogoods for nogoods, _, _ in parts])
+			self.groups.append((np.abs(nogoods).astype(np.int32),
+								np.sign(nogoods).astype(np.int8),
+								np.concatenate([owners for _, owners, _ in parts]),
+								np.concatenate([ats for _, _, ats in parts])))
+
+		self.variables = np.unique(np.concatenate([group[0].ravel() for group in self.groups] + [np.zeros(0, dtype=np.int32)]))
+
+	def conflicts(self, values: np.ndarray):
+		"""
+		Yield the nogoods that are violated in the given snapshot
+		Nogoods that were locked or added as clauses can never be violated so valid_ats is not needed here
+
+		:param values: snapshot returned by assignment_values
+		:return: generator of (theory constraint, assigned time, nogood) tuples
+		"""
+		for variables, signs, owners, assigned_times in self.groups:
+			rows = np.flatnonzero((values[variables] == signs).all(axis=1))
+			for row in rows.tolist():
+				ng = matrix_row_to_nogood((variables[row] * signs[row]).tolist())
+				yield self.theory_constraints[owners[row]], int(assigned_times[row]), ng
+
+
 def get_at_from_internal_lit(internal_lit: int, t_atom_info) -> List[int]:
 	"""
 	Calculate the assigned times for a particular theory constraint given an internal literal
@@ -277,11 +446,14 @@ def init_TA2L_mapping_integers(init) -> None:
 		# look at all the atoms that have that same signature
 		# to avoid looking at the same list of atom multiple times with the same sig
 		# then we could instead of saving tuples (sign, sig) make a dict {sig: [signs...]}
+		# sig name is the same for all atoms of the signature
+		name = sig[0]
 		for s_atom in init.symbolic_atoms.by_signature(*sig):
-			time = parse_time(s_atom)
+			# grab the arguments only once since every access goes through the clingo API
+			arguments = s_atom.symbol.arguments
+			time = arguments[-1].number
 
-			name = s_atom.symbol.name
-			args = tuple(s_atom.symbol.arguments[:-1])
+			args = tuple(arguments[:-1])
 
 			if (name, args) not in Signatures.fullsigs:
 				# This happens when a symbol exists but the arguments are NOT within the given domain
@@ -305,6 +477,7 @@ def init_TA2L_mapping_integers(init) -> None:
 	Signatures.fullsigs.clear()
 
 	Signatures.finished = True
+	TimeAtomToSolverLit.build_arrays()
 	TimeAtomToSolverLit.initialized = True
 
 def choose_lit(lits: List[int], current_watches: int, control) -> Optional[int]:
@@ -363,9 +536,23 @@ class TheoryConstraint:
 	lock_nogoods            -- List containing amount of times the nogood of a specific
 								assigned time has to be added to lock the nogood
 								or None
+
+	last_time               -- Max time of the constraint as written in the program.
+								max_time can be lower if the constraint is split into time shards
+
+	eager_ats               -- Bitmask of assigned times whose nogoods are added as clauses on build
+
+	id                      -- Id of the constraint as written in the program, NOID if it has none
+
+	prepared                -- Mapping from an assigned time to its nogood, formed ahead of build_watches_at
+								in the NogoodPool or by the Simplifier, None if the nogoods are formed when needed.
+								After the build only the nogoods that are propagated lazily are kept
+
+	binary_ats              -- Bitmask of assigned times whose nogood is propagated by BinaryImplications
 	"""
 
-	__slots__ = ["t_atom_info", "max_time", "min_time", "logger", "lock_nogoods", "valid_ats"]
+	__slots__ = ["t_atom_info", "max_time", "min_time", "logger", "lock_nogoods", "valid_ats", "last_time", "eager_ats", "id",
+				 "prepared", "binary_ats"]
 
 	def __init__(self, constraint, lock_nogoods=-1) -> None:
 		self.logger = logging.getLogger(self.__module__ + "." + self.__class__.__name__)
@@ -377,6 +564,14 @@ class TheoryConstraint:
 
 		self.t_atom_info, self.min_time, self.max_time = parse_atoms(constraint)
 
+		self.last_time = self.max_time
+		self.eager_ats = 0
+
+		self.id = constraint.term.arguments[-1].name if len(constraint.term.arguments) == 3 else NOID
+
+		self.prepared = None
+		self.binary_ats = 0
+
 		self.valid_ats = 0
 		for at in range(self.min_time, self.max_time + 1):
 			self.valid_ats = util.set_bit(self.valid_ats, at)
@@ -396,6 +591,22 @@ class TheoryConstraint:
 				self.lock_nogoods[i] = None
 			self.lock_nogoods[-1] = None # this one just captures the extra one just in case a literal gets an assigned time outside of the max bound
 
+	def restrict_to_shard(self, index: int, count: int, eager: bool = False) -> None:
+		"""
+		Only handle the assigned times of one time shard of the constraint
+		:param index: index of the shard
+		:param count: amount of shards
+		:param eager: if True all nogoods of the shard are added as clauses on build
+		"""
+		self.min_time, self.max_time = shard_window(self.min_time, self.max_time, index, count)
+
+		self.valid_ats = 0
+		for at in range(self.min_time, self.max_time + 1):
+			self.valid_ats = util.set_bit(self.valid_ats, at)
+
+		if eager:
+			self.eager_ats = self.valid_ats
+
 	@property
 	def t_atom_names(self):
 		return self.t_atom_info
@@ -421,23 +632,31 @@ class TheoryConstraint:
 		:param init: clingo PropagateInit class
 		:return: List of literals that are watches by this theory constraint
 		"""
-		for assigned_time in range(self.min_time, self.max_time + 1):
-			lits = form_nogood(self.t_atom_info, assigned_time)
-			if lits is None:
-				self.valid_ats = util.clear_bit(self.valid_ats, assigned_time)
-				continue
+		if self.prepared is not None:
+			nogoods = self.prepared
+		else:
+			nogoods = dict(zip(*nogood_lists(self.t_atom_info, self.min_time, self.max_time)))
+
+		for assigned_time in set(range(self.min_time, self.max_time + 1)).difference(nogoods):
+			self.valid_ats = util.clear_bit(self.valid_ats, assigned_time)
+
+		for assigned_time, lits in list(nogoods.items()):
 			if self.lock_on_build(lits, assigned_time, init):
 				# if it is locked then we continue since we dont need to yield the lits(no need to watch them)
-				self.valid_ats = util.clear_bit(self.valid_ats, assigned_time)
+				del nogoods[assigned_time]
 				continue
 
 			if len(lits) == 0:
 				init.add_clause([])
 				util.Count.add("Add size 0")
-				continue
 			elif len(lits) == 1:
 				init.add_clause([ -lits[0] ])
 				util.Count.add("Add size 1")
+
+			if len(lits) < 2:
+				# the clause replaces the nogood, so it is not propagated anymore
+				self.valid_ats = util.clear_bit(self.valid_ats, assigned_time)
+				del nogoods[assigned_time]
 				continue
 
 			yield lits, assigned_time
@@ -445,13 +664,14 @@ class TheoryConstraint:
 	def ground(self, init):
 		"""
 		This function is used in the all watches propagator to "ground" the constraints given the options
-		lock_up_to and lock_from
+		lock_up_to and lock_from and the eager assigned times
 		:param init: clingo PropagateInit object
 		:return: None
 		"""
 
 		for assigned_time in range(self.min_time, self.max_time + 1):
-			if assigned_time <= GlobalConfig.lock_up_to or assigned_time >= self.max_time - GlobalConfig.lock_from:
+			if assigned_time <= GlobalConfig.lock_up_to or assigned_time >= self.last_time - GlobalConfig.lock_from \
+					or util.is_bit_true(self.eager_ats, assigned_time):
 				util.Count.add("pre-grounded")
 				lits = form_nogood(self.t_atom_info, assigned_time)
 				if lits is None:
@@ -471,12 +691,21 @@ class TheoryConstraint:
 		"""
 		pass
 
+	def nogood_at(self, assigned_time: int) -> Optional[List[int]]:
+		"""
+		:return: the prepared nogood of the assigned time if the nogoods were prepared, else it is formed
+		"""
+		if self.prepared is not None:
+			return self.prepared.get(assigned_time)
+
+		return form_nogood(self.t_atom_info, assigned_time)
+
 	def propagate_main(self, assigned_time, control):
 
 		if not self.is_valid_time(assigned_time):
 			return 1
 
-		ng = form_nogood(self.t_atom_info, assigned_time)
+		ng = self.nogood_at(assigned_time)
 		if ng is None:
 			self.valid_ats = util.clear_bit(self.valid_ats, assigned_time)
 			return 1
@@ -484,36 +713,59 @@ class TheoryConstraint:
 		return self.check_assignment(ng, control, assigned_time)
 
 	def check_assignment(self, ng, control, assigned_time):
+		TimeHeatmap.add(TimeHeatmap.HIT, assigned_time, self.id)
+
 		if check_assignment(ng, control) == ConstraintCheck.NONE:
 			return ConstraintCheck.NONE
 		lock = self.check_if_lock(assigned_time)
 
 		if not control.add_nogood(ng, lock=lock) or not control.propagate():
-			util.Count.add(StatNames.CONF_COUNT_MSG.value)
+			record_conflict(ng, assigned_time, self.id)
 			return None
 
-		util.Count.add(StatNames.UNITS_COUNT_MSG.value)
+		record_unit(assigned_time, self.id)
 
 		return ConstraintCheck.UNIT
 
-	def check(self, control) -> Optional[int]:
+	def check(self, control, values=None) -> Optional[int]:
 		"""
-		Goes through every assigned time and checks the assignment of the nogood
+		Checks the nogoods of every valid assigned time against a total assignment
 		:param control: clingo PropagateControl object
+		:param values: optional assignment snapshot, see assignment_values
 		:return: None if a conflict was found, 0 otherwise
 		"""
-		for assigned_time in range(self.min_time, self.max_time + 1):
-			if not self.is_valid_time(assigned_time):
-				continue
-			ng = form_nogood(self.t_atom_info, assigned_time)
-			if check_assignment_complete(ng, control) == ConstraintCheck.CONFLICT:
-				lock = self.check_if_lock(assigned_time)
-				if not control.add_nogood(ng, lock=lock) or not control.propagate():
-					# model has some conflicts
-					return None
-					
+		if values is None:
+			values = assignment_values(control.assignment)
+
+		for assigned_time, ng in self.conflicting(values):
+			lock = self.check_if_lock(assigned_time)
+			if not control.add_nogood(ng, lock=lock) or not control.propagate():
+				# model has some conflicts
+				record_conflict(ng, assigned_time, self.id)
+				return None
+
 		return ConstraintCheck.NONE
 
+	def conflicting(self, values: np.ndarray) -> Iterator[Tuple[int, List[int]]]:
+		"""
+		:param values: assignment snapshot, see assignment_values
+		:return: generator of the valid assigned times and their nogoods that are violated in the snapshot
+		"""
+		if self.prepared is not None:
+			for assigned_time, ng in self.prepared.items():
+				if util.is_bit_true(self.valid_ats, assigned_time) \
+						and all(values[abs(lit)] == (1 if lit > 0 else -1) for lit in ng):
+					yield assigned_time, ng
+			return
+
+		assigned_times, nogoods = nogood_matrix(self.t_atom_info, self.min_time, self.max_time)
+
+		valid = util.bits_to_array(self.valid_ats, self.max_time + 1)[assigned_times]
+		conflicts = valid & conflict_mask(nogoods, values)
+
+		for assigned_time, row in zip(assigned_times[conflicts].tolist(), nogoods[conflicts].tolist()):
+			yield assigned_time, matrix_row_to_nogood(row)
+
 	def check_if_lock(self, assigned_time) -> bool:
 		"""
 		check if the nogood on a particular assigned time is to be locked
@@ -574,8 +826,14 @@ class TheoryConstraint:
 
 		return True
 
+	def is_eager(self, at) -> bool:
+		"""
+		checks if the nogood of an assigned time is added as a clause on build
+		"""
+		return at <= GlobalConfig.lock_up_to or at >= self.last_time - GlobalConfig.lock_from or util.is_bit_true(self.eager_ats, at)
+
 	def lock_on_build(self, ng, at, init):
-		if at <= GlobalConfig.lock_up_to or at >= self.max_time - GlobalConfig.lock_from:
+		if self.is_eager(at):
 			init.add_clause([-l for l in ng])
 			util.Count.add(StatNames.PREGROUND_COUNT_MSG.value)
 
@@ -1,7 +1,11 @@
+import json
+
 from collections import defaultdict
 from typing import Dict, Tuple, Set, Any, Optional, List
 from enum import Enum
 
+import numpy as np
+
 import untimed.util as util
 
 # temporal constraint has no ID, so we assign it this one
@@ -36,8 +40,34 @@ class StatNames(Enum):
 	CONF_COUNT_MSG = "Conflicts added"
 
 	LOCKNG_COUNT_MSG = "locked nogood"
+	WATCHES_COUNT_MSG = "Untimed watches"
+
 	PREGROUND_COUNT_MSG = "Pre grounded nogoods"
 
+	HEURISTIC_DECISIONS_MSG = "Heuristic decisions"
+	COMPONENTS_MSG = "Constraint components"
+	DISPATCHED_MSG = "Dispatched propagators"
+
+	BUDGET_CLAUSES_MSG = "Ground budget clauses"
+	BUDGET_MEMORY_MSG = "Ground budget bytes"
+	PROFILE_EAGER_MSG = "Profile eager assigned times"
+
+	TEMPLATE_HITS_MSG = "Reused propagate functions"
+
+	POOL_TIMER_MSG = "Time to form nogoods in the pool"
+	POOL_COUNT_MSG = "Constraints formed in the pool"
+
+	BINARY_COUNT_MSG = "Binary implications"
+
+	SIMPLIFY_BEFORE_MSG = "Nogood literals before simplification"
+	SIMPLIFY_AFTER_MSG = "Nogood literals after simplification"
+	SIMPLIFY_DEAD_MSG = "Dead assigned times"
+	SIMPLIFY_BINARY_MSG = "Nogoods moved to the binary engine"
+
+	EXPORTED_MSG = "Exported nogoods"
+	EXPORT_SKIPPED_MSG = "Nogoods not exported"
+	IMPORTED_MSG = "Imported nogoods"
+
 
 class AtomInfo:
 
@@ -88,6 +118,10 @@ class TimeAtomToSolverLit:
 
 	size: int = None
 
+	# array versions of id_to_lit for positive and negative internal literals, indexed by the absolute value
+	pos_lits: Optional[np.ndarray] = None
+	neg_lits: Optional[np.ndarray] = None
+
 	@classmethod
 	#@profile
 	def add(cls, internal_lit, lit):
@@ -120,10 +154,65 @@ class TimeAtomToSolverLit:
 		return cls.id_to_lit[internal_lit]
 
 
+	@classmethod
+	def build_arrays(cls) -> None:
+		"""
+		Build the array versions of the mapping used by grab_lits
+		Internal literals that are not in the mapping get the same value grab_lit would give them
+		"""
+		size = max((abs(internal_lit) for internal_lit in cls.id_to_lit), default=0) + 1
+
+		cls.pos_lits = np.full(size, -1, dtype=np.int64)
+		cls.neg_lits = np.full(size, 1, dtype=np.int64)
+
+		for internal_lit, lit in cls.id_to_lit.items():
+			if internal_lit >= 0:
+				cls.pos_lits[internal_lit] = lit
+			else:
+				cls.neg_lits[-internal_lit] = lit
+
+	@classmethod
+	def grab_lits(cls, internal_lits: np.ndarray) -> np.ndarray:
+		"""
+		Vectorized version of grab_lit. Does not update the mapping for missing internal literals.
+		:param internal_lits: array of internal literals of any shape
+		:return: array of solver literals with the same shape
+		"""
+		if cls.pos_lits is None:
+			cls.build_arrays()
+
+		index = np.abs(internal_lits)
+		in_range = index < len(cls.pos_lits)
+		index = np.where(in_range, index, 0)
+
+		lits = np.where(internal_lits >= 0, cls.pos_lits[index], cls.neg_lits[index])
+		lits[~in_range] = np.where(internal_lits[~in_range] >= 0, -1, 1)
+
+		return lits
+
 	@classmethod
 	def grab_id(cls, lit):
 		return cls.lit_to_id[lit]
 
+	@classmethod
+	def grab_signed_ids(cls, lit) -> Set[int]:
+		"""
+		Internal literals of a solver literal. A negative solver literal is also mapped through its atom
+		if only the positive internal literal is in the mapping, the sign is applied to the internal literal
+		"""
+		return cls.lit_to_id.get(lit, set()) | {-internal_lit for internal_lit in cls.lit_to_id.get(-lit, ())}
+
+	@classmethod
+	def grab_signed_lit(cls, internal_lit) -> Optional[int]:
+		"""
+		Solver literal of an internal literal returned by grab_signed_ids, None if its atom is not in the mapping
+		"""
+		if internal_lit in cls.id_to_lit:
+			return cls.id_to_lit[internal_lit]
+		if -internal_lit in cls.id_to_lit:
+			return -cls.id_to_lit[-internal_lit]
+		return None
+
 	@classmethod
 	def has_name(cls, name_id):
 		return name_id in cls.id_to_lit
@@ -134,6 +223,8 @@ class TimeAtomToSolverLit:
 		cls.lit_to_id.clear()
 		cls.initialized = False
 		cls.size = 0
+		cls.pos_lits = None
+		cls.neg_lits = None
 
 class Signatures:
 	sigs: Set[Tuple[int, Tuple[Any, int]]] = set()
@@ -180,7 +271,209 @@ class Signatures:
 		return (abs(interal_lit) - 1) // cls.fullsig_size
 
 
+class ConflictActivity:
+	"""
+	Conflict activity of internal literals, i.e. (untimed literal, time) pairs.
+	Every time a nogood leads to a conflict the activity of its literals is increased.
+	Older conflicts count less since the increment grows after every conflict.
+	"""
+	enabled: bool = False
+
+	activity: Dict[int, float] = defaultdict(float)
+
+	increment: float = 1.0
+
+	decay: float = 0.95
+
+	conflicts: int = 0
+
+	@classmethod
+	def bump(cls, ng) -> None:
+		if not cls.enabled:
+			return
+
+		for lit in ng:
+			if lit == 1 or lit == -1:
+				# facts can not be decided on
+				continue
+			for internal_lit in TimeAtomToSolverLit.grab_signed_ids(lit):
+				cls.activity[internal_lit] += cls.increment
+
+		cls.conflicts += 1
+		cls.increment /= cls.decay
+
+		if cls.increment > 1e100:
+			# rescale to avoid overflows
+			for internal_lit in cls.activity:
+				cls.activity[internal_lit] *= 1e-100
+			cls.increment *= 1e-100
+
+	@classmethod
+	def reset(cls):
+		cls.activity.clear()
+		cls.increment = 1.0
+		cls.conflicts = 0
+
+
+class TimeHeatmap:
+	"""
+	Amount of propagate hits, units and conflicts of every assigned time, per constraint id.
+	Propagators that handle the atoms of many constraints at once (conseq, meta_ta) only know
+	the propagator name, which is the constraint id if propagators are created per id.
+	A hit is a nogood of an assigned time that was checked against the assignment during propagation.
+	"""
+	HIT = 0
+	UNIT = 1
+	CONFLICT = 2
+
+	KINDS = ["hits", "units", "conflicts"]
+
+	enabled: bool = False
+
+	counts: Dict[str, Dict[int, List[int]]] = defaultdict(lambda: defaultdict(lambda: [0, 0, 0]))
+
+	@classmethod
+	def add(cls, kind: int, assigned_time: int, name: Optional[str] = None) -> None:
+		if not cls.enabled:
+			return
+
+		if name is None:
+			key = getattr(util.Scope.local, "key", None)
+			name = key[0] if key is not None else "None"
+		cls.counts[name][assigned_time][kind] += 1
+
+	@classmethod
+	def reset(cls):
+		cls.counts.clear()
+
+	@classmethod
+	def totals(cls) -> Dict[int, List[int]]:
+		"""
+		Counts of every assigned time summed over all propagators
+		"""
+		totals: Dict[int, List[int]] = defaultdict(lambda: [0, 0, 0])
+		for by_time in cls.counts.values():
+			for assigned_time, counts in by_time.items():
+				for kind, amount in enumerate(counts):
+					totals[assigned_time][kind] += amount
+
+		return totals
+
+	@classmethod
+	def table(cls, rows: int = 10) -> List[str]:
+		"""
+		Counts summed over ranges of assigned times
+		:param rows: maximum amount of ranges
+		"""
+		totals = cls.totals()
+		if not totals:
+			return []
+
+		first, last = min(totals), max(totals)
+		width = -(-(last - first + 1) // rows)
+
+		lines = [f"{'assigned time':16}{'hits':>12}{'units':>12}{'conflicts':>12}"]
+		for start in range(first, last + 1, width):
+			counts = [sum(totals[t][kind] for t in range(start, start + width) if t in totals) for kind in range(3)]
+			lines.append(f"{f'{start}-{min(start + width - 1, last)}':16}" + "".join(f"{amount:>12}" for amount in counts))
+
+		return lines
+
+	@classmethod
+	def suggest(cls) -> Tuple[Optional[int], Optional[int]]:
+		"""
+		Suggest values for ground-up-to and ground-from so the assigned times at the start and the end
+		whose hits, units and conflicts are above the average are grounded eagerly
+		:return: ground-up-to and ground-from values, None if the times at that end are not hot
+		"""
+		totals = cls.totals()
+		if not totals:
+			return None, None
+
+		times = list(range(min(totals), max(totals) + 1))
+		cost = [sum(totals[t]) if t in totals else 0 for t in times]
+		mean = sum(cost) / len(cost)
+
+		up_to = None
+		for t, c in zip(times, cost):
+			if c <= mean:
+				break
+			up_to = t
+
+		ground_from = None
+		for t, c in zip(reversed(times), reversed(cost)):
+			if c <= mean or (up_to is not None and t <= up_to):
+				break
+			ground_from = times[-1] - t
+
+		return up_to, ground_from
+
+	@classmethod
+	def write(cls, path: str) -> None:
+		"""
+		Write the counts as json, for every propagator name a mapping from assigned time to the counts
+		"""
+		heatmap = {name: {str(assigned_time): dict(zip(cls.KINDS, counts)) for assigned_time, counts in sorted(by_time.items())}
+				   for name, by_time in cls.counts.items()}
+
+		with open(path, "w") as heatmap_file:
+			json.dump(heatmap, heatmap_file)
+
+
+def record_conflict(ng, assigned_time: int, name: Optional[str] = None) -> None:
+	"""
+	Record a conflict found by adding the nogood of an assigned time: it is counted,
+	the activity of its literals is bumped and it goes into the heatmap
+	:param name: constraint id for the heatmap, None for the name of the running propagator
+	"""
+	util.Count.add(StatNames.CONF_COUNT_MSG.value)
+	ConflictActivity.bump(ng)
+	TimeHeatmap.add(TimeHeatmap.CONFLICT, assigned_time, name)
+
+
+def record_unit(assigned_time: int, name: Optional[str] = None) -> None:
+	"""
+	Record a nogood of an assigned time that was added and propagated without a conflict
+	:param name: constraint id for the heatmap, None for the name of the running propagator
+	"""
+	util.Count.add(StatNames.UNITS_COUNT_MSG.value)
+	TimeHeatmap.add(TimeHeatmap.UNIT, assigned_time, name)
+
+
 class GlobalConfig:
 
 	lock_up_to = -1
 	lock_from = -1
+
+	# amount of time shards every propagator is split into and the shards that are grounded eagerly
+	time_shards = 1
+	eager_shards: Set[int] = set()
+
+	# budget for eagerly grounded nogoods in clauses and estimated bytes, -1 means no limit
+	ground_budget_clauses = -1
+	ground_budget_memory = -1
+
+	# files to write the clauses of the ground watch type to and to read them from instead of the constraints
+	export_nogoods: Optional[str] = None
+	import_nogoods: Optional[str] = None
+
+	# file the callbacks of the propagators are recorded to
+	record_trace: Optional[str] = None
+
+	# file the latency histograms of the propagator callbacks are written to
+	latency_histogram: Optional[str] = None
+
+	# file the timeline of timers and propagator callbacks is written to
+	timeline: Optional[str] = None
+
+	# file the heatmap of assigned times is written to
+	heatmap: Optional[str] = None
+
+	# profile of earlier runs that decides the eagerly grounded nogoods, it is updated after every run
+	ground_profile: Optional[str] = None
+
+	# amount of processes that form the nogoods of the constraints during init, 0 or 1 forms them in the main process
+	init_workers = 0
+
+	# propagate the size 2 constraints with BinaryImplications in the propagators that support it
+	binary_engine = False
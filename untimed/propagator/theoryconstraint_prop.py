@@ -8,17 +8,22 @@ import untimed.util as util
 from untimed.propagator.theoryconstraint_data import TimeAtomToSolverLit
 
 from untimed.propagator.theoryconstraint_data import ConstraintCheck, StatNames
+from untimed.propagator.theoryconstraint_data import record_conflict, record_unit
+from untimed.propagator.theoryconstraint_data import TimeHeatmap
 
 from untimed.propagator.theoryconstraint_base import TheoryConstraint
-from untimed.propagator.theoryconstraint_base import form_nogood
 from untimed.propagator.theoryconstraint_base import get_at_from_internal_lit
 from untimed.propagator.theoryconstraint_base import check_assignment
 from untimed.propagator.theoryconstraint_base import get_replacement_watch
 from untimed.propagator.theoryconstraint_base import Signatures
 from untimed.propagator.theoryconstraint_base import check_assignment_complete
+from untimed.propagator.theoryconstraint_base import assignment_values
+from untimed.propagator.theoryconstraint_base import conflicting_nogoods
 
 import types
 
+import numpy as np
+
 
 class TheoryConstraintSize2Prop(TheoryConstraint):
 	__slots__ = []
@@ -80,19 +85,21 @@ class TheoryConstraintSize2Prop2WatchMap(TheoryConstraint):
 		if not self.is_valid_time(assigned_time):
 			return [], ConstraintCheck.UNIT
 
-		ng = form_nogood(self.t_atom_info, assigned_time)
+		ng = self.nogood_at(assigned_time)
 		if ng is None:
 			return [], ConstraintCheck.UNIT
 
+		TimeHeatmap.add(TimeHeatmap.HIT, assigned_time, self.id)
+
 		if check_assignment(ng, control) == ConstraintCheck.NONE:
 			return [], ConstraintCheck.UNIT
 
 		lock = self.check_if_lock(assigned_time)
 
 		if not control.add_nogood(ng, lock=lock) or not control.propagate():
-			util.Count.add(StatNames.CONF_COUNT_MSG.value)
+			record_conflict(ng, assigned_time, self.id)
 			return None
-		util.Count.add(StatNames.UNITS_COUNT_MSG.value)
+		record_unit(assigned_time, self.id)
 
 		# always return UNIT so that it doesnt attempt to change the watches for size 2
 		return [], ConstraintCheck.UNIT
@@ -173,7 +180,7 @@ class TheoryConstraint2watchProp(TheoryConstraint):
 			if not self.is_valid_time(assigned_time):
 				continue
 
-			ng = form_nogood(self.t_atom_info, assigned_time)
+			ng = self.nogood_at(assigned_time)
 			if ng is None:
 				continue
 
@@ -259,7 +266,7 @@ class TheoryConstraint1watch(TheoryConstraint):
 			if not self.is_valid_time(assigned_time):
 				continue
 
-			ng = form_nogood(self.t_atom_info, assigned_time)
+			ng = self.nogood_at(assigned_time)
 			if ng is None:
 				continue
 
@@ -328,19 +335,21 @@ class TheoryConstraint2watchPropMap(TheoryConstraint):
 		if not self.is_valid_time(assigned_time):
 			return [], ConstraintCheck.UNIT
 
-		ng = form_nogood(self.t_atom_info, assigned_time)
+		ng = self.nogood_at(assigned_time)
 		if ng is None:
 			return [], ConstraintCheck.UNIT
 
+		TimeHeatmap.add(TimeHeatmap.HIT, assigned_time, self.id)
+
 		update_result = check_assignment(ng, control)
 		if update_result == ConstraintCheck.NONE:
 			return ng, update_result
 
 		lock = self.check_if_lock(assigned_time)
 		if not control.add_nogood(ng, lock=lock) or not control.propagate():
-			util.Count.add(StatNames.CONF_COUNT_MSG.value)
+			record_conflict(ng, assigned_time, self.id)
 			return None
-		util.Count.add(StatNames.UNITS_COUNT_MSG.value)
+		record_unit(assigned_time, self.id)
 
 		return ng, update_result
 
@@ -395,7 +404,21 @@ class TheoryConstraintTimedProp(TheoryConstraint):
 
 
 class TAtomConseqs():
-	__slots__ = ["untimed_lit", "conseqs", "lock_nogoods"]
+	"""
+	Holds the consequences of a single untimed literal.
+
+	Members:
+	untimed_lit             -- The untimed literal this object belongs to
+
+	conseqs                 -- List of consequences. Every consequence is a tuple
+								(self_time_mod, others, min_time, max_time) where others
+								is a tuple of (untimed_lit, time_mod) pairs for the remaining
+								atoms of the constraint
+
+	nogood_arrays           -- Assigned times and solver literals of every consequence for all its assigned times.
+								One (assigned times, 2 dimensional array) pair per consequence, built on the first check
+	"""
+	__slots__ = ["untimed_lit", "conseqs", "lock_nogoods", "nogood_arrays"]
 
 	def __init__(self, untimed_atom=None, lock_nogoods=-1) -> None:
 		#self.logger = logging.getLogger(self.__module__ + "." + self.__class__.__name__)
@@ -403,6 +426,8 @@ class TAtomConseqs():
 		self.untimed_lit = untimed_atom
 		self.conseqs = []
 
+		self.nogood_arrays = None
+
 		if lock_nogoods == -1:
 			# never lock
 			self.lock_nogoods = False
@@ -414,46 +439,25 @@ class TAtomConseqs():
 
 	def build_conseqs(self, info, min, max):
 		"""
-		Extend the conseqs list given the theory constraint
-		:param tc: theory constraint that involves the untimed atom for this atom
-		:return:
+		Extend the conseqs list given the atom info of a theory constraint
+		For every occurrence of the untimed atom in the constraint a consequence is added
+		that contains the remaining atoms of the constraint
+		:param info: atom info list of a theory constraint that involves the untimed atom
+		:param min: min time of the theory constraint
+		:param max: max time of the theory constraint
 		"""
-		self_time_mod = None
-		other_time_mod = None
-		other_lit = None
-		for i in info:
+		for pos, i in enumerate(info):
 			if i.untimed_lit != self.untimed_lit:
-				other_time_mod = i.time_mod
-				other_lit = i.untimed_lit
-
-			else:
-				self_time_mod = i.time_mod
-
-		if other_time_mod is None:
-			# in this case both atoms are the same
-			# we add the time mods in both orders
+				continue
 
-			self_time_mod = info[0].time_mod
-			other_time_mod = info[1].time_mod
+			others = tuple((o.untimed_lit, o.time_mod) for other_pos, o in enumerate(info) if other_pos != pos)
 
-			conseq = [self.untimed_lit, self_time_mod, other_time_mod, min, max]
+			conseq = (i.time_mod, others, min, max)
 			# if we have constraints with the same atom just in different time steps
 			# then we check so that we don't add the same consequence
 			if conseq not in self.conseqs:
 				self.conseqs.append(conseq)
 
-			conseq = [self.untimed_lit, other_time_mod, self_time_mod, min, max]
-			if conseq not in self.conseqs:
-				self.conseqs.append(conseq)
-
-			return
-
-		conseq = [other_lit, self_time_mod, other_time_mod, min, max]
-		# if we have constraints with the same atom just in different time steps
-		# then we check so that we don't add the same consequence
-		if conseq not in self.conseqs:
-			self.conseqs.append(conseq)
-
 	def is_valid_time(self, assigned_time, min_time, max_time):
 		"""
 		checks if an assigned time is valid for the theory constraint
@@ -470,7 +474,7 @@ class TAtomConseqs():
 	def propagate(self, control, change) -> Optional[List[Tuple]]:
 		"""
 		look for assigned times of the change and add the nogoods of those times to
-		the solver
+		the solver if they are unit or conflicting
 
 		:param control: clingo PropagateControl object
 		:param change: tuple containing the internal literal and solver literal
@@ -479,38 +483,82 @@ class TAtomConseqs():
 
 		internal_lit, lit = change
 		time = Signatures.convert_to_time(internal_lit)
-		for conseq, self_time_mod, other_time_mod, min_time, max_time in self.conseqs:
+		assignment = control.assignment
+		for self_time_mod, others, min_time, max_time in self.conseqs:
 			assigned_time = time + self_time_mod
 			if not self.is_valid_time(assigned_time, min_time, max_time):
 				continue
 
-			other_lit = TimeAtomToSolverLit.grab_lit(Signatures.convert_to_internal_lit(conseq, assigned_time - other_time_mod, util.sign(conseq)))
-			ng = [lit, other_lit]
-
-			if check_assignment(ng, control) == ConstraintCheck.NONE:
-				continue
+			TimeHeatmap.add(TimeHeatmap.HIT, assigned_time)
 
-			if not control.add_nogood(ng, lock=self.lock_nogoods) or not control.propagate():
-				util.Count.add(StatNames.CONF_COUNT_MSG.value)
-				return None
+			ng = [lit]
+			unassigned = 0
+			for other, other_time_mod in others:
+				other_lit = TimeAtomToSolverLit.grab_lit(Signatures.convert_to_internal_lit(other, assigned_time - other_time_mod, util.sign(other)))
+				if other_lit == 1:
+					continue
+				if other_lit == -1 or assignment.is_false(other_lit):
+					# nogood does not exist or is already satisfied
+					break
+				if not assignment.is_true(other_lit):
+					unassigned += 1
+					if unassigned > 1:
+						break
+				ng.append(other_lit)
+			else:
+				if not control.add_nogood(ng, lock=self.lock_nogoods) or not control.propagate():
+					record_conflict(ng, assigned_time)
+					return None
 
-			util.Count.add(StatNames.UNITS_COUNT_MSG.value)
+				record_unit(assigned_time)
 
 		return 1
 
 	def check_if_lock(self, assigned_time):
 		return self.lock_nogoods
 
-	def check(self, control):
-		for conseq, self_time_mod, other_time_mod, min_time, max_time in self.conseqs:
-			for assigned_time in range(min_time, max_time):
-				lit = TimeAtomToSolverLit.grab_lit(Signatures.convert_to_internal_lit(self.untimed_lit, assigned_time - self_time_mod, util.sign(self.untimed_lit)))
-				other_lit = TimeAtomToSolverLit.grab_lit(Signatures.convert_to_internal_lit(conseq, assigned_time - other_time_mod, util.sign(conseq)))
+	def build_nogood_arrays(self) -> List[Tuple[np.ndarray, np.ndarray]]:
+		"""
+		Build the solver literals of every consequence for all of its assigned times.
+		Assigned times where an atom does not exist are left out since their nogood can never be violated.
+		:return: list with the assigned times and a 2 dimensional array per consequence, one row per assigned time
+		"""
+		if self.nogood_arrays is not None:
+			return self.nogood_arrays
+
+		self.nogood_arrays = []
+		for self_time_mod, others, min_time, max_time in self.conseqs:
+			rows = []
+			assigned_times = []
+			for assigned_time in range(min_time, max_time + 1):
+				ng = [TimeAtomToSolverLit.grab_lit(Signatures.convert_to_internal_lit(self.untimed_lit, assigned_time - self_time_mod, util.sign(self.untimed_lit)))]
+				for other, other_time_mod in others:
+					ng.append(TimeAtomToSolverLit.grab_lit(Signatures.convert_to_internal_lit(other, assigned_time - other_time_mod, util.sign(other))))
+
+				if -1 not in ng:
+					rows.append(ng)
+					assigned_times.append(assigned_time)
+
+			self.nogood_arrays.append((np.array(assigned_times, dtype=np.int64),
+									   np.array(rows, dtype=np.int64).reshape(len(rows), len(others) + 1)))
+
+		return self.nogood_arrays
+
+	def check(self, control, values=None):
+		"""
+		Check the nogoods of all consequences under a total assignment
+		:param control: clingo PropagateControl object
+		:param values: optional assignment snapshot, see assignment_values
+		:return: None if a conflict was found, 1 otherwise
+		"""
+		if values is None:
+			values = assignment_values(control.assignment)
 
-				if check_assignment_complete([lit, other_lit], control) == ConstraintCheck.CONFLICT:
-					lock = self.check_if_lock(assigned_time)
-					if not control.add_nogood(ng, lock=lock) or not control.propagate():
-						return None
+		for assigned_times, nogoods in self.build_nogood_arrays():
+			for assigned_time, ng in zip(*conflicting_nogoods(assigned_times, nogoods, values)):
+				if not control.add_nogood(ng, lock=self.lock_nogoods) or not control.propagate():
+					record_conflict(ng, assigned_time)
+					return None
 
 		return 1
 
@@ -539,7 +587,7 @@ class TheoryConstraintCountProp(TheoryConstraint):
 
 			self.counts[assigned_time] += 1
 			if self.counts[assigned_time] >= self.size - 1:
-				ng = form_nogood(self.t_atom_info, assigned_time)
+				ng = self.nogood_at(assigned_time)
 				if ng is None:
 					continue
 
@@ -590,10 +638,7 @@ class TheoryConstraintMetaProp(TheoryConstraint):
 
 		func_str += prop_template_end
 
-		with util.Timer("exec"):
-			exec(func_str, globals())
-
-		self.propagate_func = types.MethodType(prop_test, self)
+		self.propagate_func = types.MethodType(compile_prop_function(func_str), self)
 
 		return self.propagate_func
 
@@ -638,17 +683,46 @@ if_template_t_atom = """
 	at = time + {t_mod}
 	if at >= {min} and at <= {max}:
 		{ng}
+		TimeHeatmap.add(TimeHeatmap.HIT, at)
 		update_result = check_assignment(ng, control)
 		if update_result == ConstraintCheck.CONFLICT or update_result == ConstraintCheck.UNIT:
 			lock = self.check_if_lock(at)
 			if not control.add_nogood(ng, lock=lock) or not control.propagate():
-				util.Count.add(StatNames.CONF_COUNT_MSG.value)
+				record_conflict(ng, at)
 				return None
-			util.Count.add(StatNames.UNITS_COUNT_MSG.value)
+			record_unit(at)
 """
 
 check_mapping = "TimeAtomToSolverLit.grab_lit(Signatures.convert_to_internal_lit({untimed_lit}, at-{time_mod}, {sign}))"
 
+# generated propagate functions by their source. They only refer to the globals of this module so they can be reused
+# by every constraint and every program that generates the same source.
+# The dictionary is kept in the order of the last use, the least recently used function is dropped
+# once there are more than PROP_FUNCTIONS_LIMIT, e.g. in a server worker that solves many programs
+PROP_FUNCTIONS_LIMIT = 4096
+prop_functions: Dict[str, types.FunctionType] = {}
+
+
+def compile_prop_function(func_str: str) -> types.FunctionType:
+	"""
+	Compile the source of a generated propagate function that defines prop_test
+	"""
+	func = prop_functions.pop(func_str, None)
+	if func is not None:
+		util.Count.add(StatNames.TEMPLATE_HITS_MSG.value)
+		prop_functions[func_str] = func
+		return func
+
+	with util.Timer("exec"):
+		namespace = {}
+		exec(func_str, globals(), namespace)
+
+	if len(prop_functions) >= PROP_FUNCTIONS_LIMIT:
+		del prop_functions[next(iter(prop_functions))]
+
+	prop_functions[func_str] = namespace["prop_test"]
+	return prop_functions[func_str]
+
 
 class MetaTAtomProp():
 	__slots__ = ["t_atom", "propagate_func", "func_str", "if_blocks"]
@@ -688,10 +762,7 @@ class MetaTAtomProp():
 		self.func_str = "{}\n{}\n{}".format(prop_template_t_atom_start.format(f_name="prop_test", t_atom=self.t_atom),
 		                     "\n".join(self.if_blocks), prop_template_end)
 
-		with util.Timer("exec"):
-			exec(self.func_str, globals())
-
-		self.propagate_func = types.MethodType(prop_test, self)
+		self.propagate_func = types.MethodType(compile_prop_function(self.func_str), self)
 		self.func_str = None
 
 	def check_if_lock(self, at):
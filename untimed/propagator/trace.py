@@ -0,0 +1,277 @@
+import logging
+
+from array import array
+from typing import Dict, List, Tuple, Any, Iterator
+
+import numpy as np
+
+from untimed.propagator.theoryconstraint_data import Signatures
+
+# event kinds
+PROPAGATE = 0
+UNDO = 1
+CHECK = 2
+
+EVENT_NAMES = {PROPAGATE: "propagate", UNDO: "undo", CHECK: "check"}
+
+# columns of the events table
+EVENT_COLUMNS = ["kind", "propagator", "thread", "level", "keep", "trail", "changes", "nogoods"]
+
+
+class Trace:
+	"""
+	Recording of the callbacks clasp makes into the propagators.
+	For every callback the trail is stored as the amount of literals kept from the previous trail of the same thread
+	plus the new literals, so the complete assignment can be rebuilt offline.
+
+	File format (numpy npz):
+	atoms                   -- string of every signature atom symbol
+	atom_lits               -- solver literal of every atom
+	events                  -- one row per callback with the columns in EVENT_COLUMNS,
+								trail, changes and nogoods are the amount of entries in the flat arrays
+	trail                   -- new trail literals of all events one after the other
+	changes                 -- changes given to the callbacks
+	nogoods                 -- literals of the nogoods added by the recorded propagator, every nogood ends with a 0
+
+	Members:
+	previous                -- last trail and decision level offsets that were recorded for every thread
+
+	undone                  -- lowest decision level every thread undid since its last trail was recorded
+	"""
+
+	atoms: List[str] = []
+	atom_lits: List[int] = []
+
+	events = array("q")
+	trail = array("i")
+	changes = array("i")
+	nogoods = array("i")
+
+	previous: Dict[int, Tuple[List[int], List[int]]] = {}
+	undone: Dict[int, int] = {}
+
+	@staticmethod
+	def reset() -> None:
+		Trace.atoms = []
+		Trace.atom_lits = []
+		Trace.events = array("q")
+		Trace.trail = array("i")
+		Trace.changes = array("i")
+		Trace.nogoods = array("i")
+		Trace.previous = {}
+		Trace.undone = {}
+
+	@staticmethod
+	def add_atoms(init) -> None:
+		"""
+		Remember the solver literal of every signature atom, has to be called before the mapping is built
+		since that clears the signatures
+		"""
+		if Trace.atoms:
+			return
+
+		for sig in set(sig for _, sig in Signatures.sigs):
+			for s_atom in init.symbolic_atoms.by_signature(*sig):
+				Trace.atoms.append(str(s_atom.symbol))
+				Trace.atom_lits.append(init.solver_literal(s_atom.literal))
+
+	@staticmethod
+	def backtrack(thread_id: int, level: int) -> None:
+		"""
+		Note that the solver undid a decision level, see TraceUndoWatcher
+		"""
+		Trace.undone[thread_id] = min(level, Trace.undone.get(thread_id, level))
+
+	@staticmethod
+	def snapshot(thread_id: int, assignment) -> Tuple[int, int, List[int]]:
+		"""
+		Take the trail of the assignment when the callback is entered. Reading the whole trail through the clingo API
+		on every callback is too slow, so only the part after the lowest decision level that was undone since
+		the previous trail of the thread is read again. The solver only appends to the levels it keeps,
+		so if no level was undone only the literals appended since the previous trail are read.
+
+		:return: decision level, amount of literals kept from the previous trail of the thread and the new literals
+		"""
+		trail = assignment.trail
+		level = assignment.decision_level
+		begins = [trail.begin(lvl) for lvl in range(level + 1)]
+
+		undone = Trace.undone.pop(thread_id, None)
+		if thread_id in Trace.previous:
+			previous, previous_begins = Trace.previous[thread_id]
+			keep = len(previous)
+			if undone is not None and undone < len(previous_begins):
+				# levels above the previous trail were added after it, undoing them leaves it as it is
+				keep = min(keep, previous_begins[undone])
+		else:
+			previous = []
+			keep = 0
+
+		new = [trail[pos] for pos in range(keep, len(trail))]
+		Trace.previous[thread_id] = (previous[:keep] + new, begins)
+
+		return level, keep, new
+
+	@staticmethod
+	def add_event(kind: int, propagator: int, thread_id: int, snapshot: Tuple[int, int, List[int]], changes,
+				  nogoods: List[List[int]]) -> None:
+		level, keep, new = snapshot
+
+		ng_lits = [lit for ng in nogoods for lit in list(ng) + [0]]
+
+		Trace.events.extend([kind, propagator, thread_id, level, keep, len(new), len(changes), len(ng_lits)])
+		Trace.trail.extend(new)
+		Trace.changes.extend(changes)
+		Trace.nogoods.extend(ng_lits)
+
+	@staticmethod
+	def write(path: str) -> None:
+		with open(path, "wb") as trace_file:
+			np.savez_compressed(trace_file,
+								atoms=np.array(Trace.atoms, dtype=str),
+								atom_lits=np.array(Trace.atom_lits, dtype=np.int64),
+								events=np.array(Trace.events, dtype=np.int64).reshape(-1, len(EVENT_COLUMNS)),
+								trail=np.array(Trace.trail, dtype=np.int32),
+								changes=np.array(Trace.changes, dtype=np.int32),
+								nogoods=np.array(Trace.nogoods, dtype=np.int32))
+
+		logging.getLogger(__name__).info(f"wrote {len(Trace.events) // len(EVENT_COLUMNS)} trace events to {path}")
+
+
+def read_trace(path: str) -> Tuple[Dict[str, int], Iterator[Tuple[int, int, int, int, List[int], List[int], List[List[int]]]]]:
+	"""
+	Read a trace written by Trace.write
+	:return: mapping from atom string to solver literal and a generator with one
+			(kind, propagator, thread, level, trail, changes, nogoods) tuple per event, trail is the complete trail
+	"""
+	with np.load(path) as data:
+		literals = dict(zip(data["atoms"].tolist(), data["atom_lits"].tolist()))
+		events = data["events"].tolist()
+		trail_lits = data["trail"].tolist()
+		change_lits = data["changes"].tolist()
+		nogood_lits = data["nogoods"].tolist()
+
+	def generate():
+		trails: Dict[int, List[int]] = {}
+		trail_pos = change_pos = nogood_pos = 0
+		for kind, propagator, thread, level, keep, n_trail, n_changes, n_nogoods in events:
+			trail = trails.get(thread, [])[:keep] + trail_lits[trail_pos:trail_pos + n_trail]
+			trails[thread] = trail
+
+			changes = change_lits[change_pos:change_pos + n_changes]
+
+			nogoods = []
+			current = []
+			for lit in nogood_lits[nogood_pos:nogood_pos + n_nogoods]:
+				if lit == 0:
+					nogoods.append(current)
+					current = []
+				else:
+					current.append(lit)
+
+			trail_pos += n_trail
+			change_pos += n_changes
+			nogood_pos += n_nogoods
+
+			yield kind, propagator, thread, level, trail, changes, nogoods
+
+	return literals, generate()
+
+
+class RecordingControl:
+	"""
+	Stands in for the PropagateControl object and remembers the nogoods the propagator adds
+	"""
+
+	__slots__ = ["control", "nogoods"]
+
+	def __init__(self, control) -> None:
+		self.control = control
+		self.nogoods: List[List[int]] = []
+
+	@property
+	def assignment(self):
+		return self.control.assignment
+
+	@property
+	def thread_id(self) -> int:
+		return self.control.thread_id
+
+	def add_nogood(self, clause, tag=False, lock=False) -> bool:
+		self.nogoods.append(list(clause))
+		return self.control.add_nogood(clause, tag=tag, lock=lock)
+
+	def __getattr__(self, name: str):
+		return getattr(self.control, name)
+
+
+class TraceRecorder:
+	"""
+	Wraps a propagator and records every propagate and check call into the Trace.
+	The trail is taken when the callback is entered, the nogoods once it returns.
+
+	Members:
+	propagator              -- The recorded propagator
+
+	index                   -- Index of the propagator in the trace
+	"""
+
+	def __init__(self, propagator, index: int) -> None:
+		self.propagator = propagator
+		self.index = index
+
+	def init(self, init) -> None:
+		Trace.add_atoms(init)
+		self.propagator.init(init)
+
+	def propagate(self, control, changes) -> None:
+		snapshot = Trace.snapshot(control.thread_id, control.assignment)
+		recording = RecordingControl(control)
+		self.propagator.propagate(recording, changes)
+		Trace.add_event(PROPAGATE, self.index, control.thread_id, snapshot, changes, recording.nogoods)
+
+	def check(self, control) -> None:
+		snapshot = Trace.snapshot(control.thread_id, control.assignment)
+		recording = RecordingControl(control)
+		self.propagator.check(recording)
+		Trace.add_event(CHECK, self.index, control.thread_id, snapshot, [], recording.nogoods)
+
+
+class TraceUndoRecorder(TraceRecorder):
+	"""
+	Recorder for propagators that also implement undo
+	"""
+
+	def undo(self, thread_id, assignment, changes) -> None:
+		Trace.add_event(UNDO, self.index, thread_id, Trace.snapshot(thread_id, assignment), changes, [])
+		self.propagator.undo(thread_id, assignment, changes)
+
+
+class TraceUndoWatcher:
+	"""
+	Watches every solver literal so that undo is called for every decision level the solver undoes.
+	The wrapped propagators only get undo for the levels where they had changes, which is not enough
+	to know which part of the previous trail is still valid
+	"""
+
+	def init(self, init) -> None:
+		for var in range(1, len(init.assignment) + 1):
+			init.add_watch(var)
+			init.add_watch(-var)
+
+	def propagate(self, control, changes) -> None:
+		pass
+
+	def undo(self, thread_id, assignment, changes) -> None:
+		Trace.backtrack(thread_id, assignment.decision_level)
+
+
+def recorder(propagator, index: int) -> Any:
+	"""
+	Wrap the propagator in a recorder, propagators that only work in init are not wrapped
+	"""
+	if not hasattr(propagator, "propagate"):
+		return propagator
+	if hasattr(propagator, "undo"):
+		return TraceUndoRecorder(propagator, index)
+	return TraceRecorder(propagator, index)
@@ -0,0 +1,172 @@
+import argparse
+import cProfile
+import pstats
+import time
+
+from collections import defaultdict
+from typing import Dict, List
+
+from untimed.mock import MockProgram, MockAssignment, MockPropagateInit, MockPropagateControl
+from untimed.microbench import latency_row
+from untimed.propagator.propagatorhandler import TheoryHandler, PROPAGATORS
+from untimed.propagator.theoryconstraint_data import TimeAtomToSolverLit, Signatures
+from untimed.propagator.trace import read_trace, UNDO, CHECK
+
+
+class Replayer:
+	"""
+	Drives the propagators of a MockProgram through a recorded trace.
+	Before every event the assignment is set to the recorded trail. The propagators get the literals
+	they watch that were assigned since the last event and undo for the ones that were unassigned,
+	so any watch type can follow the search of the recorded one.
+
+	Members:
+	fed                     -- Length of the part of the trail that was given to the propagators
+
+	latencies               -- Mapping from a callback name to the nanoseconds every call took
+
+	nogoods                 -- Amount of nogoods the propagators added
+
+	conflicts               -- Amount of events where a propagator found a conflict
+
+	recorded_nogoods        -- Amount of nogoods the recorded propagators added in the replayed events
+	"""
+
+	def __init__(self, program: MockProgram) -> None:
+		self.propagators = program.propagators
+		self.assignment = MockAssignment(program.size)
+
+		self.latencies: Dict[str, List[int]] = defaultdict(list)
+		self.conflicts = 0
+		self.recorded_nogoods = 0
+
+		inits = []
+		for propagator in self.propagators:
+			init = MockPropagateInit(program.theory_atoms, program.symbolic_atoms, self.assignment)
+			self.call("init", propagator.init, init)
+			inits.append(init)
+
+		self.controls = [MockPropagateControl(self.assignment, init.watches) for init in inits]
+
+		self.fed = len(self.assignment.trail)
+
+	@property
+	def nogoods(self) -> int:
+		return sum(control.nogoods for control in self.controls)
+
+	def call(self, name: str, func, *args) -> None:
+		start = time.perf_counter_ns()
+		func(*args)
+		self.latencies[name].append(time.perf_counter_ns() - start)
+
+	def event(self, kind: int, level: int, trail: List[int]) -> None:
+		keep, undone = self.assignment.sync(trail, level)
+		if keep < self.fed:
+			self.undo(undone[:self.fed - keep])
+			self.fed = keep
+
+		for control in self.controls:
+			control.conflict = False
+			control.implied = []
+
+		if kind == UNDO:
+			# the trail of an undo event is the one before backtracking, the next event shows the backtrack
+			return
+
+		self.propagate()
+
+		if kind == CHECK:
+			for propagator, control in zip(self.propagators, self.controls):
+				if hasattr(propagator, "check"):
+					self.call("check", propagator.check, control)
+
+		if any(control.conflict for control in self.controls):
+			self.conflicts += 1
+
+	def propagate(self) -> None:
+		new = self.assignment.trail[self.fed:]
+		self.fed = len(self.assignment.trail)
+		for propagator, control in zip(self.propagators, self.controls):
+			if not hasattr(propagator, "propagate"):
+				continue
+
+			changes = [lit for lit in new if lit in control.watches]
+			if changes:
+				self.call("propagate", propagator.propagate, control, changes)
+
+	def undo(self, undone: List[int]) -> None:
+		for propagator, control in zip(self.propagators, self.controls):
+			if not hasattr(propagator, "undo"):
+				continue
+
+			changes = [lit for lit in undone if lit in control.watches]
+			if changes:
+				self.call("undo", propagator.undo, control.thread_id, self.assignment, changes)
+
+
+def replay(path: str, watch_type: str, programs: List[str], thread: int = 0) -> Replayer:
+	"""
+	Replay the events of one solver thread of a trace into the propagators of the given watch type
+	"""
+	TimeAtomToSolverLit.reset()
+	Signatures.reset()
+
+	literals, events = read_trace(path)
+
+	program = MockProgram(programs, literals)
+	TheoryHandler(watch_type).register(program)
+
+	replayer = Replayer(program)
+	for kind, _, event_thread, level, trail, _, nogoods in events:
+		if event_thread != thread:
+			continue
+
+		replayer.recorded_nogoods += len(nogoods)
+		replayer.event(kind, level, trail)
+
+	return replayer
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Replay a trace recorded with --record-trace into the propagators "
+												 "of one or more watch types and report the latency of every callback.")
+	parser.add_argument("trace", help="trace file")
+	parser.add_argument("files", nargs="+", help="the programs the trace was recorded on")
+	parser.add_argument("--watch-types", default="timed", help="comma separated watch types")
+	parser.add_argument("--thread", type=int, default=0, help="solver thread to replay")
+	parser.add_argument("--profile", action="store_true", help="run the replay under cProfile and print the top functions")
+
+	args = parser.parse_args()
+
+	programs = []
+	for path in args.files:
+		with open(path) as program_file:
+			programs.append(program_file.read())
+
+	for watch_type in args.watch_types.split(","):
+		if watch_type not in PROPAGATORS:
+			parser.error(f"unknown watch type {watch_type}")
+
+		profile = cProfile.Profile() if args.profile else None
+
+		start = time.perf_counter()
+		if profile is not None:
+			profile.enable()
+		replayer = replay(args.trace, watch_type, programs, args.thread)
+		if profile is not None:
+			profile.disable()
+		total = time.perf_counter() - start
+
+		print(f"{watch_type}: {total:.3f}s nogoods {replayer.nogoods} (recorded {replayer.recorded_nogoods}) "
+			  f"conflicts {replayer.conflicts}")
+		print(f"{'callback':10}  {'calls':>8}  {'mean us':>10}  {'p50 us':>10}  {'p99 us':>10}  {'max us':>10}")
+		for name in ["init", "propagate", "undo", "check"]:
+			print(latency_row(name, replayer.latencies[name]))
+
+		if profile is not None:
+			pstats.Stats(profile).sort_stats("cumulative").print_stats(20)
+		print()
+
+
+if __name__ == "__main__":
+	main()
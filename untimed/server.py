@@ -0,0 +1,366 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import queue
+import resource
+import socketserver
+import sys
+import threading
+import time
+
+from typing import Any, Callable, Dict, List, Optional
+
+# requests are answered with one json object per line, every object has the id of its request and one of these types
+MODEL = "model"
+STATISTICS = "statistics"
+RESULT = "result"
+ERROR = "error"
+
+
+def run(request: Dict[str, Any], send: Callable[[Dict[str, Any]], None]) -> None:
+	"""
+	Solve one request and send its models, statistics and result
+
+	Request fields:
+	id                      -- Returned with every answer
+
+	files                   -- Files to load
+
+	programs                -- Program strings
+
+	watch_type              -- Watch type [timed]
+
+	models                  -- Amount of models, 0 for all [1]
+
+	arguments               -- Further clingo arguments
+
+	config                  -- Values for the GlobalConfig, e.g. {"lock_up_to": 3}
+
+	use_ids, partition, dispatch, heuristic, lock_ng  -- Same as the command line options
+
+	:param request: the request
+	:param send: function that sends an answer
+	"""
+	from untimed.solver import Solver
+
+	id = request.get("id")
+	try:
+		solver = Solver(request.get("files", []), request.get("programs", []),
+						watch_type=request.get("watch_type", "timed"),
+						lock_ng=request.get("lock_ng", -1),
+						use_ids=request.get("use_ids", False),
+						heuristic=request.get("heuristic", False),
+						partition=request.get("partition", False),
+						dispatch=request.get("dispatch", False),
+						arguments=[str(request.get("models", 1))] + list(request.get("arguments", [])),
+						**request.get("config", {}))
+
+		models = 0
+		for symbols in solver.models():
+			models += 1
+			send({"id": id, "type": MODEL, "number": models, "symbols": [str(symbol) for symbol in symbols]})
+
+		send({"id": id, "type": STATISTICS, "counts": solver.counts, "timers": solver.timers})
+		send({"id": id, "type": RESULT, "models": models})
+	except Exception as error:
+		# e.g. a bad config value, a missing file or an error of clingo, the client always gets an answer
+		send({"id": id, "type": ERROR, "error": str(error)})
+
+
+def work(conn) -> None:
+	"""
+	Loop of a worker process. Requests come in through the connection as (request, memory limit in bytes) pairs,
+	the answers go back through it followed by None once a request is finished.
+	The process stays alive between requests, so imports and the generated propagate functions are reused.
+	"""
+	_, hard = resource.getrlimit(resource.RLIMIT_AS)
+	while True:
+		message = conn.recv()
+		if message is None:
+			return
+
+		request, memory = message
+		try:
+			if memory is not None:
+				resource.setrlimit(resource.RLIMIT_AS, (memory, hard))
+			run(request, conn.send)
+		except Exception as error:
+			# the worker stays alive for the next request
+			conn.send({"id": request.get("id"), "type": ERROR, "error": str(error)})
+		finally:
+			if memory is not None:
+				resource.setrlimit(resource.RLIMIT_AS, (hard, hard))
+			conn.send(None)
+
+
+class Worker:
+	"""
+	Worker process with the connection to it
+
+	Members:
+	process                 -- The process, started again if it was killed
+
+	conn                    -- Connection to the process
+	"""
+
+	context = multiprocessing.get_context("spawn")
+
+	def __init__(self) -> None:
+		self.process = None
+		self.conn = None
+		self.start()
+
+	def start(self) -> None:
+		self.conn, child = Worker.context.Pipe()
+		self.process = Worker.context.Process(target=work, args=(child,), daemon=True)
+		self.process.start()
+
+	def restart(self) -> None:
+		self.process.kill()
+		self.process.join()
+		self.start()
+
+	def stop(self) -> None:
+		try:
+			self.conn.send(None)
+		except (BrokenPipeError, OSError):
+			pass
+		self.process.join(1)
+		if self.process.is_alive():
+			self.process.kill()
+
+
+class Server:
+	"""
+	Hands solve requests to a pool of worker processes. Every worker is fed by its own thread which forwards
+	the answers of the worker to the reply function of the request.
+	A worker that runs over the timeout of a request is killed and started again, the same happens
+	if it dies because of the memory limit.
+
+	Members:
+	timeout                 -- Default seconds per request, None for no limit
+
+	memory                  -- Default memory limit of the workers in megabytes, None for no limit
+
+	requests                -- Queue of (request, reply, done) triples, done is called once the request is answered
+	"""
+
+	def __init__(self, workers: int = 1, timeout: Optional[float] = None, memory: Optional[int] = None) -> None:
+		self.logger = logging.getLogger(self.__module__ + "." + self.__class__.__name__)
+
+		self.timeout = timeout
+		self.memory = memory
+
+		self.requests: queue.Queue = queue.Queue()
+		self.workers: List[Worker] = [Worker() for _ in range(workers)]
+		self.threads = [threading.Thread(target=self.feed, args=(worker,), daemon=True) for worker in self.workers]
+		for thread in self.threads:
+			thread.start()
+
+	def submit(self, request: Dict[str, Any], reply: Callable[[Dict[str, Any]], None],
+			   done: Optional[Callable[[], None]] = None) -> None:
+		self.requests.put((request, reply, done))
+
+	def join(self) -> None:
+		"""
+		Wait until all submitted requests are answered
+		"""
+		self.requests.join()
+
+	def close(self) -> None:
+		for _ in self.threads:
+			self.requests.put(None)
+		for thread in self.threads:
+			thread.join()
+		for worker in self.workers:
+			worker.stop()
+
+	def feed(self, worker: Worker) -> None:
+		while True:
+			item = self.requests.get()
+			if item is None:
+				self.requests.task_done()
+				return
+
+			request, reply, done = item
+			try:
+				self.handle(worker, request, reply)
+			except Exception as error:
+				# the worker may still be busy with the request, so it is started again
+				self.logger.exception(f"request {request.get('id')} failed")
+				worker.restart()
+				try:
+					reply({"id": request.get("id"), "type": ERROR, "error": f"internal error: {error}"})
+				except Exception:
+					self.logger.exception(f"could not reply to request {request.get('id')}")
+			finally:
+				if done is not None:
+					done()
+				self.requests.task_done()
+
+	def handle(self, worker: Worker, request: Dict[str, Any], reply: Callable[[Dict[str, Any]], None]) -> None:
+		timeout = request.get("timeout", self.timeout)
+		memory = request.get("memory", self.memory)
+
+		worker.conn.send((request, int(memory * 1024 * 1024) if memory is not None else None))
+
+		deadline = None if timeout is None else time.monotonic() + timeout
+		while True:
+			left = None if deadline is None else deadline - time.monotonic()
+			if left is not None and (left <= 0 or not worker.conn.poll(left)):
+				self.logger.info(f"request {request.get('id')} timed out after {timeout}s")
+				worker.restart()
+				reply({"id": request.get("id"), "type": ERROR, "error": "timeout"})
+				return
+
+			try:
+				answer = worker.conn.recv()
+			except EOFError:
+				self.logger.info(f"worker died on request {request.get('id')}")
+				worker.restart()
+				reply({"id": request.get("id"), "type": ERROR, "error": "worker died, e.g. the memory limit was reached"})
+				return
+
+			if answer is None:
+				return
+			reply(answer)
+
+
+class Pending:
+	"""
+	Counts the requests of one connection that are not answered yet
+	"""
+
+	def __init__(self) -> None:
+		self.count = 0
+		self.condition = threading.Condition()
+
+	def add(self) -> None:
+		with self.condition:
+			self.count += 1
+
+	def done(self) -> None:
+		with self.condition:
+			self.count -= 1
+			if self.count == 0:
+				self.condition.notify_all()
+
+	def join(self) -> None:
+		"""
+		Wait until all requests of the connection are answered
+		"""
+		with self.condition:
+			self.condition.wait_for(lambda: self.count == 0)
+
+
+def line_reply(stream, lock: threading.Lock) -> Callable[[Dict[str, Any]], None]:
+	"""
+	Reply function that writes every answer as one json line
+	"""
+	def reply(answer: Dict[str, Any]) -> None:
+		line = json.dumps(answer) + "\n"
+		with lock:
+			stream.write(line)
+			stream.flush()
+
+	return reply
+
+
+def check_request(request: Any) -> Optional[str]:
+	"""
+	:return: why the request can not be handed to a worker, None if it can
+	"""
+	if not isinstance(request, dict):
+		return "a request has to be a json object"
+
+	for name in ["timeout", "memory"]:
+		value = request.get(name)
+		if value is None:
+			continue
+		if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+			return f"{name} has to be a positive number"
+
+	return None
+
+
+def serve_lines(server: Server, lines, reply: Callable[[Dict[str, Any]], None],
+				pending: Optional[Pending] = None) -> None:
+	"""
+	Submit one request per json line, malformed lines and invalid requests are answered with an error
+	:param pending: counts the submitted requests that are not answered yet if given
+	"""
+	for line in lines:
+		if line.strip() == "":
+			continue
+		try:
+			request = json.loads(line)
+		except json.JSONDecodeError as error:
+			reply({"id": None, "type": ERROR, "error": f"invalid request: {error}"})
+			continue
+
+		problem = check_request(request)
+		if problem is not None:
+			id = request.get("id") if isinstance(request, dict) else None
+			reply({"id": id, "type": ERROR, "error": f"invalid request: {problem}"})
+			continue
+
+		if pending is None:
+			server.submit(request, reply)
+		else:
+			pending.add()
+			server.submit(request, reply, pending.done)
+
+
+class LineHandler(socketserver.StreamRequestHandler):
+	"""
+	Socket connection that sends json line requests, the answers are written back to the same connection.
+	The connection is closed once its own requests are answered, the requests of other connections are not waited for
+	"""
+
+	def handle(self) -> None:
+		lock = threading.Lock()
+
+		def reply(answer: Dict[str, Any]) -> None:
+			with lock:
+				try:
+					self.wfile.write((json.dumps(answer) + "\n").encode())
+				except (BrokenPipeError, ConnectionResetError):
+					pass
+
+		pending = Pending()
+		serve_lines(self.server.solve_server, (line.decode() for line in self.rfile), reply, pending)
+		pending.join()
+
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+	daemon_threads = True
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Solve requests given as json lines on stdin or on a unix socket "
+												 "with a pool of worker processes that stay alive between requests. "
+												 "The models, statistics and result of every request are written "
+												 "as json lines.")
+	parser.add_argument("--socket", help="path of a unix socket to listen on instead of stdin")
+	parser.add_argument("--workers", type=int, default=1, help="amount of worker processes")
+	parser.add_argument("--timeout", type=float, help="default seconds per request")
+	parser.add_argument("--memory", type=int, help="default memory limit of a worker in megabytes")
+
+	args = parser.parse_args()
+
+	server = Server(args.workers, args.timeout, args.memory)
+	try:
+		if args.socket is None:
+			serve_lines(server, sys.stdin, line_reply(sys.stdout, threading.Lock()))
+			server.join()
+		else:
+			with UnixServer(args.socket, LineHandler) as unix_server:
+				unix_server.solve_server = server
+				unix_server.serve_forever()
+	finally:
+		server.close()
+
+
+if __name__ == "__main__":
+	main()
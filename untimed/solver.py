@@ -0,0 +1,164 @@
+import copy
+import threading
+
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Sequence
+
+import clingo
+
+import untimed.util as util
+
+from untimed.propagator.propagatorhandler import TheoryHandler, add_theory
+from untimed.propagator.theoryconstraint_data import TimeAtomToSolverLit, Signatures, GlobalConfig, StatNames
+from untimed.propagator.theoryconstraint_data import ConflictActivity, TimeHeatmap
+from untimed.propagator.heuristic import TemporalHeuristic
+from untimed.propagator.selection import HybridConfig, AutoConfig
+from untimed.propagator.budget import GroundBudget
+from untimed.propagator.nogoodfile import NogoodExport
+from untimed.propagator.trace import Trace
+from untimed.propagator.profile import GroundProfile
+
+# classes that keep the state of a solve in class attributes. The list is maintained by hand,
+# a class that gets new state has to be added here or its state is shared by all solvers
+STATEFUL_CLASSES = [TimeAtomToSolverLit, Signatures, GlobalConfig, ConflictActivity, TimeHeatmap, TemporalHeuristic,
+					HybridConfig, AutoConfig, GroundBudget, NogoodExport, Trace, GroundProfile,
+					util.Timer, util.Count, util.Scope, util.Histogram, util.Timeline]
+
+
+def class_state(cls) -> Dict[str, Any]:
+	"""
+	The class attributes that hold data, methods, slots and thread locals are left out
+	"""
+	return {name: value for name, value in vars(cls).items()
+			if not name.startswith("__") and not callable(value)
+			and not isinstance(value, (staticmethod, classmethod, property, threading.local, type(util.Histogram.count)))}
+
+
+def capture() -> Dict[type, Dict[str, Any]]:
+	return {cls: class_state(cls) for cls in STATEFUL_CLASSES}
+
+
+def install(state: Dict[type, Dict[str, Any]]) -> None:
+	for cls, attributes in state.items():
+		for name, value in attributes.items():
+			setattr(cls, name, value)
+
+
+# state of the classes when this module is imported, every solver starts with a copy of it
+INITIAL_STATE = copy.deepcopy(capture())
+
+
+class Solver:
+	"""
+	Solves a program with the theory constraint propagators inside of a python program.
+	The propagators keep their data in class attributes. Every solver owns its own copy of them and
+	installs it while it works, so many solvers can be used one after another or side by side.
+
+	Limitations of this approach:
+	- The state is swapped under a lock of the whole process, so only one solver works at a time.
+	  Solvers in different threads take turns, they do not run in parallel. Use untimed.server
+	  to solve in parallel.
+	- Only the classes in STATEFUL_CLASSES are swapped. Other class attributes, e.g. of NogoodPool,
+	  and module globals like the cache of generated propagate functions are shared by all solvers.
+	- Every solver starts from INITIAL_STATE, the state when untimed.solver was imported.
+	  Changes made to the classes afterwards are not seen by new solvers, pass them as config instead.
+
+	Example:
+		solver = untimed.Solver(["instance.lp", "encoding.lp"], watch_type="2watch", arguments=["0"])
+		for model in solver.models():
+			print(model)
+
+	Members:
+	control                 -- The clingo Control object
+
+	state                   -- Class attributes of the stateful classes for this solver
+	"""
+
+	lock = threading.RLock()
+
+	def __init__(self, files: Sequence[str] = (), programs: Sequence[str] = (), watch_type: str = "timed",
+				 lock_ng: int = -1, use_ids: bool = False, heuristic: bool = False, partition: bool = False,
+				 dispatch: bool = False, arguments: Sequence[str] = (), **config) -> None:
+		"""
+		:param files: files to load
+		:param programs: program strings to add
+		:param arguments: command line arguments for clingo, e.g. the amount of models
+		:param config: values for the GlobalConfig of this solver, e.g. lock_up_to=3 or time_shards=2
+		"""
+		for name in config:
+			if name not in class_state(GlobalConfig):
+				raise ValueError(f"unknown config {name}")
+
+		self.state = copy.deepcopy(INITIAL_STATE)
+		self.control = clingo.Control(list(arguments), message_limit=0)
+
+		with self.active():
+			for name, value in config.items():
+				setattr(GlobalConfig, name, value)
+
+			for path in files:
+				self.control.load(path)
+			for program in programs:
+				self.control.add("base", [], program)
+
+			add_theory(self.control)
+
+			with util.Timer(StatNames.GROUND_TIMER_MSG.value):
+				self.control.ground([("base", [])])
+
+			self.handler = TheoryHandler(watch_type, lock_ng, clingo.Flag(use_ids), clingo.Flag(heuristic),
+										 clingo.Flag(partition), clingo.Flag(dispatch))
+			self.handler.register(self.control)
+
+	@contextmanager
+	def active(self):
+		"""
+		Install the state of this solver in the stateful classes, the previous state is installed again afterwards
+		"""
+		with Solver.lock:
+			previous = capture()
+			install(self.state)
+			try:
+				yield
+			finally:
+				self.state = capture()
+				install(previous)
+
+	def models(self) -> Iterator[List[clingo.Symbol]]:
+		"""
+		Solve and yield the shown symbols of every model. The search only continues when the next model is requested.
+		"""
+		with self.active():
+			handle = self.control.solve(yield_=True)
+
+		try:
+			while True:
+				with self.active():
+					handle.resume()
+					model = handle.model()
+					if model is None:
+						return
+					symbols = model.symbols(shown=True)
+
+				yield symbols
+		finally:
+			# closing the handle stops the search which can still call the propagators
+			with self.active(), handle:
+				handle.cancel()
+
+	def solve(self) -> List[List[clingo.Symbol]]:
+		return list(self.models())
+
+	@property
+	def counts(self) -> Dict[str, int]:
+		"""
+		Counts of this solver, see util.Count
+		"""
+		return dict(self.state[util.Count]["counts"])
+
+	@property
+	def timers(self) -> Dict[str, float]:
+		"""
+		Timers of this solver, see util.Timer
+		"""
+		return dict(self.state[util.Timer]["timers"])
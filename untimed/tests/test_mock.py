@@ -0,0 +1,295 @@
+import os
+import tempfile
+import unittest
+
+import json
+
+import clingo
+
+import untimed.util as util
+from untimed.mock import MockProgram, MockSolver, MockAssignment, MockPropagateInit, MockPropagateControl
+from untimed.propagator.dispatcher import ControlProxy
+from untimed.microbench import decision_sequence
+from untimed.propagator.propagatorhandler import TheoryHandler, add_theory
+from untimed.propagator.trace import Trace, read_trace
+from untimed.replay import replay
+from untimed.propagator.theoryconstraint_data import TimeAtomToSolverLit, Signatures, GlobalConfig, TimeHeatmap
+
+program = """
+#const maxtime = 6.
+time(0..maxtime).
+domain_ab(1..2).
+
+{a(V,T)} :- domain_ab(V), time(T).
+{b(V,T)} :- domain_ab(V), time(T).
+"""
+
+c = """&constraint(1,maxtime,id){+.a(1); +.a(2); +.b(1); +~b(1)}.
+	   &constraint(1,maxtime,id){+~b(2); -.a(2)}.
+	   &constraint(1,maxtime,id){+.a(2); +.b(1); -~a(1)}.
+	   &signature{++a(1) ; ++a(2) ; --a(1) ; --a(2) ; ++b(1) ; ++b(2) }."""
+
+c_reg = """:- a(1,T), a(2,T), b(1,T), b(1,T-1), time(T).
+		   :- b(2,T-1), not a(2,T), time(T).
+		   :- a(2,T), b(1,T), not a(1,T-1), time(T)."""
+
+
+root = os.path.join(os.path.dirname(__file__), "..", "..")
+hanoi = [os.path.join(root, "encodings", "hanoi-encoding-untimed.lp"), os.path.join(root, "test-instances", "hanoitest.lp")]
+
+
+class TrailChecker:
+	"""
+	Takes a trace snapshot in every callback and compares the rebuilt trail with the real one
+	"""
+
+	def __init__(self):
+		self.snapshots = 0
+		self.wrong = 0
+
+	def init(self, init):
+		# only some literals, so the solver often backjumps over several levels between two snapshots
+		for var in range(1, len(init.assignment) + 1, 50):
+			init.add_watch(var)
+
+	def compare(self, thread_id, assignment):
+		Trace.snapshot(thread_id, assignment)
+		self.snapshots += 1
+		if Trace.previous[thread_id][0] != list(assignment.trail):
+			self.wrong += 1
+
+	def propagate(self, control, changes):
+		self.compare(control.thread_id, control.assignment)
+
+	def undo(self, thread_id, assignment, changes):
+		self.compare(thread_id, assignment)
+
+	def check(self, control):
+		self.compare(control.thread_id, control.assignment)
+
+
+def is_model(programs, true_atoms, false_atoms):
+	prg = clingo.Control(message_limit=0)
+	for p in programs:
+		prg.add("base", [], p)
+	prg.add("base", [], "".join(f"{atom}." for atom in true_atoms))
+	prg.add("base", [], "".join(f":- {atom}." for atom in false_atoms))
+	prg.ground([("base", [])])
+
+	return prg.solve().satisfiable
+
+
+class TestMock(unittest.TestCase):
+
+	def replay(self, watch_type):
+		TimeAtomToSolverLit.reset()
+		Signatures.reset()
+
+		mock = MockProgram([program, c])
+		TheoryHandler(watch_type).register(mock)
+		solver = MockSolver(mock)
+
+		for lit in decision_sequence(mock, 40, 1):
+			solver.decide(lit)
+
+		# finish the assignment, a propagator that propagates every unit nogood never runs into a conflict here
+		for atom in mock.symbolic_atoms:
+			if not atom.is_fact:
+				self.assertTrue(solver.decide(-atom.literal) or solver.decide(atom.literal))
+
+		self.assertTrue(solver.check())
+		self.assertGreater(len(solver.latencies["propagate"]), 0)
+
+		true_atoms = [atom.symbol for atom in mock.symbolic_atoms
+					  if not atom.is_fact and solver.assignment.is_true(atom.literal)]
+		false_atoms = [atom.symbol for atom in mock.symbolic_atoms
+					   if not atom.is_fact and solver.assignment.is_false(atom.literal)]
+
+		self.assertTrue(is_model([program, c_reg], true_atoms, false_atoms))
+
+	def test_timed(self):
+		self.replay("timed")
+
+	def test_2watch(self):
+		self.replay("2watch")
+
+	def test_conseq(self):
+		self.replay("conseq")
+
+	def test_count(self):
+		self.replay("count")
+
+	def test_timeline(self):
+		util.Timeline.enable(16)
+		try:
+			self.replay("count")
+		finally:
+			util.Timeline.enabled = False
+
+		self.assertLess(len(util.Timeline.events), 16)
+		self.assertGreater(util.Timeline.stride, 1)
+		self.assertIn("init None", [name for name, _, _ in util.Timeline.phases])
+
+		with tempfile.TemporaryDirectory() as tmp:
+			path = os.path.join(tmp, "timeline.json")
+			util.Timeline.write(path)
+			with open(path) as timeline_file:
+				events = json.load(timeline_file)["traceEvents"]
+
+		self.assertTrue(all(event["ts"] >= 0 for event in events if "ts" in event))
+
+	def test_heatmap(self):
+		TimeHeatmap.reset()
+		TimeHeatmap.enabled = True
+		try:
+			self.replay("timed")
+		finally:
+			TimeHeatmap.enabled = False
+
+		totals = TimeHeatmap.totals()
+		self.assertGreater(sum(counts[TimeHeatmap.HIT] for counts in totals.values()), 0)
+		self.assertTrue(all(1 <= assigned_time <= 6 for assigned_time in totals))
+		self.assertGreater(len(TimeHeatmap.table()), 1)
+
+		# hot times at the start and the end
+		TimeHeatmap.reset()
+		for assigned_time, hits in enumerate([50, 40, 1, 1, 1, 1, 1, 30]):
+			TimeHeatmap.counts["None"][assigned_time][TimeHeatmap.HIT] = hits
+		self.assertEqual(TimeHeatmap.suggest(), (1, 0))
+		TimeHeatmap.reset()
+
+	def test_init_nogoods(self):
+		assignment = MockAssignment(4)
+		init = MockPropagateInit([], None, assignment)
+
+		# the nogood {2, 3} only becomes unit once 2 is true, then 3 has to be false
+		self.assertTrue(init.add_nogood([2, 3]))
+		self.assertTrue(init.add_clause([2]))
+		self.assertTrue(init.propagate())
+		self.assertTrue(init.assignment.is_true(2))
+
+		self.assertTrue(init.add_nogood([2, 3]))
+		self.assertTrue(init.add_nogood([-3, 4]))
+		self.assertTrue(init.propagate())
+		self.assertEqual(assignment.trail, [1, 2, -3])
+
+		self.assertFalse(init.add_nogood([2, -3]))
+		self.assertFalse(init.propagate())
+		self.assertEqual(len(init.clauses), 5)
+
+	def test_simplified_nogoods(self):
+		# a(1,2) and b(1,2) are facts, so the nogood of assigned time 2 is left with -a(2,2) and becomes a clause
+		TimeAtomToSolverLit.reset()
+		Signatures.reset()
+
+		facts = "a(1,2). b(1,2)."
+		mock = MockProgram([program, facts, """&constraint(1,maxtime){+.a(1); +.b(1); -.a(2)}.
+			&signature{++a(1) ; ++a(2) ; --a(2) ; ++b(1) }."""])
+		TheoryHandler("timed").register(mock)
+		solver = MockSolver(mock)
+
+		tcs = set(tc for propagator in mock.propagators for tcs in propagator.watch_to_tc.values() for tc in tcs)
+		self.assertEqual(len(tcs), 1)
+		tc = tcs.pop()
+
+		self.assertFalse(tc.is_valid_time(2))
+		self.assertEqual(sorted(tc.prepared), [1, 3, 4, 5, 6])
+		for assigned_time, ng in tc.prepared.items():
+			self.assertTrue(tc.is_valid_time(assigned_time))
+			self.assertEqual(tc.nogood_at(assigned_time), ng)
+			self.assertEqual(len(ng), 3)
+
+		# the clause is only propagated on request in the mock
+		self.assertTrue(solver.inits[0].propagate())
+		for atom in mock.symbolic_atoms:
+			if not atom.is_fact:
+				self.assertTrue(solver.decide(atom.literal) or solver.decide(-atom.literal))
+		self.assertTrue(solver.check())
+
+		true_atoms = [atom.symbol for atom in mock.symbolic_atoms
+					  if not atom.is_fact and solver.assignment.is_true(atom.literal)]
+		false_atoms = [atom.symbol for atom in mock.symbolic_atoms
+					   if not atom.is_fact and solver.assignment.is_false(atom.literal)]
+		self.assertTrue(is_model([program, facts, ":- a(1,T), b(1,T), not a(2,T), time(T)."], true_atoms, false_atoms))
+
+	def test_dispatch_threads(self):
+		TimeAtomToSolverLit.reset()
+		Signatures.reset()
+		GlobalConfig.time_shards = 2
+		try:
+			mock = MockProgram([program, c])
+			TheoryHandler("2watch", dispatch=clingo.Flag(True)).register(mock)
+		finally:
+			GlobalConfig.time_shards = 1
+
+		dispatch, = mock.propagators
+		assignment = MockAssignment(mock.size)
+		init = MockPropagateInit(mock.theory_atoms, mock.symbolic_atoms, assignment, number_of_threads=2)
+		dispatch.init(init)
+		self.assertEqual(len(dispatch.indexes), 2)
+		self.assertEqual(dispatch.indexes[0].owners, dispatch.indexes[1].owners)
+
+		# a watch removed by one thread is still routed in the other one
+		lit = next(lit for lit, owners in dispatch.indexes[0].owners.items() if owners)
+		prop = dispatch.indexes[0].owners[lit][0]
+		proxy = ControlProxy(MockPropagateControl(assignment, set(init.watches), thread_id=0), dispatch.indexes[0])
+		proxy.prop = prop
+		proxy.remove_watch(lit)
+
+		self.assertNotIn(prop, dispatch.route(0, [lit]))
+		self.assertIn(prop, dispatch.route(1, [lit]))
+
+	def test_trace_replay(self):
+		with tempfile.TemporaryDirectory() as tmp:
+			path = os.path.join(tmp, "trace.npz")
+
+			TimeAtomToSolverLit.reset()
+			Signatures.reset()
+			GlobalConfig.record_trace = path
+			try:
+				prg = clingo.Control(["20"], message_limit=0)
+				prg.add("base", [], program + c)
+				add_theory(prg)
+				prg.ground([("base", [])])
+				TheoryHandler("timed").register(prg)
+				prg.solve()
+			finally:
+				GlobalConfig.record_trace = None
+			Trace.write(path)
+
+			literals, events = read_trace(path)
+			events = list(events)
+			self.assertGreater(len(events), 0)
+
+			for watch_type in ["timed", "2watch", "count"]:
+				replayer = replay(path, watch_type, [program, c])
+				self.assertGreater(len(replayer.latencies["propagate"]), 0)
+				# every watch type adds a nogood where the recorded timed propagator added one
+				self.assertGreater(replayer.recorded_nogoods, 0)
+				self.assertEqual(replayer.nogoods, replayer.recorded_nogoods)
+
+	def test_trace_snapshots(self):
+		TimeAtomToSolverLit.reset()
+		Signatures.reset()
+		GlobalConfig.record_trace = "unused"
+		try:
+			# frequent restarts decide the same literals again with other consequences
+			prg = clingo.Control(["--restarts=F,3"], message_limit=0)
+			for path in hanoi:
+				prg.load(path)
+			add_theory(prg)
+			prg.ground([("base", [])])
+			TheoryHandler("timed").register(prg)
+			checker = TrailChecker()
+			prg.register_propagator(checker)
+			prg.solve()
+		finally:
+			GlobalConfig.record_trace = None
+
+		self.assertGreater(prg.statistics["solving"]["solvers"]["conflicts"], 0)
+		self.assertGreater(checker.snapshots, 0)
+		self.assertEqual(checker.wrong, 0)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,61 @@
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from untimed.portfolio import split_portfolio_args, run_portfolio
+from untimed.tests.test_solver import program, c
+
+
+class TestPortfolio(unittest.TestCase):
+
+	def test_split(self):
+		self.assertEqual(split_portfolio_args(["--portfolio=timed,2watch", "a.lp", "0"]),
+						 (["timed", "2watch"], ["a.lp", "0"]))
+		self.assertEqual(split_portfolio_args(["a.lp", "--portfolio", "timed,2watch", "0"]),
+						 (["timed", "2watch"], ["a.lp", "0"]))
+		self.assertEqual(split_portfolio_args(["--watch-type", "naive", "--portfolio=timed", "a.lp"]),
+						 (["timed"], ["a.lp"]))
+		self.assertEqual(split_portfolio_args(["--watch-type=naive", "a.lp", "--stats"]),
+						 (None, ["a.lp", "--stats"]))
+
+	def portfolio(self, watch_types, args):
+		out = io.StringIO()
+		with contextlib.redirect_stdout(out):
+			code = run_portfolio(watch_types, args)
+
+		return code, out.getvalue()
+
+	def test_run(self):
+		with tempfile.TemporaryDirectory() as tmp:
+			path = os.path.join(tmp, "program.lp")
+			with open(path, "w") as program_file:
+				program_file.write(program + c)
+
+			code, out = self.portfolio(["timed", "2watch"], [path, "0"])
+
+		self.assertIn(code, (10, 30))
+		self.assertRegex(out, r"Portfolio winner +: +(timed|2watch)")
+
+	def test_other_children(self):
+		# a child of the caller that stops first keeps its exit code
+		child = subprocess.Popen([sys.executable, "-c", "import sys; sys.exit(7)"])
+		try:
+			code, out = self.portfolio(["timed"], ["does-not-exist.lp"])
+		finally:
+			self.assertEqual(child.wait(), 7)
+
+		self.assertRegex(out, r"Portfolio winner +: +no result")
+
+	def test_no_result(self):
+		code, out = self.portfolio(["timed", "2watch"], ["does-not-exist.lp"])
+
+		self.assertNotIn(code, (10, 20, 30))
+		self.assertRegex(out, r"Portfolio winner +: +no result")
+
+
+if __name__ == "__main__":
+	unittest.main()
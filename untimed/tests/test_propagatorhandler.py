@@ -1,8 +1,19 @@
+import os
+import tempfile
+import types
 import unittest
 from untimed.propagator.propagatorhandler import TheoryHandler, add_theory
-from untimed.propagator.theoryconstraint_data import TimeAtomToSolverLit, Signatures
+from untimed.propagator.theoryconstraint_data import TimeAtomToSolverLit, Signatures, GlobalConfig, TimeHeatmap
+from untimed.propagator.theoryconstraint_data import StatNames, ConflictActivity
+from untimed.propagator.profile import GroundProfile, assign_profile_ats
+from untimed.propagator.heuristic import TemporalHeuristic
+from untimed.propagator.selection import HybridConfig
+from untimed.propagator.pool import NogoodPool
+from untimed.propagator.nogoodfile import NogoodExport
+import untimed.util as util
 
 import clingo
+import numpy as np
 
 program = """
 #const maxtime = 3.
@@ -180,6 +191,496 @@ class TestApp(unittest.TestCase):
 
 		self.handler_test(handler_class, handler_args)
 
+	def test_ground_ids(self):
+		print("\nrunning ground with ids")
+		self.reset_mappings()
+		handler_class = TheoryHandler
+		handler_args = {"prop_type": "ground", "use_ids": clingo.Flag(True)}
+
+		self.handler_test(handler_class, handler_args)
+		self.groups_test(handler_class, handler_args)
+
+	def test_ground_partition(self):
+		print("\nrunning ground with constraints partitioned by shared atoms")
+		self.reset_mappings()
+		handler_class = TheoryHandler
+		handler_args = {"prop_type": "ground", "partition": clingo.Flag(True)}
+
+		self.handler_test(handler_class, handler_args)
+		self.groups_test(handler_class, handler_args)
+
+	def groups_test(self, handler_class, handler_args):
+		"""
+		constraints with two ids that do not share any atom, so there are also two components
+		"""
+		c = """&constraint(1,maxtime,first){+.a(1); +.b(1); +~b(1)}.
+			   &constraint(1,maxtime,second){+~b(2); -.a(2)}.
+			   &signature{++a(1) ; ++a(2) ; --a(2) ; ++b(1) ; ++b(2) }."""
+		c_reg = """:- a(1,T), b(1,T), b(1,T-1), time(T).
+				   :- b(2,T-1), not a(2,T), time(T)."""
+
+		self.reset_mappings()
+		util.Count.counts.pop(StatNames.COMPONENTS_MSG.value, None)
+		self.assertEqual(solve([program, c], handler_class, handler_args), solve_regular([program, c_reg]))
+
+		if handler_args.get("partition"):
+			self.assertEqual(util.Count.counts[StatNames.COMPONENTS_MSG.value], 2)
+
+	def test_timed_heuristic(self):
+		print("\nrunning timed with heuristic")
+		self.reset_mappings()
+		handler_class = TheoryHandler
+		handler_args = {"prop_type": "timed", "heuristic": clingo.Flag(True)}
+
+		self.handler_test(handler_class, handler_args)
+		self.assertTrue(ConflictActivity.enabled)
+
+		# a later program without the heuristic does not bump the activity anymore
+		self.reset_mappings()
+		solve([program_no_dom, "&constraint(1,maxtime,id){+.a()}. &signature{++a()}."], handler_class,
+			  {"prop_type": "timed"})
+		self.assertFalse(ConflictActivity.enabled)
+
+	def test_conflict_activity_signs(self):
+		print("\nconflict activity of a nogood with a negative literal")
+		self.reset_mappings()
+		Signatures.fullsig_size = 4
+		# a(1,1) and a(2,1) are only mapped as positive atoms
+		TimeAtomToSolverLit.add(5, 7)
+		TimeAtomToSolverLit.add(6, 8)
+		try:
+			ConflictActivity.reset()
+			ConflictActivity.enabled = True
+			ConflictActivity.bump([7, -8])
+		finally:
+			ConflictActivity.enabled = False
+
+		self.assertEqual(sorted(ConflictActivity.activity), [-6, 5])
+		self.assertNotIn(-8, TimeAtomToSolverLit.lit_to_id)
+
+		heuristic = TemporalHeuristic()
+		heuristic.rebuild_order()
+		# the decisions satisfy the nogood, so -a(2,1) is made false
+		self.assertEqual(sorted(heuristic.order), [-8, 7])
+
+		ConflictActivity.reset()
+
+	def test_auto(self):
+		print("\nrunning auto")
+		self.reset_mappings()
+		handler_class = TheoryHandler
+		handler_args = {"prop_type": "auto"}
+
+		util.Count.counts.pop("Auto watch type ground", None)
+		self.handler_test(handler_class, handler_args)
+
+		# the test instances are small, so the rule table grounds them completely
+		self.assertGreater(util.Count.counts["Auto watch type ground"], 0)
+
+	def test_timed_shards(self):
+		print("\nrunning timed with time shards")
+		self.reset_mappings()
+		handler_class = TheoryHandler
+		handler_args = {"prop_type": "timed"}
+
+		GlobalConfig.time_shards = 2
+		GlobalConfig.eager_shards = {1}
+		try:
+			self.handler_test(handler_class, handler_args)
+		finally:
+			GlobalConfig.time_shards = 1
+			GlobalConfig.eager_shards = set()
+
+	def test_2watch_shards(self):
+		print("\nrunning 2watch with time shards")
+		self.reset_mappings()
+		handler_class = TheoryHandler
+		handler_args = {"prop_type": "2watch"}
+
+		GlobalConfig.time_shards = 3
+		try:
+			self.handler_test(handler_class, handler_args)
+		finally:
+			GlobalConfig.time_shards = 1
+
+	def test_timed_partition(self):
+		print("\nrunning timed with constraints partitioned by shared atoms")
+		self.reset_mappings()
+		handler_class = TheoryHandler
+		handler_args = {"prop_type": "timed", "partition": clingo.Flag(True)}
+
+		self.handler_test(handler_class, handler_args)
+
+	def test_2watch_ids(self):
+		print("\nrunning 2watch with a propagator per id")
+		self.reset_mappings()
+		handler_class = TheoryHandler
+		handler_args = {"prop_type": "2watch", "use_ids": clingo.Flag(True)}
+
+		self.handler_test(handler_class, handler_args)
+
+	def test_2watch_dispatch(self):
+		print("\nrunning 2watch with one dispatcher for all ids and shards")
+		self.reset_mappings()
+		handler_class = TheoryHandler
+		handler_args = {"prop_type": "2watch", "use_ids": clingo.Flag(True), "dispatch": clingo.Flag(True)}
+
+		GlobalConfig.time_shards = 2
+		try:
+			self.handler_test(handler_class, handler_args)
+		finally:
+			GlobalConfig.time_shards = 1
+
+	def test_count_dispatch(self):
+		print("\nrunning count with one dispatcher for all components")
+		self.reset_mappings()
+		handler_class = TheoryHandler
+		handler_args = {"prop_type": "count", "partition": clingo.Flag(True), "dispatch": clingo.Flag(True)}
+
+		self.handler_test(handler_class, handler_args)
+
+	def test_timed_budget(self):
+		print("\nrunning timed with a clause budget for eager grounding")
+		self.reset_mappings()
+		handler_class = TheoryHandler
+		handler_args = {"prop_type": "timed"}
+
+		GlobalConfig.ground_budget_clauses = 3
+		try:
+			self.handler_test(handler_class, handler_args)
+		finally:
+			GlobalConfig.ground_budget_clauses = -1
+
+	def test_2watch_budget(self):
+		print("\nrunning 2watch with a memory budget for eager grounding")
+		self.reset_mappings()
+		handler_class = TheoryHandler
+		handler_args = {"prop_type": "2watch"}
+
+		GlobalConfig.ground_budget_memory = 200
+		try:
+			self.handler_test(handler_class, handler_args)
+		finally:
+			GlobalConfig.ground_budget_memory = -1
+
+	def test_timed_binary(self):
+		print("\nrunning timed with the binary engine for size 2 constraints")
+		self.reset_mappings()
+		handler_class = TheoryHandler
+		handler_args = {"prop_type": "timed"}
+
+		self.binary_test(handler_class, handler_args)
+
+	def test_2watch_binary(self):
+		print("\nrunning 2watch with the binary engine for size 2 constraints")
+		self.reset_mappings()
+		handler_class = TheoryHandler
+		handler_args = {"prop_type": "2watch"}
+
+		self.binary_test(handler_class, handler_args)
+
+	def binary_test(self, handler_class, handler_args):
+		GlobalConfig.binary_engine = True
+		util.Count.counts.pop(StatNames.BINARY_COUNT_MSG.value, None)
+		try:
+			self.handler_test(handler_class, handler_args)
+		finally:
+			GlobalConfig.binary_engine = False
+
+		self.assertGreater(util.Count.counts[StatNames.BINARY_COUNT_MSG.value], 0)
+
+	def test_simplify(self):
+		print("\nrunning timed and 2watch with nogoods that are shortened by facts")
+		# a(1,2) is a fact and b(3,_) does not exist, so the nogood at time 2 of the first constraint
+		# shrinks to size 2 and the nogoods of the second constraint are dead
+		facts = "a(1,2)."
+		c = """&constraint(1,maxtime){+.a(1); +.b(1); -.a(2)}.
+			   &constraint(1,maxtime){+.b(3); +.a(2)}.
+			   &signature{++a(1) ; ++a(2) ; --a(2) ; ++b(1) ; ++b(3) }."""
+		c_reg = """:- a(1,T), b(1,T), not a(2,T), time(T)."""
+
+		GlobalConfig.binary_engine = True
+		try:
+			for watch_type in ["timed", "2watch"]:
+				self.reset_mappings()
+				util.Count.counts.pop(StatNames.SIMPLIFY_BINARY_MSG.value, None)
+				util.Count.counts.pop(StatNames.SIMPLIFY_DEAD_MSG.value, None)
+
+				self.assertEqual(solve([program, facts, c], TheoryHandler, {"prop_type": watch_type}),
+								 solve_regular([program, facts, c_reg]))
+
+				self.assertEqual(util.Count.counts[StatNames.SIMPLIFY_BINARY_MSG.value], 1)
+				self.assertEqual(util.Count.counts[StatNames.SIMPLIFY_DEAD_MSG.value], 3)
+		finally:
+			GlobalConfig.binary_engine = False
+
+	def test_2watch_pool(self):
+		print("\nrunning 2watch with the nogoods formed in a process pool")
+		self.reset_mappings()
+		handler_class = TheoryHandler
+		handler_args = {"prop_type": "2watch"}
+
+		self.pool_test(handler_class, handler_args)
+
+	def test_ground_pool(self):
+		print("\nrunning ground with the nogoods formed in a process pool")
+		self.reset_mappings()
+		handler_class = TheoryHandler
+		handler_args = {"prop_type": "ground"}
+
+		self.pool_test(handler_class, handler_args)
+
+	def pool_test(self, handler_class, handler_args):
+		min_constraints = NogoodPool.min_constraints
+		NogoodPool.min_constraints = 1
+		GlobalConfig.init_workers = 2
+		util.Count.counts.pop(StatNames.POOL_COUNT_MSG.value, None)
+		try:
+			self.handler_test(handler_class, handler_args)
+		finally:
+			NogoodPool.min_constraints = min_constraints
+			GlobalConfig.init_workers = 0
+
+		self.assertGreater(util.Count.counts[StatNames.POOL_COUNT_MSG.value], 0)
+
+	def test_ground_export_import(self):
+		print("\nrunning ground with exported and imported nogoods")
+		handler_class = TheoryHandler
+		handler_args = {"prop_type": "ground"}
+
+		programs = [program, """{ c((a(D),b(D)),T) : domain_ab(D), domain_ab(D)} 1 :- time(T).""",
+					"""&constraint(1,maxtime,id){+.a(1); +.a(2); +.b(1); +~b(1)}.
+					&constraint(1,maxtime,id){+~b(2); -.a(2)}.
+					&constraint(1,maxtime,id){+.c((a(D),b(D))); -~a(D); -~b(D)} :- domain_ab(D).
+					&signature{++a(1) ; ++a(2) ; --a(D) ; ++b(1) ; ++b(2) ; --b(D)} :- domain_ab(D).
+					&signature{++c((a(D),b(D)))} :- domain_ab(D)."""]
+		programs_reg = programs[:2] + [""":- a(1,T), a(2,T), b(1,T), b(1,T-1), time(T).
+				   :- b(2,T-1), not a(2,T), time(T).
+				   :- c((a(D),b(D)),T), not a(D,T-1), not b(D,T-1), domain_ab(D), time(T)."""]
+
+		with tempfile.TemporaryDirectory() as tmp:
+			path = os.path.join(tmp, "nogoods.npz")
+			try:
+				self.reset_mappings()
+				GlobalConfig.export_nogoods = path
+				self.assertEqual(solve(programs, handler_class, handler_args), solve_regular(programs_reg))
+				GlobalConfig.export_nogoods = None
+
+				self.reset_mappings()
+				GlobalConfig.import_nogoods = path
+				self.assertEqual(solve(programs, handler_class, handler_args), solve_regular(programs_reg))
+
+				# the heuristic is also used with imported nogoods
+				self.reset_mappings()
+				self.assertEqual(solve(programs, handler_class, dict(handler_args, heuristic=clingo.Flag(True))),
+								 solve_regular(programs_reg))
+				self.assertTrue(ConflictActivity.enabled)
+			finally:
+				GlobalConfig.export_nogoods = None
+				GlobalConfig.import_nogoods = None
+
+	def test_export_without_atom(self):
+		print("\nrunning the export of a clause with a literal that has no atom")
+		with tempfile.TemporaryDirectory() as tmp:
+			path = os.path.join(tmp, "nogoods.npz")
+
+			NogoodExport.reset()
+			NogoodExport.clauses = [[2, -3], [2, 99]]
+			NogoodExport.lit_to_atom = {2: 0, 3: 1}
+			NogoodExport.atoms = ["a(1,1)", "b(1,1)"]
+			util.Count.counts.pop(StatNames.EXPORT_SKIPPED_MSG.value, None)
+			NogoodExport.finish(path)
+
+			with np.load(path) as data:
+				self.assertEqual(data["literals"].tolist(), [1, -2])
+				self.assertEqual(data["offsets"].tolist(), [0, 2])
+
+		self.assertEqual(util.Count.counts[StatNames.EXPORT_SKIPPED_MSG.value], 1)
+		NogoodExport.reset()
+
+	def test_timed_ground_profile(self):
+		print("\nrunning timed with a ground profile of an earlier run")
+		handler_class = TheoryHandler
+		handler_args = {"prop_type": "timed"}
+
+		programs = [program, """&constraint(1,maxtime,first){+.a(1); +.a(2); +.b(1); +~b(1)}.
+					&constraint(1,maxtime,second){+~b(2); -.a(2)}.
+					&signature{++a(1) ; ++a(2) ; --a(1) ; --a(2) ; ++b(1) ; ++b(2) }."""]
+		programs_reg = [program, """:- a(1,T), a(2,T), b(1,T), b(1,T-1), time(T).
+					:- b(2,T-1), not a(2,T), time(T)."""]
+
+		rate = GroundProfile.rate
+		with tempfile.TemporaryDirectory() as tmp:
+			path = os.path.join(tmp, "profile.json")
+			try:
+				GlobalConfig.ground_profile = path
+				GroundProfile.rate = 0
+				TimeHeatmap.enabled = True
+
+				for run in range(2):
+					self.reset_mappings()
+					TimeHeatmap.reset()
+					GroundProfile.load(path)
+					eager = util.Count.counts[StatNames.PROFILE_EAGER_MSG.value]
+
+					self.assertEqual(solve(programs, handler_class, handler_args), solve_regular(programs_reg))
+
+					GroundProfile.update()
+					GroundProfile.write(path)
+
+				self.assertEqual(GroundProfile.runs, 2)
+				self.assertEqual(sorted(GroundProfile.ids.keys()), ["first", "second"])
+				# the second run grounds every bucket that was propagated in the first one
+				self.assertGreater(util.Count.counts[StatNames.PROFILE_EAGER_MSG.value], eager)
+			finally:
+				GlobalConfig.ground_profile = None
+				GroundProfile.rate = rate
+				TimeHeatmap.enabled = False
+				TimeHeatmap.reset()
+
+	def test_ground_profile_decay(self):
+		print("\nground profile buckets decay and become lazy again")
+		rate, resample_every, buckets = GroundProfile.rate, GroundProfile.resample_every, GroundProfile.buckets
+		try:
+			GroundProfile.reset()
+			GroundProfile.rate = 0.3
+			GroundProfile.resample_every = 2
+			GroundProfile.buckets = 1
+			GroundProfile.last_times = {"id": 5}
+
+			def run(hits, units):
+				TimeHeatmap.reset()
+				TimeHeatmap.counts["id"] = {1: [hits, units, 0]}
+				GroundProfile.hot = {"id": GroundProfile.hot_buckets("id")}
+				GroundProfile.update()
+				return GroundProfile.hot["id"][0]
+
+			self.assertFalse(run(10, 5))
+			self.assertEqual(GroundProfile.ids["id"]["hits"], [10])
+			# eager for resample_every runs, the counts are kept
+			self.assertTrue(run(0, 0))
+			self.assertTrue(run(0, 0))
+			self.assertEqual(GroundProfile.ids["id"]["hits"], [10])
+			# propagated again, the old counts decay
+			self.assertFalse(run(10, 0))
+			self.assertEqual(GroundProfile.ids["id"]["hits"], [15])
+			self.assertEqual(GroundProfile.ids["id"]["units"], [2.5])
+			# 2.5 / 15 is below the rate, so the bucket stays lazy
+			self.assertFalse(run(10, 0))
+		finally:
+			GroundProfile.rate, GroundProfile.resample_every, GroundProfile.buckets = rate, resample_every, buckets
+			GroundProfile.reset()
+			TimeHeatmap.reset()
+
+	def test_ground_profile_windows(self):
+		print("\nground profile of constraints with the same id and other windows")
+		rate, buckets = GroundProfile.rate, GroundProfile.buckets
+		try:
+			GlobalConfig.ground_profile = "unused"
+			GroundProfile.reset()
+			GroundProfile.rate = 0.5
+			GroundProfile.buckets = 2
+
+			def constraints():
+				return [types.SimpleNamespace(id="id", size=3, min_time=1, max_time=max_time, last_time=max_time,
+											  eager_ats=0) for max_time in [9, 19]]
+
+			assign_profile_ats(constraints())
+			TimeHeatmap.counts["id"] = {12: [2, 2, 0]}
+			GroundProfile.update()
+			self.assertEqual(GroundProfile.ids["id"]["units"], [0, 2])
+			self.assertEqual(GroundProfile.ids["id"]["last_time"], 19)
+
+			# the assigned times of both constraints are put into buckets relative to the last time 19
+			short, long = constraints()
+			assign_profile_ats([short, long])
+			self.assertEqual(short.eager_ats, 0)
+			self.assertEqual([at for at in range(20) if util.is_bit_true(long.eager_ats, at)], list(range(10, 20)))
+		finally:
+			GlobalConfig.ground_profile = None
+			GroundProfile.rate, GroundProfile.buckets = rate, buckets
+			GroundProfile.reset()
+			TimeHeatmap.reset()
+
+	def test_check_heatmap(self):
+		print("\nrunning check and conseq with the heatmap")
+		programs = [program, """&constraint(1,maxtime,first){+.a(1); +.a(2); +.b(1); +~b(1)}.
+					&constraint(1,maxtime,first){+~b(2); -.a(2)}.
+					&signature{++a(1) ; ++a(2) ; --a(1) ; --a(2) ; ++b(1) ; ++b(2) }."""]
+		programs_reg = [program, """:- a(1,T), a(2,T), b(1,T), b(1,T-1), time(T).
+					:- b(2,T-1), not a(2,T), time(T)."""]
+
+		TimeHeatmap.enabled = True
+		try:
+			for watch_type in ["check", "conseq"]:
+				self.reset_mappings()
+				TimeHeatmap.reset()
+				self.assertEqual(solve(programs, TheoryHandler, {"prop_type": watch_type}), solve_regular(programs_reg))
+
+				totals = TimeHeatmap.totals()
+				if watch_type == "check":
+					# the check propagator only finds conflicts in check
+					self.assertGreater(sum(counts[TimeHeatmap.CONFLICT] for counts in totals.values()), 0)
+				else:
+					self.assertGreater(sum(counts[TimeHeatmap.UNIT] for counts in totals.values()), 0)
+		finally:
+			TimeHeatmap.enabled = False
+			TimeHeatmap.reset()
+
+	def test_stats_tree(self):
+		print("\nrunning 2watch with ids and the statistics tree")
+		self.reset_mappings()
+		util.Scope.counts.clear()
+		util.Histogram.histograms.clear()
+
+		programs = [program, """&constraint(1,maxtime,first){+.a(1); +.a(2); +.b(1); +~b(1)}.
+					&constraint(1,maxtime,second){+~b(2); -.a(2)}.
+					&signature{++a(1) ; ++a(2) ; --a(1) ; --a(2) ; ++b(1) ; ++b(2) }."""]
+
+		prg = clingo.Control(["0", "--stats"], message_limit=0)
+		for p in programs:
+			prg.add("base", [], p)
+		add_theory(prg)
+		prg.ground([("base", [])])
+		TheoryHandler("2watch", use_ids=clingo.Flag(True)).register(prg)
+		prg.solve(on_statistics=lambda step, accu: util.print_stats(step, accu))
+
+		# the flat statistics have unpadded names and the watches of every propagator
+		accu = prg.statistics["user_accu"]
+		self.assertIn(StatNames.INIT_TIMER_MSG.value, accu)
+		for name in ["first", "second"]:
+			self.assertGreater(accu[f"{StatNames.WATCHES_COUNT_MSG.value} {name}"], 0)
+
+		propagators = prg.statistics["user_accu"]["Propagators"]
+		self.assertEqual(sorted(propagators.keys()), ["first", "second"])
+		for name in ["first", "second"]:
+			self.assertEqual(propagators[name]["Init calls"], 1)
+			self.assertGreater(propagators[name]["Threads"][0]["Propagate calls"], 0)
+
+			latency = propagators[name]["Propagate latency"]
+			self.assertLessEqual(latency["p50"], latency["p90"])
+			self.assertLessEqual(latency["p99"], latency["max"])
+
+	def test_hybrid(self):
+		print("\nrunning hybrid")
+		self.reset_mappings()
+		handler_class = TheoryHandler
+		handler_args = {"prop_type": "hybrid"}
+
+		self.handler_test(handler_class, handler_args)
+
+	def test_hybrid_2watch(self):
+		print("\nrunning hybrid with every size N constraint on 2watch")
+		self.reset_mappings()
+		handler_class = TheoryHandler
+		handler_args = {"prop_type": "hybrid"}
+
+		long_window = HybridConfig.long_window
+		HybridConfig.long_window = 0
+		try:
+			self.handler_test(handler_class, handler_args)
+		finally:
+			HybridConfig.long_window = long_window
 
 	def handler_test(self, handler_class, handler_args):
 
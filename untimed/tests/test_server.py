@@ -0,0 +1,147 @@
+import json
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from untimed.server import Server, UnixServer, LineHandler, serve_lines, run, work, MODEL, STATISTICS, RESULT, ERROR
+from untimed.tests.test_solver import program, c, c_reg, solve_regular, parse_models
+
+hard = """
+#const n = 14.
+p(1..n).
+h(1..n-1).
+{in(P,H)} :- p(P), h(H).
+:- p(P), not in(P,_).
+:- in(P,H), in(Q,H), P < Q.
+"""
+
+
+class TestServer(unittest.TestCase):
+
+	def setUp(self):
+		self.server = Server(workers=2)
+		self.lock = threading.Lock()
+		self.answers = []
+
+	def tearDown(self):
+		self.server.close()
+
+	def reply(self, answer):
+		with self.lock:
+			self.answers.append(answer)
+
+	def of(self, id, type):
+		return [answer for answer in self.answers if answer["id"] == id and answer["type"] == type]
+
+	def test_requests(self):
+		expected = solve_regular([program, c_reg])
+
+		for id, watch_type in enumerate(["timed", "2watch", "timed"]):
+			self.server.submit({"id": id, "programs": [program, c], "watch_type": watch_type, "models": 0}, self.reply)
+		self.server.submit({"id": "bad", "programs": [program, c], "config": {"lock_until": 3}}, self.reply)
+		self.server.join()
+
+		for id in range(3):
+			self.assertEqual(parse_models(answer["symbols"] for answer in self.of(id, MODEL)), expected)
+			self.assertEqual(self.of(id, RESULT)[0]["models"], len(expected))
+			self.assertGreater(self.of(id, STATISTICS)[0]["counts"]["Theory constraints"], 0)
+
+		self.assertEqual(len(self.of("bad", ERROR)), 1)
+
+	def test_timeout(self):
+		self.server.submit({"id": "slow", "programs": [hard], "timeout": 0.5}, self.reply)
+		self.server.join()
+		self.assertEqual(self.of("slow", ERROR)[0]["error"], "timeout")
+
+		# the worker was started again and answers the next request
+		self.server.submit({"id": "next", "programs": [program, c]}, self.reply)
+		self.server.join()
+		self.assertEqual(self.of("next", RESULT)[0]["models"], 1)
+
+	def test_invalid_lines(self):
+		lines = ["[1, 2]",
+				 "{not json",
+				 json.dumps({"id": "timeout", "programs": [program, c], "timeout": "1"}),
+				 json.dumps({"id": "memory", "programs": [program, c], "memory": -5}),
+				 json.dumps({"id": "good", "programs": [program, c], "timeout": 60})]
+		serve_lines(self.server, lines, self.reply)
+		self.server.join()
+
+		self.assertEqual(len(self.of(None, ERROR)), 2)
+		self.assertEqual(len(self.of("timeout", ERROR)), 1)
+		self.assertEqual(len(self.of("memory", ERROR)), 1)
+		self.assertEqual(self.of("good", RESULT)[0]["models"], 1)
+
+	def test_failing_reply(self):
+		def reply(answer):
+			if answer["type"] == MODEL:
+				raise RuntimeError("connection lost")
+			self.reply(answer)
+
+		self.server.submit({"id": "failing", "programs": [program, c]}, reply)
+		self.server.join()
+		self.assertEqual(len(self.of("failing", ERROR)), 1)
+
+		# the feeding threads are still running
+		for id in range(2):
+			self.server.submit({"id": id, "programs": [program, c]}, self.reply)
+		self.server.join()
+		for id in range(2):
+			self.assertEqual(self.of(id, RESULT)[0]["models"], 1)
+
+	def test_unexpected_error(self):
+		with mock.patch("untimed.solver.Solver.models", side_effect=KeyError("solver")):
+			run({"id": "key", "programs": [program, c]}, self.reply)
+		self.assertEqual(len(self.of("key", ERROR)), 1)
+
+		# the worker loop answers the next request after one that failed outside of run
+		conn, child = multiprocessing.Pipe()
+		worker = threading.Thread(target=work, args=(child,))
+		with mock.patch("untimed.server.run", side_effect=[AttributeError("first"), None]):
+			worker.start()
+			for id in ["first", "second"]:
+				conn.send(({"id": id}, None))
+			answers = [conn.recv() for _ in range(3)]
+			conn.send(None)
+			worker.join()
+
+		self.assertEqual(answers, [{"id": "first", "type": ERROR, "error": "first"}, None, None])
+
+	def test_connections(self):
+		with tempfile.TemporaryDirectory() as tmp:
+			path = os.path.join(tmp, "socket")
+			unix_server = UnixServer(path, LineHandler)
+			unix_server.solve_server = self.server
+			thread = threading.Thread(target=unix_server.serve_forever, daemon=True)
+			thread.start()
+			try:
+				slow = socket.socket(socket.AF_UNIX)
+				slow.connect(path)
+				slow.sendall((json.dumps({"id": "slow", "programs": [hard], "timeout": 5}) + "\n").encode())
+				slow.shutdown(socket.SHUT_WR)
+
+				start = time.monotonic()
+				with socket.socket(socket.AF_UNIX) as fast:
+					fast.connect(path)
+					fast.sendall((json.dumps({"id": "fast", "programs": [program, c]}) + "\n").encode())
+					fast.shutdown(socket.SHUT_WR)
+					answers = [json.loads(line) for line in fast.makefile()]
+
+				# the connection is closed before the request of the other one is answered
+				self.assertLess(time.monotonic() - start, 5)
+				self.assertEqual([answer["type"] for answer in answers if answer["type"] != MODEL], [STATISTICS, RESULT])
+
+				self.assertEqual(json.loads(slow.makefile().readline())["error"], "timeout")
+				slow.close()
+			finally:
+				unix_server.shutdown()
+				unix_server.server_close()
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,104 @@
+import threading
+import unittest
+
+import clingo
+
+from untimed import Solver
+from untimed.propagator.theoryconstraint_data import TimeAtomToSolverLit
+
+program = """
+#const maxtime = 3.
+time(1..maxtime).
+domain_ab(1..2).
+
+{a(V,T)} :- domain_ab(V), time(T).
+{b(V,T)} :- domain_ab(V), time(T).
+"""
+
+c = """&constraint(1,maxtime){+.a(1); +.a(2); +.b(1); +~b(1)}.
+	   &constraint(1,maxtime){+~b(2); -.a(2)}.
+	   &signature{++a(1) ; ++a(2) ; --a(1) ; --a(2) ; ++b(1) ; ++b(2) }."""
+
+c_reg = """:- a(1,T), a(2,T), b(1,T), b(1,T-1), time(T).
+		   :- b(2,T-1), not a(2,T), time(T)."""
+
+
+def solve_regular(programs):
+	prg = clingo.Control(["0"], message_limit=0)
+	for p in programs:
+		prg.add("base", [], p)
+	prg.ground([("base", [])])
+
+	models = []
+	prg.solve(on_model=lambda m: models.append(sorted(map(str, m.symbols(shown=True)))))
+
+	return sorted(models)
+
+
+def parse_models(models):
+	return sorted(sorted(map(str, model)) for model in models)
+
+
+class TestSolver(unittest.TestCase):
+
+	def test_interleaved(self):
+		expected = solve_regular([program, c_reg])
+
+		solvers = [Solver(programs=[program, c], watch_type=watch_type, arguments=["0"])
+				   for watch_type in ["timed", "2watch", "ground"]]
+
+		results = [[] for _ in solvers]
+		generators = [solver.models() for solver in solvers]
+		for models in zip(*generators):
+			for result, model in zip(results, models):
+				result.append(model)
+
+		for generator in generators:
+			generator.close()
+
+		for result in results:
+			self.assertEqual(parse_models(result), expected)
+
+		for solver in solvers:
+			self.assertGreater(solver.counts["Theory constraints"], 0)
+
+	def test_threads(self):
+		expected = solve_regular([program, c_reg])
+
+		solvers = [Solver(programs=[program, c], watch_type=watch_type, arguments=["0"])
+				   for watch_type in ["timed", "2watch"]]
+		results = [None for _ in solvers]
+
+		def solve(index):
+			results[index] = solvers[index].solve()
+
+		threads = [threading.Thread(target=solve, args=(index,)) for index in range(len(solvers))]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		for result in results:
+			self.assertEqual(parse_models(result), expected)
+
+		# every solver only counted its own constraints
+		for solver in solvers:
+			self.assertEqual(solver.counts["Theory constraints"], 2)
+
+	def test_solve_again(self):
+		solver = Solver(programs=[program, c], watch_type="timed", arguments=["0"])
+
+		models = solver.models()
+		next(models)
+		models.close()
+
+		self.assertEqual(parse_models(solver.solve()), solve_regular([program, c_reg]))
+		self.assertIsNot(solver.state[TimeAtomToSolverLit]["id_to_lit"], TimeAtomToSolverLit.id_to_lit)
+
+	def test_unknown_config(self):
+		with self.assertRaises(ValueError):
+			Solver(programs=[program, c], lock_until=3)
+
+
+if __name__ == "__main__":
+	unittest.main()
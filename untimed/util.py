@@ -1,6 +1,8 @@
 import time
+import json
 import functools
-from typing import Dict
+import threading
+from typing import Dict, Tuple, List
 from collections import defaultdict
 
 from typing import Any, Optional, Callable
@@ -9,6 +11,8 @@ import sys
 
 from math import copysign
 
+import numpy as np
+
 
 class TimerError(Exception):
 	pass
@@ -35,6 +39,11 @@ class Timer:
 			raise TimerError("Timer stopped without starting")
 
 		stop = time.perf_counter() - self._time_start
+
+		if Timeline.enabled and getattr(Scope.local, "key", None) is None:
+			# timers inside propagator callbacks are covered by the span of the callback
+			Timeline.add(self.name, None, int(self._time_start * 1e9), int(stop * 1e9))
+
 		self._time_start = None
 
 		Timer.timers[self.name] += stop
@@ -85,6 +94,261 @@ class Count:
 	def add(cls, name, amt=1) -> None:
 		Count.counts[name] += amt
 
+		key = getattr(Scope.local, "key", None)
+		if key is not None:
+			Scope.counts[key][name] += amt
+
+
+class Histogram:
+	"""
+	Log bucketed latency histogram in nanoseconds. Every power of two is split into SUB_BUCKETS buckets,
+	so a percentile is off by at most 1/SUB_BUCKETS of its value. Values below 2 * SUB_BUCKETS get their own bucket.
+	The buckets are allocated once for the whole range of 64 bit values so recording only increments a counter.
+
+	Members:
+	histograms              -- Histogram of every (propagator name, callback) pair
+	"""
+	SUB_BITS = 3
+	SUB_BUCKETS = 1 << SUB_BITS
+
+	histograms: Dict[Tuple[str, str], "Histogram"] = {}
+
+	__slots__ = ["buckets", "count", "max"]
+
+	def __init__(self):
+		self.buckets: List[int] = [0] * (64 * Histogram.SUB_BUCKETS)
+		self.count = 0
+		self.max = 0
+
+	@staticmethod
+	def get(name: str, callback: str) -> "Histogram":
+		key = (name, callback)
+		if key not in Histogram.histograms:
+			Histogram.histograms[key] = Histogram()
+
+		return Histogram.histograms[key]
+
+	@staticmethod
+	def index(ns: int) -> int:
+		shift = ns.bit_length() - Histogram.SUB_BITS - 1
+		if shift <= 0:
+			return ns
+
+		return shift * Histogram.SUB_BUCKETS + (ns >> shift)
+
+	@staticmethod
+	def lower_bound(index: int) -> int:
+		if index < 2 * Histogram.SUB_BUCKETS:
+			return index
+
+		shift = index // Histogram.SUB_BUCKETS - 1
+		return (index - shift * Histogram.SUB_BUCKETS) << shift
+
+	def record(self, ns: int) -> None:
+		self.buckets[Histogram.index(ns)] += 1
+		self.count += 1
+		if ns > self.max:
+			self.max = ns
+
+	def percentile(self, q: float) -> int:
+		"""
+		:param q: percentile between 0 and 100
+		:return: highest value of the bucket that contains the percentile, at most the maximum recorded value
+		"""
+		if self.count == 0:
+			return 0
+
+		target = max(1, int(np.ceil(self.count * q / 100)))
+		seen = 0
+		for index, amount in enumerate(self.buckets):
+			seen += amount
+			if seen >= target:
+				return min(Histogram.lower_bound(index + 1) - 1, self.max)
+
+		return self.max
+
+	def summary(self) -> Dict[str, float]:
+		"""
+		Percentiles and maximum in microseconds
+		"""
+		summary = {f"p{q}": self.percentile(q) / 1000 for q in [50, 90, 99]}
+		summary["max"] = self.max / 1000
+		return summary
+
+	@staticmethod
+	def write(path: str) -> None:
+		"""
+		Write the non empty buckets of all histograms as json, every bucket is a [lower bound ns, amount] pair
+		"""
+		dump = []
+		for (name, callback), histogram in sorted(Histogram.histograms.items()):
+			dump.append({"propagator": name, "callback": callback, "count": histogram.count,
+						 "max_ns": histogram.max, "summary_us": histogram.summary(),
+						 "buckets": [[Histogram.lower_bound(index), amount]
+									 for index, amount in enumerate(histogram.buckets) if amount > 0]})
+
+		with open(path, "w") as dump_file:
+			json.dump(dump, dump_file)
+
+
+class Timeline:
+	"""
+	Begin and end of timers and propagator callbacks for the Chrome trace event format,
+	the file can be opened in chrome://tracing, Perfetto or speedscope.
+	Timers that run outside of callbacks (grounding, register, ...) and init are always kept.
+	Callbacks are sampled: once the budget is reached every second one is dropped and only every
+	stride-th callback after that is recorded, so the kept ones stay spread over the whole solve.
+	Every recorded callback also adds the decision level of its thread as a counter,
+	restarts show up as drops to level 0.
+
+	Members:
+	budget                  -- Maximum amount of sampled callback events
+
+	stride                  -- Only every stride-th callback is recorded
+
+	seen                    -- Amount of callbacks so far
+
+	phases                  -- (name, start ns, duration ns) of the timers outside of callbacks
+
+	events                  -- (name, thread, start ns, duration ns, decision level) of the sampled callbacks
+	"""
+	enabled = False
+
+	budget = 100000
+	stride = 1
+	seen = 0
+
+	phases: List[Tuple[str, int, int]] = []
+	events: List[Tuple[str, int, int, int, Optional[int]]] = []
+
+	@staticmethod
+	def enable(budget: int) -> None:
+		Timeline.enabled = True
+		Timeline.budget = budget
+		Timeline.stride = 1
+		Timeline.seen = 0
+		Timeline.phases = []
+		Timeline.events = []
+
+	@staticmethod
+	def sample() -> bool:
+		"""
+		:return: True if the next callback is recorded
+		"""
+		Timeline.seen += 1
+		return Timeline.seen % Timeline.stride == 0
+
+	@staticmethod
+	def add(name: str, thread_id: Optional[int], start: int, duration: int, level: Optional[int] = None) -> None:
+		if thread_id is None:
+			Timeline.phases.append((name, start, duration))
+			return
+
+		Timeline.events.append((name, thread_id, start, duration, level))
+		if len(Timeline.events) >= Timeline.budget:
+			Timeline.events = Timeline.events[::2]
+			Timeline.stride *= 2
+
+	@staticmethod
+	def write(path: str) -> None:
+		origin = min([start for _, start, _ in Timeline.phases] + [start for _, _, start, _, _ in Timeline.events], default=0)
+
+		# timers are shown in process 0, the callbacks of every solver thread in process 1
+		trace = [{"name": "process_name", "ph": "M", "pid": 0, "tid": 0, "args": {"name": "untimed"}},
+				 {"name": "process_name", "ph": "M", "pid": 1, "tid": 0, "args": {"name": "propagators"}}]
+		for name, start, duration in Timeline.phases:
+			trace.append({"name": name, "ph": "X", "pid": 0, "tid": 0,
+						  "ts": (start - origin) / 1000, "dur": duration / 1000})
+
+		for name, thread_id, start, duration, level in Timeline.events:
+			trace.append({"name": name, "ph": "X", "pid": 1, "tid": thread_id,
+						  "ts": (start - origin) / 1000, "dur": duration / 1000})
+			if level is not None:
+				trace.append({"name": f"decision level {thread_id}", "ph": "C", "pid": 1, "tid": thread_id,
+							  "ts": (start - origin) / 1000, "args": {"level": level}})
+
+		with open(path, "w") as trace_file:
+			json.dump({"traceEvents": trace, "displayTimeUnit": "ms",
+					   "otherData": {"sample stride": Timeline.stride, "callbacks": Timeline.seen}}, trace_file)
+
+
+class Scope:
+	"""
+	Decorator for propagator callbacks. Calls and time of the callback are stored under the name
+	of the propagator and the solver thread, as well as every count added while the callback runs.
+	Callbacks without a thread (init) are stored with thread None.
+	The latency of every call goes into the Histogram of the propagator and callback
+	and sampled calls into the Timeline if it is enabled.
+	The running scope is kept per python thread since clasp calls the propagators from all solver threads.
+	"""
+	counts: Dict[Tuple[str, Optional[int]], Dict[str, float]] = defaultdict(lambda: defaultdict(lambda: 0))
+
+	local = threading.local()
+
+	def __init__(self, callback: str):
+		self.callback = callback
+		self.calls = f"{callback.capitalize()} calls"
+		self.time = f"{callback.capitalize()} time"
+
+	def __call__(self, func) -> Callable:
+
+		@functools.wraps(func)
+		def wrapper_scope(prop, control, *args):
+			# undo gets the thread id, the other callbacks an object that has it
+			thread_id = control if type(control) == int else getattr(control, "thread_id", None)
+			key = (prop.name, thread_id)
+
+			previous = getattr(Scope.local, "key", None)
+			if previous == key:
+				# method of a parent class
+				return func(prop, control, *args)
+
+			Scope.local.key = key
+			start = time.perf_counter_ns()
+			try:
+				return func(prop, control, *args)
+			finally:
+				elapsed = time.perf_counter_ns() - start
+				Histogram.get(key[0], self.callback).record(elapsed)
+
+				counts = Scope.counts[key]
+				counts[self.calls] += 1
+				counts[self.time] += elapsed / 1e9
+				Scope.local.key = previous
+
+				if Timeline.enabled:
+					if thread_id is None:
+						Timeline.add(f"{self.callback} {key[0]}", None, start, elapsed)
+					elif Timeline.sample():
+						assignment = args[0] if type(control) == int else control.assignment
+						Timeline.add(f"{self.callback} {key[0]}", thread_id, start, elapsed, assignment.decision_level)
+
+		return wrapper_scope
+
+
+def stats_tree() -> Dict[str, Any]:
+	"""
+	Statistics of every propagator as nested dictionaries for the clingo statistics.
+	Counts of init are stored directly under the propagator name, the counts of the other callbacks
+	in a list with one entry per solver thread. Latency percentiles in microseconds are over all threads.
+	"""
+	tree: Dict[str, Any] = {}
+	for (name, thread_id), counts in sorted(Scope.counts.items(), key=lambda item: (item[0][0], item[0][1] or -1)):
+		prop = tree.setdefault(name, {"Threads": []})
+		if thread_id is None:
+			prop.update(counts)
+			continue
+
+		threads = prop["Threads"]
+		while len(threads) <= thread_id:
+			threads.append({})
+		threads[thread_id] = dict(counts)
+
+	for (name, callback), histogram in Histogram.histograms.items():
+		tree.setdefault(name, {"Threads": []})[f"{callback.capitalize()} latency"] = histogram.summary()
+
+	return tree
+
 
 def print_stats(step, accu):
 	time_prop = 0
@@ -94,15 +358,23 @@ def print_stats(step, accu):
 			continue
 		else:
 			print(f"{name:19}  :   {time_taken:.3f}")
-			accu[f"{name:24}"] = time_taken
+			accu[name] = time_taken
 
 	print("{name:19}  :   {time_taken:.3f}".format(name="Time for propagation", time_taken=time_prop))
-	accu["{name:24}".format(name="Time for propagation")] = time_taken
+	accu["Time for propagation"] = time_prop
 
 
 	for name, count in sorted(Count.counts.items()):
 		print(f"{name:24}  :   {count}")
-		accu[f"{name:24}"] = count
+		accu[name] = count
+
+	for (name, callback), histogram in sorted(Histogram.histograms.items()):
+		if callback == "init":
+			continue
+		latency = "  ".join(f"{q} {us:.1f}" for q, us in histogram.summary().items())
+		print(f"{callback.capitalize() + ' us ' + name:24}  :   {latency}")
+
+	accu["Propagators"] = stats_tree()
 
 
 
@@ -162,4 +434,10 @@ def toggle_bit(int_type, offset):
 def is_bit_true(int_type, offset):
 	if test_bit(int_type, offset) > 0:
 		return True
-	return False
\ No newline at end of file
+	return False
+
+# returns a boolean array with the first <size> bits of int_type, index i holds bit i
+def bits_to_array(int_type, size):
+	nbytes = (max(size, int_type.bit_length()) + 7) // 8
+	data = np.frombuffer(int_type.to_bytes(nbytes, "little"), dtype=np.uint8)
+	return np.unpackbits(data, bitorder="little")[:size].astype(bool)